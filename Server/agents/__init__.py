@@ -4,5 +4,6 @@ from .drone import Drone
 from .vehicles import Vehicle
 from .car import Car
 from .motorcycle import Motorcycle
+from .qtable import QTable, QTableBatch
 
-__all__ = ['TrafficAgent', 'Police', 'Drone', 'Vehicle', 'Car', 'Motorcycle', 'Police', 'Drone', 'Car', 'Motorcycle']
\ No newline at end of file
+__all__ = ['TrafficAgent', 'Police', 'Drone', 'Vehicle', 'Car', 'Motorcycle', 'Police', 'Drone', 'Car', 'Motorcycle', 'QTable', 'QTableBatch']
\ No newline at end of file
@@ -1,3 +1,5 @@
+import random
+
 class TrafficAgent:
     """Clase base para todos los agentes en la simulacion"""
     def __init__(self, model=None):
@@ -5,7 +7,13 @@ class TrafficAgent:
         self.movements = 0
         self.position = (0, 0)
         self.model = model
+        # RNG de la simulacion; los agentes sin modelo usan el modulo random
+        self.rng = getattr(model, 'rng', random)
         
+    def fingerprint(self):
+        """Valores que se serializan en to_dict; si cambian, el agente cambio."""
+        return (self.position, self.speed, self.movements)
+
     def to_dict(self):
         """Convertir agente a un diccionario para respuestas de API"""
         return {
@@ -6,41 +6,53 @@ class Drone(TrafficAgent):
         super().__init__(*args, **kwargs)
         self.collisions_resolved = 0
         self.congestions_resolved = 0
+        # Region (x0, y0, x1, y1) que cubre este dron; None es toda la cuadricula
+        self.region = None
 
-    def resolve_collisions_and_congestion(self, model):
+    def resolve_collisions_and_congestion(self, model, region=None):
 
 
         """
-        El dron resuelve:
+        El dron resuelve, dentro de `region` y de su propia region:
           - Colisiones (baja velocidad y marca collision=False)
-          - Congestiones (baja velocidad en celdas con >= 3 vehiculos)
+          - Congestiones (baja velocidad en celdas congestionadas)
         """
-        collisions = [v for v in (model.cars + model.motorcycles) if v.collision]
+        if region is None:
+            region = self.region
+        elif self.region is not None:
+            region = (
+                max(region[0], self.region[0]), max(region[1], self.region[1]),
+                min(region[2], self.region[2]), min(region[3], self.region[3])
+            )
+        collisions = model.collided_vehicles(region)
         if collisions:
-            print("Dron interviniendo para resolver colisiones...")
             for vehicle in collisions:
                 vehicle.speed = max(vehicle.speed - 1, 0)
                 vehicle.collision = False
-            print("Colisiones resueltas por el dron.")
+                model.incidents.resolved_collision(vehicle)
+            model.events.emit('collisions_resolved', model.current_step, by='drone', count=len(collisions))
             self.movements += 1
             self.collisions_resolved += 1
 
-        congested_cells = model.detect_congestion()
+        congested_cells = model.detect_congestion(region)
         if congested_cells:
-            print(f"Dron detecta congestiones en: {congested_cells}")
             for cell in congested_cells:
-                vehicles_in_cell = [v for v in (model.cars + model.motorcycles) if v.position == cell]
+                vehicles_in_cell = model.vehicles_at(cell)
                 for v in vehicles_in_cell:
                     v.speed = max(v.speed - 1, 0)
-            print("Dron resolvió las congestiones.")
+            model.events.emit('congestion_resolved', model.current_step, by='drone', cells=congested_cells)
             self.movements += 1
             self.congestions_resolved += 1
 
+    def fingerprint(self):
+        return super().fingerprint() + (self.congestions_resolved, self.collisions_resolved)
+
     def to_dict(self):
         base_dict = super().to_dict()
         base_dict.update({
             "movements": self.movements,
             "congestions_resolved": self.congestions_resolved,
-            "collisions_resolved": self.collisions_resolved
+            "collisions_resolved": self.collisions_resolved,
+            "region": self.region
         })
         return base_dict
@@ -1,8 +1,12 @@
-import random
 from .vehicles import Vehicle
 from core.utils import distance
+from .qtable import QTable
 
 class Motorcycle(Vehicle):
+    # (speed_level 0-3, near_police 0-1, congested 0-1)
+    STATE_SHAPE = (4, 2, 2)
+    ACTIONS = ["accelerate", "maintain", "decelerate"]
+
     def __init__(self, moto_id, model=None):
         super().__init__(moto_id, model)
         self.speed_limit = 7
@@ -10,32 +14,33 @@ class Motorcycle(Vehicle):
         self.alpha = 0.1
         self.gamma = 0.9
         self.epsilon = 0.1
+        # Si es False la tabla Q no se actualiza (p. ej. una politica compartida de solo lectura)
+        self.learning = True
+
+        self.actions = list(self.ACTIONS)
+        self.q_table = QTable(self.STATE_SHAPE, self.actions)
 
-        self.actions = ["accelerate", "maintain", "decelerate"]
-        self.Q = {}
+    @property
+    def Q(self):
+        """Tabla Q en el formato de diccionario {estado: {accion: valor}}."""
+        return self.q_table.to_dict()
     
     def get_state(self):
         if not self.model:
             return (0, 0, 0) 
             
         speed_level = min(self.speed // 2, 3)  
-        near_police = 1 if distance(self.position, self.model.police.position) <= 2 else 0
+        near_police = 1 if distance(self.position, self.model.police_for(self.position).position) <= 2 else 0
         
         num_veh = 0
-        if hasattr(self.model, 'cars') and hasattr(self.model, 'motorcycles'):
-            num_veh = sum(1 for v in (self.model.cars + self.model.motorcycles) if v.position == self.position)
+        if hasattr(self.model, 'count_at'):
+            num_veh = self.model.count_at(self.position)
         
-        congested = 1 if num_veh >= 3 else 0
+        congested = 1 if num_veh >= self.model.congestion_threshold else 0
         return (speed_level, near_police, congested)
     
     def choose_action(self, state):
-        if random.random() < self.epsilon:
-            return random.choice(self.actions)
-        else:
-            q_values = self.Q.get(state, {})
-            if not q_values:
-                return random.choice(self.actions)
-            return max(q_values, key=q_values.get)
+        return self.q_table.choose_action(state, self.epsilon, self.rng)
         
     def compute_reward(self):
         reward = 0
@@ -48,11 +53,9 @@ class Motorcycle(Vehicle):
         return reward
     
     def update_Q(self, state, action, reward, next_state):
-        current_q = self.Q.setdefault(state, {}).get(action, 0.0)
-        next_q_values = self.Q.setdefault(next_state, {})
-        max_next_q = max(next_q_values.values()) if next_q_values else 0.0
-        new_q = current_q + self.alpha * (reward + self.gamma * max_next_q - current_q)
-        self.Q[state][action] = new_q
+        if not self.learning:
+            return
+        self.q_table.update(state, action, reward, next_state, self.alpha, self.gamma)
 
     def obey_instructions(self):
         state = self.get_state()
@@ -1,7 +1,11 @@
-import random
 from .base import TrafficAgent
+from .qtable import QTable
 
 class Police(TrafficAgent):
+    # (collisions 0-5, congestions 0-5)
+    STATE_SHAPE = (6, 6)
+    ACTIONS = ["resolve_myself", "call_drone"]
+
     def __init__(self, model=None):
         super().__init__(model)
         self.tickets_issued = []
@@ -9,19 +13,28 @@ class Police(TrafficAgent):
         self.drone_requests = 0
         self.failed_congestions = 0
         self.speed = 1  # Police moves at a constant speed of 1
+        # Region (x0, y0, x1, y1) que vigila esta unidad; None es toda la cuadricula
+        self.region = None
 
         self.alpha = 0.1
         self.gamma = 0.9
         self.epsilon = 0.2
+        # Si es False la tabla Q no se actualiza (p. ej. una politica compartida de solo lectura)
+        self.learning = True
+
+        self.actions = list(self.ACTIONS)
+        self.q_table = QTable(self.STATE_SHAPE, self.actions)
 
-        self.actions = ["resolve_myself", "call_drone"]
-        self.Q = {}
+    @property
+    def Q(self):
+        """Tabla Q en el formato de diccionario {estado: {accion: valor}}."""
+        return self.q_table.to_dict()
 
     def get_state(self):
-        # Contar colisiones activas
-        collisions_count = sum(1 for v in (self.model.cars + self.model.motorcycles) if v.collision)
-        # Contar celdas congestionadas
-        congested_cells = self.model.detect_congestion()
+        # Contar colisiones activas en la region
+        collisions_count = len(self.model.collided_vehicles(self.region))
+        # Contar celdas congestionadas en la region
+        congested_cells = self.model.detect_congestion(self.region)
         congestion_count = len(congested_cells)
 
         # Limitar el conteo a un tope
@@ -33,13 +46,7 @@ class Police(TrafficAgent):
         return (collisions_count, congestion_count)
     
     def choose_action(self, state):
-        if random.random() < self.epsilon:
-            return random.choice(self.actions)
-        else:
-            q_values = self.Q.get(state, {})
-            if not q_values:
-                return random.choice(self.actions)
-            return max(q_values, key=q_values.get)
+        return self.q_table.choose_action(state, self.epsilon, self.rng)
         
     def compute_reward(self, collisions_before, congestions_before, action):
         """
@@ -58,11 +65,9 @@ class Police(TrafficAgent):
         return reward
     
     def update_Q(self, state, action, reward, next_state):
-        current_q = self.Q.setdefault(state, {}).get(action, 0.0)
-        next_q_values = self.Q.setdefault(next_state, {})
-        max_next_q = max(next_q_values.values()) if next_q_values else 0.0
-        new_q = current_q + self.alpha * (reward + self.gamma * max_next_q - current_q)
-        self.Q[state][action] = new_q
+        if not self.learning:
+            return
+        self.q_table.update(state, action, reward, next_state, self.alpha, self.gamma)
 
     def resolve_collisions_and_congestion_myself(self):
         """
@@ -70,34 +75,35 @@ class Police(TrafficAgent):
           - Elimina colisiones bajando velocidad
           - Disminuye velocidad en celdas congestionadas
         """
-        collisions = [v for v in (self.model.cars + self.model.motorcycles) if v.collision]
+        collisions = self.model.collided_vehicles(self.region)
         if collisions:
-            print("Policía resolviendo colisiones él mismo...")
             for vehicle in collisions:
                 vehicle.speed = max(vehicle.speed - 1, 0)
                 vehicle.collision = False
-            print("Colisiones resueltas por Policía.")
+                self.model.incidents.resolved_collision(vehicle)
+            self.model.events.emit('collisions_resolved', self.model.current_step, by='police', count=len(collisions))
             self.movements += 1
 
-        congested_cells = self.model.detect_congestion()
+        congested_cells = self.model.detect_congestion(self.region)
         if congested_cells:
-            print(f"Policía detecta congestiones en: {congested_cells}")
             for cell in congested_cells:
-                vehicles_in_cell = [v for v in (self.model.cars + self.model.motorcycles) if v.position == cell]
+                vehicles_in_cell = self.model.vehicles_at(cell)
                 for v in vehicles_in_cell:
                     v.speed = max(v.speed - 1, 0)
             self.congestion_resolved += len(congested_cells)
-            print("Policía resolvió congestiones.")
+            self.model.events.emit('congestion_resolved', self.model.current_step, by='police', cells=congested_cells)
             self.movements += 1
 
     def call_drone(self):
         """
-        Llama al dron para que resuelva colisiones y congestiones.
+        Llama a los drones que cubren su region; cada uno resuelve colisiones y congestiones
+        en la parte de la region del policia que le toca.
         """
         self.drone_requests += 1
         self.movements += 1
-        print("Policía solicita asistencia del dron.")
-        self.model.drone.resolve_collisions_and_congestion(self.model)
+        self.model.events.emit('drone_requested', self.model.current_step, position=self.position)
+        for drone in self.model.drones_for(self):
+            drone.resolve_collisions_and_congestion(self.model, self.region)
 
     def issue_ticket(self, vehicle):
         """
@@ -106,11 +112,22 @@ class Police(TrafficAgent):
         if vehicle.speed > vehicle.speed_limit and not vehicle.ticketed:
             original_speed = vehicle.speed
             vehicle.ticketed = True
-            if random.random() < 0.7:
+            if self.rng.random() < 0.7:
                 vehicle.speed = max(vehicle.speed - 2, 2)
-            self.tickets_issued.append((vehicle, original_speed, vehicle.speed))
-            self.movements += 1
-            print(f"Multa emitida a {type(vehicle).__name__} en {vehicle.position}: {original_speed} -> {vehicle.speed}")
+            if self.model is not None:
+                self.model.incidents.ticketed(vehicle)
+            self.register_ticket(vehicle, original_speed, vehicle.speed)
+
+    def register_ticket(self, vehicle, original_speed, new_speed):
+        """Registra una multa ya aplicada al vehiculo."""
+        self.tickets_issued.append((vehicle, original_speed, new_speed))
+        self.movements += 1
+        if self.model is not None:
+            self.model.events.emit(
+                'ticket_issued', self.model.current_step,
+                vehicle=type(vehicle).__name__, id=vehicle.id, position=vehicle.position,
+                original_speed=original_speed, new_speed=new_speed
+            )
 
     def move(self):
         """
@@ -126,23 +143,24 @@ class Police(TrafficAgent):
             for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]
         ]
         
-        # Filter moves to stay within grid bounds
+        # Filter moves to stay within its region (or the grid)
+        if self.region is not None:
+            x0, y0, x1, y1 = self.region
+        else:
+            x0, y0, x1, y1 = 0, 0, self.model.grid_size - 1, self.model.grid_size - 1
         valid_moves = [
             pos for pos in possible_moves
-            if 0 <= pos[0] < self.model.grid_size and 0 <= pos[1] < self.model.grid_size
+            if x0 <= pos[0] <= x1 and y0 <= pos[1] <= y1
         ]
         
         if valid_moves:
             # Prioritize moves towards vehicles if any are nearby
-            vehicles = self.model.cars + self.model.motorcycles
-            vehicle_positions = [v.position for v in vehicles]
-            
             # If there are vehicles in adjacent cells, move towards one of them
-            adjacent_vehicle_positions = [pos for pos in valid_moves if pos in vehicle_positions]
+            adjacent_vehicle_positions = [pos for pos in valid_moves if self.model.count_at(pos)]
             if adjacent_vehicle_positions:
-                self.position = random.choice(adjacent_vehicle_positions)
+                self.position = self.rng.choice(adjacent_vehicle_positions)
             else:
-                self.position = random.choice(valid_moves)
+                self.position = self.rng.choice(valid_moves)
             
             self.movements += 1
 
@@ -173,6 +191,11 @@ class Police(TrafficAgent):
         
         self.update_Q(state, action, reward, next_state)
         
+    def fingerprint(self):
+        return super().fingerprint() + (
+            len(self.tickets_issued), self.congestion_resolved, self.drone_requests, self.failed_congestions
+        )
+
     def to_dict(self):
         """Convertir policia a un diccionario con propiedades adicionales de policia"""
         base_dict = super().to_dict()
@@ -180,6 +203,7 @@ class Police(TrafficAgent):
             "tickets_issued_count": len(self.tickets_issued),
             "congestion_resolved": self.congestion_resolved,
             "drone_requests": self.drone_requests,
-            "failed_congestions": self.failed_congestions
+            "failed_congestions": self.failed_congestions,
+            "region": self.region
         })
         return base_dict
\ No newline at end of file
@@ -0,0 +1,139 @@
+import math
+import random
+import numpy as np
+
+
+class QTable:
+    """Tabla Q densa values[state_index, action_index] con estados y acciones codificados como enteros.
+
+    `seen` marca los pares (estado, accion) que ya se actualizaron y `visited`
+    los estados consultados, para reproducir el comportamiento de la tabla
+    en diccionario: una accion sin actualizar no compite en el argmax y un
+    estado sin valores se explora al azar.
+    """
+
+    def __init__(self, state_shape, actions, values=None, seen=None, visited=None):
+        self.state_shape = tuple(state_shape)
+        self.actions = list(actions)
+        self.action_index = {action: i for i, action in enumerate(self.actions)}
+        self.num_states = math.prod(self.state_shape)
+        shape = (self.num_states, len(self.actions))
+        self.values = values if values is not None else np.zeros(shape)
+        self.seen = seen if seen is not None else np.zeros(shape, dtype=bool)
+        self.visited = visited if visited is not None else np.zeros(self.num_states, dtype=bool)
+        self._strides = [math.prod(self.state_shape[i + 1:]) for i in range(len(self.state_shape))]
+
+    def copy(self):
+        return QTable(self.state_shape, self.actions, self.values.copy(), self.seen.copy(), self.visited.copy())
+
+    def encode(self, state):
+        return sum(value * stride for value, stride in zip(state, self._strides))
+
+    def decode(self, index):
+        return tuple(int(v) for v in np.unravel_index(index, self.state_shape))
+
+    def choose_action(self, state, epsilon, rng=random):
+        if rng.random() < epsilon:
+            return rng.choice(self.actions)
+        s = self.encode(state)
+        candidates = [(q, a) for a, (q, seen) in enumerate(zip(self.values[s].tolist(), self.seen[s].tolist())) if seen]
+        if not candidates:
+            return rng.choice(self.actions)
+        return self.actions[max(candidates, key=lambda c: c[0])[1]]
+
+    def max_value(self, s):
+        seen_values = [q for q, seen in zip(self.values[s].tolist(), self.seen[s].tolist()) if seen]
+        return max(seen_values) if seen_values else 0.0
+
+    def update(self, state, action, reward, next_state, alpha, gamma):
+        s = self.encode(state)
+        a = self.action_index[action]
+        s_next = self.encode(next_state)
+        self.visited[s] = True
+        self.visited[s_next] = True
+        current_q = self.values.item(s, a)
+        self.values[s, a] = current_q + alpha * (reward + gamma * self.max_value(s_next) - current_q)
+        self.seen[s, a] = True
+
+    def to_dict(self):
+        """Exporta al formato original {estado: {accion: valor}}."""
+        return {
+            self.decode(s): {
+                self.actions[a]: float(self.values[s, a])
+                for a in np.flatnonzero(self.seen[s])
+            }
+            for s in np.flatnonzero(self.visited)
+        }
+
+
+class QTableBatch:
+    """Tablas Q de todos los agentes de un tipo en un solo arreglo values[agent, state, action].
+
+    Cada agente conserva un QTable que es una vista sobre su renglon, y las
+    operaciones por lotes reciben estados y acciones ya codificados.
+    """
+
+    def __init__(self, num_agents, state_shape, actions):
+        self.state_shape = tuple(state_shape)
+        self.actions = list(actions)
+        self.num_states = int(np.prod(self.state_shape))
+        self.values = np.zeros((num_agents, self.num_states, len(self.actions)))
+        self.seen = np.zeros(self.values.shape, dtype=bool)
+        self.visited = np.zeros((num_agents, self.num_states), dtype=bool)
+
+    def __len__(self):
+        return len(self.values)
+
+    def table(self, i):
+        return QTable(self.state_shape, self.actions, self.values[i], self.seen[i], self.visited[i])
+
+    @classmethod
+    def from_agents(cls, agents, state_shape, actions):
+        """Copia las tablas de los agentes al lote y las reemplaza por vistas."""
+        batch = cls(len(agents), state_shape, actions)
+        for i, agent in enumerate(agents):
+            batch.values[i] = agent.q_table.values
+            batch.seen[i] = agent.q_table.seen
+            batch.visited[i] = agent.q_table.visited
+            agent.q_table = batch.table(i)
+        return batch
+
+    @classmethod
+    def from_arrays(cls, values, seen, visited, state_shape, actions):
+        """Lote sobre arreglos existentes, sin copiarlos (p. ej. los de solo lectura de una instantanea)."""
+        batch = cls(0, state_shape, actions)
+        batch.values, batch.seen, batch.visited = values, seen, visited
+        return batch
+
+    def copy(self):
+        return QTableBatch.from_arrays(
+            self.values.copy(), self.seen.copy(), self.visited.copy(), self.state_shape, self.actions
+        )
+
+    def encode(self, *components):
+        """Codifica arreglos de componentes de estado a indices (mismo orden que QTable.encode)."""
+        index = np.zeros_like(components[0])
+        for values, size in zip(components, self.state_shape):
+            index = index * size + values
+        return index
+
+    def choose_actions(self, states, epsilon, rng):
+        rows = np.arange(len(states))
+        seen = self.seen[rows, states]
+        greedy = np.argmax(np.where(seen, self.values[rows, states], -np.inf), axis=1)
+        explore = (rng.random(len(states)) < epsilon) | ~seen.any(axis=1)
+        return np.where(explore, rng.integers(0, len(self.actions), len(states)), greedy)
+
+    def update(self, states, actions, rewards, next_states, alpha, gamma):
+        rows = np.arange(len(states))
+        self.visited[rows, states] = True
+        self.visited[rows, next_states] = True
+        next_seen = self.seen[rows, next_states]
+        max_next = np.where(next_seen, self.values[rows, next_states], -np.inf).max(axis=1)
+        max_next = np.where(next_seen.any(axis=1), max_next, 0.0)
+        current_q = self.values[rows, states, actions]
+        self.values[rows, states, actions] = current_q + alpha * (rewards + gamma * max_next - current_q)
+        self.seen[rows, states, actions] = True
+
+    def to_dicts(self):
+        return [self.table(i).to_dict() for i in range(len(self))]
@@ -1,4 +1,3 @@
-import random
 from .base import TrafficAgent
 
 class Vehicle(TrafficAgent):
@@ -9,26 +8,30 @@ class Vehicle(TrafficAgent):
         self.ticketed = False
         self.collision = False
         self.speed_limit = 5
-        self.speed = random.randint(0, self.speed_limit)
+        self.speed = self.rng.randint(0, self.speed_limit)
     
     def accelerate(self):
-        if random.random() < 0.7:
-            self.speed += random.randint(1, 3)
+        if self.rng.random() < 0.7:
+            self.speed += self.rng.randint(1, 3)
         self.speed = min(self.speed, 10)
+        if self.model is not None and self.speed > self.speed_limit:
+            self.model.incidents.overspeed(self)
     
     def decelerate(self):
-        if random.random() < 0.5:
+        if self.rng.random() < 0.5:
             self.speed -= 1
         self.speed = max(self.speed, 0)
+        if self.model is not None and self.speed <= self.speed_limit:
+            self.model.incidents.resolved_overspeed(self)
     
     def move(self):
         if self.speed == 0:
             return {"new_position": self.position}
             
-        primary_direction = random.choice([(-1, 0), (1, 0), (0, -1), (0, 1)])
+        primary_direction = self.rng.choice([(-1, 0), (1, 0), (0, -1), (0, 1)])
         dx, dy = primary_direction
         
-        steps = min(self.speed, random.randint(1, self.speed))
+        steps = min(self.speed, self.rng.randint(1, self.speed))
         dx *= steps
         dy *= steps
         
@@ -38,6 +41,7 @@ class Vehicle(TrafficAgent):
         
         old_position = self.position
         self.position = (new_x, new_y)
+        self.model.update_position(self, old_position, self.position)
         self.check_collision()
         self.movements += 1
         
@@ -48,15 +52,19 @@ class Vehicle(TrafficAgent):
         }
     
     def check_collision(self):
-        all_vehicles = self.model.cars + self.model.motorcycles
-        for vehicle in all_vehicles:
-            if vehicle is not self and vehicle.position == self.position:
+        for vehicle in self.model.vehicles_at(self.position):
+            if vehicle is not self:
                 self.collision = True
                 vehicle.collision = True
+                self.model.incidents.collision(self)
+                self.model.incidents.collision(vehicle)
         
     def obey_instructions(self):
         pass
         
+    def fingerprint(self):
+        return super().fingerprint() + (self.ticketed, self.collision)
+
     def to_dict(self):
         base_dict = super().to_dict()
         base_dict.update({
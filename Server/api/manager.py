@@ -1,21 +1,132 @@
+import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from core.simulation import TrafficSimulation
+from core.sharded import ShardedSimulation
+from core.spatial import CONGESTION_THRESHOLD
+from core.events import EventSink
+from core.snapshot import snapshot, restore
+from core.policy_store import PolicyStore, apply_policy
+from core.metrics import get_registry
+from .registry import SimulationRegistry, SnapshotStore
+from .scheduler import TickScheduler
 
-active_simulations = {}
+# Si se define, las simulaciones con eventos tambien los escriben en <dir>/<simulation_id>.ndjson
+EVENT_LOG_DIR = os.environ.get('TRAFFIC_EVENT_LOG_DIR')
 
-def create_simulation(grid_size=10, num_cars=5, num_motorcycles=3):
-    """Create a new traffic simulation with Q-Learning agents"""
+# Metricas de pasos y peticiones para /metrics; TRAFFIC_METRICS=0 las desactiva sin costo
+metrics = get_registry() if os.environ.get('TRAFFIC_METRICS', '1') != '0' else None
+
+
+def _env_number(name, cast=float):
+    value = os.environ.get(name)
+    return cast(value) if value else None
+
+
+# Desalojo de simulaciones inactivas (todos opcionales):
+#   TRAFFIC_SIM_TTL             segundos sin acceso antes de desalojar
+#   TRAFFIC_MAX_SIMULATIONS     maximo de simulaciones en memoria (LRU)
+#   TRAFFIC_MEMORY_BUDGET_MB    memoria estimada maxima para todas las simulaciones (LRU)
+#   TRAFFIC_SPILL_DIR           si se define, las desalojadas se guardan aqui y se recargan al accederlas
+_memory_budget_mb = _env_number('TRAFFIC_MEMORY_BUDGET_MB')
+
+# Registro seguro para hilos; conserva el nombre historico
+active_simulations = SimulationRegistry(
+    ttl=_env_number('TRAFFIC_SIM_TTL'),
+    max_simulations=_env_number('TRAFFIC_MAX_SIMULATIONS', int),
+    memory_budget=int(_memory_budget_mb * 1024 * 1024) if _memory_budget_mb else None,
+    spill_dir=os.environ.get('TRAFFIC_SPILL_DIR')
+)
+if active_simulations.spill_dir:
+    os.makedirs(active_simulations.spill_dir, exist_ok=True)
+
+
+def configure_eviction(ttl=None, max_simulations=None, memory_budget=None, spill_dir=None):
+    """Cambia la politica de desalojo en tiempo de ejecucion (memory_budget en bytes)."""
+    active_simulations.ttl = ttl
+    active_simulations.max_simulations = max_simulations
+    active_simulations.memory_budget = memory_budget
+    active_simulations.spill_dir = spill_dir
+    if spill_dir:
+        os.makedirs(spill_dir, exist_ok=True)
+    active_simulations.evict(force=True)
+
+
+# Scheduler que avanza las simulaciones suscritas sin esperar peticiones /step
+#   TRAFFIC_TICK_HZ               ticks por segundo (por defecto 30)
+#   TRAFFIC_MAX_STEPS_PER_TICK    pasos maximos por simulacion en cada tick (por defecto 1)
+scheduler = TickScheduler(
+    active_simulations,
+    hz=_env_number('TRAFFIC_TICK_HZ') or 30.0,
+    max_steps_per_tick=_env_number('TRAFFIC_MAX_STEPS_PER_TICK', int) or 1
+)
+
+
+# Pool para los endpoints batch; cada simulacion se procesa con su propio candado
+#   TRAFFIC_BATCH_WORKERS   hilos del pool (por defecto el numero de CPUs)
+MAX_BATCH_SIMULATIONS = 256
+batch_pool = ThreadPoolExecutor(
+    max_workers=_env_number('TRAFFIC_BATCH_WORKERS', int) or os.cpu_count() or 4,
+    thread_name_prefix='batch'
+)
+
+# Instantaneas guardadas con /snapshot (TRAFFIC_MAX_SNAPSHOTS, por defecto 100)
+MAX_FORKS_PER_REQUEST = 64
+snapshot_store = SnapshotStore(max_snapshots=_env_number('TRAFFIC_MAX_SNAPSHOTS', int) or 100)
+
+# Politicas entrenadas compartidas entre simulaciones (TRAFFIC_POLICY_DIR, por defecto ./policies)
+policy_store = PolicyStore(os.environ.get('TRAFFIC_POLICY_DIR', 'policies'))
+
+
+def _event_sink(simulation_id, event_buffer):
+    if not event_buffer:
+        return None
+    log_path = os.path.join(EVENT_LOG_DIR, f"{simulation_id}.ndjson") if EVENT_LOG_DIR else None
+    return EventSink(capacity=event_buffer, path=log_path)
+
+
+def _register(simulation):
+    """Agrega la simulacion al registro con su estado inicial publicado; regresa ese estado."""
+    initial_state = simulation.get_state()
+    entry = active_simulations.add(simulation)
+    entry.snapshot = (simulation.current_step, initial_state)
+    return initial_state
+
+
+def create_simulation(grid_size=10, num_cars=5, num_motorcycles=3, engine='python', seed=None, event_buffer=0,
+                      policy=None, learning=True, shards=1, num_police=1, num_drones=1,
+                      congestion_threshold=CONGESTION_THRESHOLD, placement='uniform'):
+    """Create a new traffic simulation with Q-Learning agents, optionally warm-started from a stored policy.
+
+    With shards > 1 the grid is split into tiles stepped by worker processes (core/sharded.py).
+    """
+    loaded_policy = policy_store.load(policy) if policy is not None else None
+    if shards > 1:
+        return _create_sharded(
+            grid_size, num_cars, num_motorcycles, engine, seed, event_buffer, loaded_policy, learning, shards,
+            num_police, num_drones, congestion_threshold, placement
+        )
     simulation_id = str(uuid.uuid4())
     simulation = TrafficSimulation(
         simulation_id=simulation_id,
         grid_size=grid_size,
         num_cars=num_cars,
-        num_motorcycles=num_motorcycles
+        num_motorcycles=num_motorcycles,
+        engine=engine,
+        seed=seed,
+        events=_event_sink(simulation_id, event_buffer),
+        metrics=metrics,
+        num_police=num_police,
+        num_drones=num_drones,
+        congestion_threshold=congestion_threshold,
+        placement=placement
     )
+    if loaded_policy is not None:
+        apply_policy(simulation, loaded_policy, learning)
+    elif not learning:
+        simulation.set_learning(False)
     print(f"Simulación Q-Learning creada con ID: {simulation_id}")
-    active_simulations[simulation_id] = simulation
-    
-    initial_state = simulation.get_state()
+    initial_state = _register(simulation)
     
     return {
         "simulation_id": simulation_id,
@@ -23,17 +134,133 @@ def create_simulation(grid_size=10, num_cars=5, num_motorcycles=3):
         "initial_state": initial_state
     }
 
+def _create_sharded(grid_size, num_cars, num_motorcycles, engine, seed, event_buffer, policy, learning, shards,
+                    num_police, num_drones, congestion_threshold, placement):
+    if engine != 'numpy':
+        raise ValueError("Una simulacion por mosaicos (shards > 1) usa el motor numpy")
+    simulation_id = str(uuid.uuid4())
+    simulation = ShardedSimulation(
+        simulation_id=simulation_id,
+        grid_size=grid_size,
+        num_cars=num_cars,
+        num_motorcycles=num_motorcycles,
+        shards=shards,
+        seed=seed,
+        events=_event_sink(simulation_id, event_buffer),
+        metrics=metrics,
+        learning=learning,
+        placement=placement,
+        num_police=num_police,
+        num_drones=num_drones,
+        congestion_threshold=congestion_threshold,
+        policy=policy
+    )
+    print(f"Simulación Q-Learning por mosaicos ({shards}) creada con ID: {simulation_id}")
+    return {
+        "simulation_id": simulation_id,
+        "message": "Simulacion iniciada",
+        "initial_state": _register(simulation)
+    }
+
+def _require_local(simulation, operation):
+    """Instantaneas y guardar politicas leen las tablas Q en este proceso; no aplican a simulaciones por mosaicos."""
+    if isinstance(simulation, ShardedSimulation):
+        raise ValueError(f"{operation} no esta disponible para simulaciones por mosaicos")
+
 def get_simulation(simulation_id):
-    """Get an existing simulation by ID"""
-    simulation = active_simulations.get(simulation_id)
-    if not simulation:
-        return None
-    return simulation
+    """Get an existing simulation by ID (without taking its lock)"""
+    return active_simulations.get(simulation_id)
+
+def locked_simulation(simulation_id):
+    """Context manager that yields the simulation with its lock held, or None"""
+    return active_simulations.locked(simulation_id)
+
+def get_simulation_entry(simulation_id):
+    return active_simulations.entry(simulation_id)
+
+def get_state_snapshot(simulation_id):
+    """Full state of a simulation, served from its published snapshot when up to date"""
+    return active_simulations.state_snapshot(simulation_id)
+
+def get_state_json(simulation_id):
+    """(current_step, JSON bytes) of the full state, serialized once per step"""
+    return active_simulations.state_json(simulation_id)
+
+def get_encoded_state(simulation_id, variant, encode):
+    """(current_step, bytes) of encode(simulation), computed once per step"""
+    return active_simulations.encoded_state(simulation_id, variant, encode)
+
+def schedule_simulation(simulation_id, rate=None, stop_on=('game_over',)):
+    """Subscribe a simulation to the background scheduler; False if it does not exist, AlreadyStopped if it already met a stop condition"""
+    return scheduler.subscribe(simulation_id, rate, stop_on)
+
+def unschedule_simulation(simulation_id):
+    return scheduler.unsubscribe(simulation_id)
+
+def map_simulations(func, simulation_ids):
+    """Aplica func(simulation_id) a cada id en paralelo usando el pool; regresa {id: resultado}."""
+    simulation_ids = list(dict.fromkeys(simulation_ids))
+    return dict(zip(simulation_ids, batch_pool.map(func, simulation_ids)))
+
+def snapshot_simulation(simulation_id):
+    """Save a snapshot of the simulation; returns (snapshot_id, snapshot) or None if it does not exist"""
+    with locked_simulation(simulation_id) as simulation:
+        if simulation is None:
+            return None
+        _require_local(simulation, "Guardar instantaneas")
+        snap = snapshot(simulation)
+    return snapshot_store.add(snap), snap
+
+def get_snapshot(snapshot_id):
+    return snapshot_store.get(snapshot_id)
+
+def restore_simulation(snap, event_buffer=0):
+    """Create a new simulation from a snapshot"""
+    simulation_id = str(uuid.uuid4())
+    simulation = restore(snap, simulation_id, _event_sink(simulation_id, event_buffer), metrics)
+    print(f"Simulación restaurada con ID: {simulation_id}")
+    return {
+        "simulation_id": simulation_id,
+        "message": "Simulacion restaurada",
+        "initial_state": _register(simulation)
+    }
+
+def fork_simulation(simulation_id, count=1, event_buffer=0):
+    """Create `count` copies of the simulation at its current step; None if it does not exist"""
+    with locked_simulation(simulation_id) as simulation:
+        if simulation is None:
+            return None
+        _require_local(simulation, "Bifurcar")
+        snap = snapshot(simulation)
+    forks = []
+    for _ in range(count):
+        fork_id = str(uuid.uuid4())
+        _register(restore(snap, fork_id, _event_sink(fork_id, event_buffer), metrics))
+        forks.append(fork_id)
+    print(f"Simulación {simulation_id} bifurcada en {count} copias")
+    return {
+        "simulation_ids": forks,
+        "current_step": snap.current_step,
+        "message": f"Simulacion bifurcada en {count} copias"
+    }
+
+def save_policy(simulation_id, name):
+    """Store the simulation's Q tables as policy `name`; None if the simulation does not exist"""
+    with locked_simulation(simulation_id) as simulation:
+        if simulation is None:
+            return None
+        _require_local(simulation, "Guardar politicas")
+        return policy_store.save(name, simulation)
+
+def list_policies():
+    return [policy_store.describe(name) for name in policy_store.names()]
 
 def delete_simulation(simulation_id):
     """Delete a simulation by ID"""
-    if simulation_id in active_simulations:
-        del active_simulations[simulation_id]
+    scheduler.unsubscribe(simulation_id)
+    simulation = active_simulations.remove(simulation_id)
+    if simulation is not None:
+        simulation.close()
         print(f"Simulación eliminada con ID: {simulation_id}")
         return {"success": True, "message": f"Simulacion {simulation_id} eliminada exitosamente"}
     return {"success": False, "message": "Simulacion no encontrada"}
\ No newline at end of file
@@ -0,0 +1,44 @@
+import time
+from flask import g, request, Response
+from core.metrics import REQUEST_BUCKETS
+from .manager import metrics, active_simulations, scheduler, snapshot_store
+
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def setup_metrics(app):
+    """Latencia por ruta, indicadores del servidor y el endpoint /metrics; no hace nada si las metricas estan desactivadas."""
+    if metrics is None:
+        return
+
+    metrics.histogram('traffic_http_request_seconds', 'Latencia de las peticiones HTTP por ruta', REQUEST_BUCKETS)
+    metrics.gauge('traffic_simulations_active', 'Simulaciones en memoria', lambda: active_simulations.stats()['in_memory'])
+    metrics.gauge('traffic_simulations_spilled', 'Simulaciones desalojadas a disco', lambda: active_simulations.stats()['spilled'])
+    metrics.gauge('traffic_simulations_evicted_total', 'Simulaciones desalojadas desde el arranque',
+                  lambda: active_simulations.stats()['evicted'], kind='counter')
+    metrics.gauge('traffic_scheduler_subscriptions', 'Simulaciones suscritas al scheduler',
+                  lambda: len(scheduler.status()['subscriptions']))
+    metrics.gauge('traffic_scheduler_skipped_ticks_total', 'Ticks saltados por atraso del scheduler',
+                  lambda: scheduler.skipped_ticks, kind='counter')
+    metrics.gauge('traffic_scheduler_lag_seconds', 'Retraso del ultimo tick del scheduler', lambda: scheduler.last_lag)
+    metrics.gauge('traffic_snapshots', 'Instantaneas guardadas en memoria', lambda: len(snapshot_store))
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_latency(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            # La plantilla de la ruta (no la URL) para no crear una serie por simulacion
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            metrics.observe(
+                'traffic_http_request_seconds', time.perf_counter() - started,
+                method=request.method, route=route, status=response.status_code
+            )
+        return response
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        return Response(metrics.render(), mimetype=PROMETHEUS_MIMETYPE)
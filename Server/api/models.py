@@ -1,11 +1,34 @@
 from flask_restx import fields
+from core.sharded import MAX_SHARDS
+from core.spatial import CONGESTION_THRESHOLD
+from core.placement import PLACEMENTS
+from core.simulation import MAX_GRID_SIZE, MAX_CARS, MAX_MOTORCYCLES, MAX_UNITS
+
+MAX_STEPS_PER_REQUEST = 10000
 
 def create_api_models(api):
 
     create_simulation_model = api.model('CreateSimulationRequest', {
-        'grid_size': fields.Integer(required=False, default=10, min=0, max=20),
-        'num_cars': fields.Integer(required=False, default=10, min=0, max=50),
-        'num_motorcycles': fields.Integer(required=False, default=5, min=0, max=30)
+        'grid_size': fields.Integer(required=False, default=10, min=1, max=MAX_GRID_SIZE),
+        'num_cars': fields.Integer(required=False, default=10, min=0, max=MAX_CARS),
+        'num_motorcycles': fields.Integer(required=False, default=5, min=0, max=MAX_MOTORCYCLES),
+        'engine': fields.String(required=False, default='python', enum=['python', 'numpy']),
+        'seed': fields.Integer(required=False, description='Semilla para reproducir la simulacion'),
+        'event_buffer': fields.Integer(required=False, default=0, min=0, max=100000,
+                                       description='Eventos a conservar en memoria; 0 desactiva el registro de eventos'),
+        'policy': fields.String(required=False, description='Politica guardada con la que arrancan los agentes'),
+        'learning': fields.Boolean(required=False, default=True,
+                                   description='Si es false las tablas Q no se actualizan ni se copian'),
+        'shards': fields.Integer(required=False, default=1, min=1, max=MAX_SHARDS,
+                                 description='Procesos entre los que se reparte la cuadricula (requiere engine numpy)'),
+        'num_police': fields.Integer(required=False, default=1, min=1, max=MAX_UNITS,
+                                     description='Policias; cada uno vigila una region de la cuadricula'),
+        'num_drones': fields.Integer(required=False, default=1, min=1, max=MAX_UNITS,
+                                     description='Drones; cada uno cubre una region de la cuadricula'),
+        'congestion_threshold': fields.Integer(required=False, default=CONGESTION_THRESHOLD, min=2,
+                                               description='Vehiculos a partir de los cuales una celda esta congestionada'),
+        'placement': fields.String(required=False, default='uniform', enum=list(PLACEMENTS),
+                                   description='Colocacion inicial de los vehiculos: uniform, hotspots o corridors')
     })
 
     error_model = api.model('ErrorResponse', {
@@ -43,16 +66,87 @@ def create_api_models(api):
         'task_completed': fields.Boolean
     })
 
+    step_request_model = api.model('SimulationStepRequest', {
+        'steps': fields.Integer(required=False, default=1, min=1, max=MAX_STEPS_PER_REQUEST),
+        'stop_on': fields.List(fields.String(enum=['game_over', 'task_completed']), required=False,
+                               description='Detener antes si algun paso cumple la condicion'),
+        'return': fields.String(required=False, default='steps', enum=['steps', 'final'],
+                                description="'steps': resultados de cada paso; 'final': solo el estado final"),
+        'since_step': fields.Integer(required=False, min=0,
+                                     description='Regresar solo los agentes que cambiaron despues de este paso')
+    })
+
+    batch_step_request_model = api.model('BatchStepRequest', {
+        'ids': fields.List(fields.String, required=True, description='IDs de las simulaciones a avanzar'),
+        'steps': fields.Integer(required=False, default=1, min=1, max=MAX_STEPS_PER_REQUEST),
+        'stop_on': fields.List(fields.String(enum=['game_over', 'task_completed']), required=False),
+        'since_step': fields.Integer(required=False, min=0,
+                                     description='Regresar solo los agentes que cambiaron despues de este paso')
+    })
+
+    fork_request_model = api.model('ForkRequest', {
+        'count': fields.Integer(required=False, default=1, min=1, max=64, description='Copias a crear'),
+        'event_buffer': fields.Integer(required=False, default=0, min=0, max=100000)
+    })
+
+    restore_request_model = api.model('RestoreRequest', {
+        'snapshot_id': fields.String(required=True, description='Instantanea guardada con /snapshot'),
+        'event_buffer': fields.Integer(required=False, default=0, min=0, max=100000)
+    })
+
+    snapshot_response = api.model('SnapshotResponse', {
+        'snapshot_id': fields.String,
+        'simulation_id': fields.String,
+        'current_step': fields.Integer,
+        'size_bytes': fields.Integer
+    })
+
+    policy_request_model = api.model('SavePolicyRequest', {
+        'name': fields.String(required=True, description='Nombre de la politica (letras, numeros, _ y -)')
+    })
+
+    schedule_request_model = api.model('ScheduleRequest', {
+        'rate': fields.Float(required=False, description='Pasos por segundo; por defecto la frecuencia del scheduler'),
+        'stop_on': fields.List(fields.String(enum=['game_over', 'task_completed']), required=False,
+                               description='Dar de baja la simulacion al cumplirse la condicion (por defecto game_over)')
+    })
+
     simulation_step_response = api.model('SimulationStepResponse', {
         'message': fields.String(default='Simulation step processed'),
+        'steps_run': fields.Integer,
+        'current_step': fields.Integer,
+        'stopped_by': fields.String,
         'movement_results': fields.Nested(movement_results_model),
-        'updated_positions': fields.Raw()
+        'steps': fields.List(fields.Nested(movement_results_model)),
+        'updated_positions': fields.Raw(),
+        'state': fields.Raw()
+    })
+
+    event_model = api.model('Event', {
+        'seq': fields.Integer,
+        'step': fields.Integer,
+        'kind': fields.String,
+        'data': fields.Raw()
+    })
+
+    events_response = api.model('EventsResponse', {
+        'enabled': fields.Boolean,
+        'last_seq': fields.Integer,
+        'events': fields.List(fields.Nested(event_model))
     })
 
     return {
+        'events_response': events_response,
         'create_simulation_model': create_simulation_model,
         'error_model': error_model,
         'simulation_state_model': simulation_state_model,
         'simulation_step_response': simulation_step_response,
+        'step_request_model': step_request_model,
+        'schedule_request_model': schedule_request_model,
+        'policy_request_model': policy_request_model,
+        'fork_request_model': fork_request_model,
+        'restore_request_model': restore_request_model,
+        'snapshot_response': snapshot_response,
+        'batch_step_request_model': batch_step_request_model,
         'movement_results_model': movement_results_model
     }
\ No newline at end of file
@@ -0,0 +1,292 @@
+import json
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class SimulationEntry:
+    """Una simulacion registrada, con su propio candado y la ultima instantanea de estado publicada."""
+
+    def __init__(self, simulation):
+        self.simulation = simulation
+        self.lock = threading.RLock()
+        # (current_step, estado) inmutable; se reemplaza completo, nunca se modifica
+        self.snapshot = None
+        # Representaciones ya serializadas del estado completo: {variante: (current_step, bytes)}
+        self.encoded = {}
+        self.last_access = time.monotonic()
+        # Streams u otros usuarios de larga duracion; una entrada fijada no se desaloja
+        self.pins = 0
+        self.evicted = False
+        # True una vez que la simulacion se elimino del registro; los streams la dejan de avanzar
+        self.removed = False
+
+    def touch(self):
+        self.last_access = time.monotonic()
+
+
+class SimulationRegistry:
+    """Registro de simulaciones activas seguro para servidores con varios hilos.
+
+    Un candado global protege solo altas y bajas; cada simulacion tiene su
+    propio candado, de modo que pasos sobre simulaciones distintas corren en
+    paralelo y dos pasos sobre la misma se serializan. Las lecturas del estado
+    completo usan instantaneas inmutables y no toman el candado si la
+    simulacion no ha avanzado.
+
+    Desalojo: las simulaciones sin acceso por mas de `ttl` segundos, y las
+    menos usadas recientemente cuando se rebasan `max_simulations` o
+    `memory_budget` (bytes, segun TrafficSimulation.estimated_size), se sacan
+    de memoria. Si hay `spill_dir` se guardan ahi y se recargan en el
+    siguiente acceso; si no, se descartan.
+    """
+
+    def __init__(self, ttl=None, max_simulations=None, memory_budget=None, spill_dir=None, sweep_interval=5.0):
+        self._entries = {}
+        self._spilled = {}
+        self._lock = threading.Lock()
+        self.ttl = ttl
+        self.max_simulations = max_simulations
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+        self.evicted = 0
+
+    def add(self, simulation):
+        entry = SimulationEntry(simulation)
+        with self._lock:
+            self._entries[simulation.simulation_id] = entry
+        self.evict(force=True, keep=simulation.simulation_id)
+        return entry
+
+    def remove(self, simulation_id):
+        """Quita la simulacion y la regresa (o None); espera a que termine cualquier paso en curso."""
+        with self._lock:
+            entry = self._entries.pop(simulation_id, None)
+            spill_path = self._spilled.pop(simulation_id, None)
+        if spill_path is not None:
+            simulation = self._load(spill_path)
+            os.remove(spill_path)
+            return simulation
+        if entry is None:
+            return None
+        with entry.lock:
+            entry.removed = True
+            return entry.simulation
+
+    def entry(self, simulation_id):
+        """Entrada de la simulacion (recargandola del disco si fue desalojada), o None."""
+        entry = self._entries.get(simulation_id)
+        if entry is None and simulation_id in self._spilled:
+            entry = self._reload(simulation_id)
+        if entry is not None:
+            entry.touch()
+        self.evict(keep=simulation_id)
+        return entry
+
+    def get(self, simulation_id):
+        entry = self.entry(simulation_id)
+        return entry.simulation if entry else None
+
+    @contextmanager
+    def locked(self, simulation_id):
+        """Entrega la simulacion con su candado tomado, o None si no existe."""
+        while True:
+            entry = self.entry(simulation_id)
+            if entry is None:
+                yield None
+                return
+            with entry.lock:
+                # Si se desalojo mientras esperabamos el candado, usar la copia recargada
+                if entry.evicted:
+                    continue
+                yield entry.simulation
+                return
+
+    def state_snapshot(self, simulation_id):
+        """Estado completo de la simulacion desde la instantanea publicada, o None si no existe."""
+        entry = self.entry(simulation_id)
+        if entry is None:
+            return None
+        return self._published(entry)[1]
+
+    def _published(self, entry):
+        snapshot = entry.snapshot
+        if snapshot is not None and snapshot[0] == entry.simulation.current_step:
+            return snapshot
+        with entry.lock:
+            simulation = entry.simulation
+            snapshot = entry.snapshot
+            if snapshot is None or snapshot[0] != simulation.current_step:
+                snapshot = (simulation.current_step, simulation.get_state())
+                entry.snapshot = snapshot
+            return snapshot
+
+    def state_json(self, simulation_id):
+        """(current_step, estado completo en JSON) serializado una sola vez por paso, o None si no existe."""
+        entry = self.entry(simulation_id)
+        if entry is None:
+            return None
+        cached = entry.encoded.get('json')
+        if cached is not None and cached[0] == entry.simulation.current_step:
+            return cached
+        step, state = self._published(entry)
+        cached = (step, json.dumps(state).encode())
+        entry.encoded['json'] = cached
+        return cached
+
+    def encoded_state(self, simulation_id, variant, encode):
+        """(current_step, bytes) de encode(simulacion), calculado con el candado una sola vez por paso."""
+        entry = self.entry(simulation_id)
+        if entry is None:
+            return None
+        cached = entry.encoded.get(variant)
+        if cached is not None and cached[0] == entry.simulation.current_step:
+            return cached
+        with entry.lock:
+            simulation = entry.simulation
+            cached = entry.encoded.get(variant)
+            if cached is None or cached[0] != simulation.current_step:
+                cached = (simulation.current_step, encode(simulation))
+                entry.encoded[variant] = cached
+            return cached
+
+    def evict(self, force=False, keep=None):
+        """Aplica TTL y presupuesto; sin `force` corre a lo mas una vez cada `sweep_interval` segundos."""
+        if self.ttl is None and self.max_simulations is None and self.memory_budget is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+
+        candidates = sorted(
+            ((entry.last_access, simulation_id, entry) for simulation_id, entry in list(self._entries.items())
+             if simulation_id != keep and entry.pins == 0),
+            key=lambda c: c[0]
+        )
+        if self.ttl is not None:
+            for last_access, simulation_id, entry in candidates:
+                if now - last_access > self.ttl:
+                    self._evict(simulation_id, entry)
+        candidates = [c for c in candidates if c[1] in self._entries]
+
+        if self.max_simulations is not None:
+            while len(self._entries) > self.max_simulations and candidates:
+                _, simulation_id, entry = candidates.pop(0)
+                self._evict(simulation_id, entry)
+
+        if self.memory_budget is not None:
+            sizes = {simulation_id: entry.simulation.estimated_size() for simulation_id, entry in list(self._entries.items())}
+            total = sum(sizes.values())
+            while total > self.memory_budget and candidates:
+                _, simulation_id, entry = candidates.pop(0)
+                if self._evict(simulation_id, entry):
+                    total -= sizes.get(simulation_id, 0)
+
+    def _evict(self, simulation_id, entry):
+        # No desalojar una simulacion que esta dando un paso en este momento
+        if not entry.lock.acquire(blocking=False):
+            return False
+        try:
+            if self._entries.get(simulation_id) is not entry or entry.pins:
+                return False
+            path = None
+            if self.spill_dir:
+                path = os.path.join(self.spill_dir, f"{simulation_id}.pkl")
+                with open(path, 'wb') as f:
+                    pickle.dump(entry.simulation, f, protocol=pickle.HIGHEST_PROTOCOL)
+            with self._lock:
+                if self._entries.get(simulation_id) is not entry or entry.pins:
+                    if path:
+                        os.remove(path)
+                    return False
+                # La simulacion pasa de memoria a disco sin que deje de existir para otros hilos
+                del self._entries[simulation_id]
+                if path:
+                    self._spilled[simulation_id] = path
+                entry.evicted = True
+            entry.simulation.close()
+            self.evicted += 1
+            return True
+        finally:
+            entry.lock.release()
+
+    def _reload(self, simulation_id):
+        with self._lock:
+            entry = self._entries.get(simulation_id)
+            if entry is not None:
+                return entry
+            path = self._spilled.pop(simulation_id, None)
+            if path is None:
+                return None
+            entry = SimulationEntry(self._load(path))
+            self._entries[simulation_id] = entry
+        os.remove(path)
+        return entry
+
+    @staticmethod
+    def _load(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def __contains__(self, simulation_id):
+        return simulation_id in self._entries or simulation_id in self._spilled
+
+    def __getitem__(self, simulation_id):
+        entry = self.entry(simulation_id)
+        if entry is None:
+            raise KeyError(simulation_id)
+        return entry.simulation
+
+    def __len__(self):
+        return len(self._entries) + len(self._spilled)
+
+    def __iter__(self):
+        return iter(list(self._entries) + list(self._spilled))
+
+    def stats(self):
+        return {
+            'in_memory': len(self._entries),
+            'spilled': len(self._spilled),
+            'evicted': self.evicted
+        }
+
+    def items(self):
+        return [(simulation_id, entry.simulation) for simulation_id, entry in list(self._entries.items())]
+
+
+class SnapshotStore:
+    """Instantaneas guardadas en memoria; al rebasar `max_snapshots` se descartan las menos usadas."""
+
+    def __init__(self, max_snapshots=100):
+        self.max_snapshots = max_snapshots
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, snap):
+        snapshot_id = str(uuid.uuid4())
+        with self._lock:
+            self._snapshots[snapshot_id] = snap
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+        return snapshot_id
+
+    def get(self, snapshot_id):
+        with self._lock:
+            snap = self._snapshots.get(snapshot_id)
+            if snap is not None:
+                self._snapshots.move_to_end(snapshot_id)
+            return snap
+
+    def remove(self, snapshot_id):
+        with self._lock:
+            return self._snapshots.pop(snapshot_id, None)
+
+    def __len__(self):
+        return len(self._snapshots)
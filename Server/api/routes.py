@@ -1,7 +1,131 @@
-from flask import request
+import json
+from flask import request, Response
 from flask_restx import Resource, Namespace
-from .manager import create_simulation, get_simulation, delete_simulation
-from .models import create_api_models
+from .manager import (create_simulation, get_simulation, delete_simulation, locked_simulation,
+                      get_simulation_entry, get_state_snapshot, get_state_json, get_encoded_state,
+                      schedule_simulation,
+                      unschedule_simulation, scheduler, map_simulations, MAX_BATCH_SIMULATIONS,
+                      snapshot_simulation, get_snapshot, restore_simulation, fork_simulation,
+                      MAX_FORKS_PER_REQUEST, save_policy, list_policies)
+from .models import create_api_models, MAX_STEPS_PER_REQUEST
+from core.events import event_to_dict
+from core.simulation import STOP_CONDITIONS
+from core.spatial import CONGESTION_THRESHOLD
+from core.snapshot import Snapshot
+from .streaming import stream_steps
+from .scheduler import AlreadyStopped
+from . import wire
+
+MAX_STREAM_STEPS = 100000
+MAX_STREAM_RATE = 120.0
+
+def updated_positions(simulation, since_step=None):
+    """Posiciones de los agentes, como las regresa el endpoint de step.
+
+    Con `since_step` solo se incluyen los agentes que cambiaron despues de ese
+    paso; police y drone se omiten si no cambiaron.
+    """
+    if since_step is None:
+        return {
+            'cars': [{'id': car.id, 'position': car.position} for car in simulation.cars],
+            'motorcycles': [{'id': motorcycle.id, 'position': motorcycle.position} for motorcycle in simulation.motorcycles],
+            'police': {'position': simulation.police.position},
+            'drone': {'position': simulation.drone.position},
+            'police_units': [{'position': unit.position} for unit in simulation.police_units],
+            'drones': [{'position': unit.position} for unit in simulation.drones]
+        }
+    positions = {
+        'cars': [{'id': car.id, 'position': car.position} for car in simulation.changed_since(simulation.cars, since_step)],
+        'motorcycles': [
+            {'id': motorcycle.id, 'position': motorcycle.position}
+            for motorcycle in simulation.changed_since(simulation.motorcycles, since_step)
+        ],
+        'police_units': [
+            {'index': i, 'position': unit.position} for i, unit in enumerate(simulation.police_units) if unit.version > since_step
+        ],
+        'drones': [
+            {'index': i, 'position': unit.position} for i, unit in enumerate(simulation.drones) if unit.version > since_step
+        ]
+    }
+    if simulation.police.version > since_step:
+        positions['police'] = {'position': simulation.police.position}
+    if simulation.drone.version > since_step:
+        positions['drone'] = {'position': simulation.drone.position}
+    return positions
+
+
+def wants_binary():
+    """Negociacion de contenido: JSON salvo que el cliente prefiera application/octet-stream."""
+    return request.accept_mimetypes.best_match(['application/json', wire.MIMETYPE]) == wire.MIMETYPE
+
+
+def binary_response(payload):
+    return Response(payload, mimetype=wire.MIMETYPE)
+
+
+def state_etag(simulation_id, current_step, since_step, binary, region=None):
+    """ETag de una respuesta de /state: cambia con cada paso y con la representacion pedida."""
+    variant = 'bin' if binary else 'json'
+    if since_step is not None:
+        variant += f"-since-{since_step}"
+    if region is not None:
+        variant += "-region-" + '.'.join(map(str, region))
+    return f"{simulation_id}-{current_step}-{variant}"
+
+
+def cached_response(body, mimetype, etag):
+    response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    # El cliente puede guardar la respuesta pero debe revalidarla (If-None-Match) en cada lectura
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def not_found(simulation_id):
+    return {'success': False, 'message': f"Simulación con ID {simulation_id} no encontrada"}
+
+
+def parse_since_step(value):
+    """Valida since_step (entero >= 0 o None); lanza ValueError si no es valido."""
+    if value is None:
+        return None
+    since_step = int(value)
+    if since_step < 0:
+        raise ValueError("since_step debe ser mayor o igual a 0")
+    return since_step
+
+
+def parse_stop_on(value):
+    """Valida stop_on (lista de condiciones de STOP_CONDITIONS); lanza ValueError si no es valida."""
+    if not isinstance(value, list) or not all(isinstance(c, str) for c in value):
+        raise ValueError(f"stop_on debe ser una lista de condiciones ({', '.join(STOP_CONDITIONS)})")
+    unknown = [c for c in value if c not in STOP_CONDITIONS]
+    if unknown:
+        raise ValueError(f"Condicion de paro desconocida: {', '.join(unknown)}")
+    return value
+
+
+def parse_region(value):
+    """Valida region = 'x0,y0,x1,y1' (limites inclusivos) o None; lanza ValueError si no es valida."""
+    if value is None:
+        return None
+    try:
+        region = tuple(int(part) for part in value.split(','))
+    except ValueError:
+        region = ()
+    if len(region) != 4 or min(region) < 0 or region[0] > region[2] or region[1] > region[3]:
+        raise ValueError("region debe ser x0,y0,x1,y1 con 0 <= x0 <= x1 y 0 <= y0 <= y1")
+    return region
+
+
+def parse_batch_ids(ids):
+    """Valida la lista de IDs de un endpoint batch; lanza ValueError si no es valida."""
+    if not isinstance(ids, list) or not ids or not all(isinstance(i, str) for i in ids):
+        raise ValueError("ids debe ser una lista no vacia de IDs")
+    if len(ids) > MAX_BATCH_SIMULATIONS:
+        raise ValueError(f"A lo mas {MAX_BATCH_SIMULATIONS} simulaciones por peticion")
+    return ids
+
 
 def setup_routes(api):
     simulation_api = Namespace('simulation', description='Simulation operations')
@@ -26,7 +150,17 @@ def setup_routes(api):
                 result = create_simulation(
                     grid_size=data.get('grid_size', 10),
                     num_cars=data.get('num_cars', 10),
-                    num_motorcycles=data.get('num_motorcycles', 5)
+                    num_motorcycles=data.get('num_motorcycles', 5),
+                    engine=data.get('engine', 'python'),
+                    seed=data.get('seed'),
+                    event_buffer=data.get('event_buffer', 0),
+                    policy=data.get('policy'),
+                    learning=data.get('learning', True),
+                    shards=data.get('shards', 1),
+                    num_police=data.get('num_police', 1),
+                    num_drones=data.get('num_drones', 1),
+                    congestion_threshold=data.get('congestion_threshold', CONGESTION_THRESHOLD),
+                    placement=data.get('placement', 'uniform')
                 )
                 return result, 201
             except Exception as e:
@@ -37,6 +171,8 @@ def setup_routes(api):
     # Endpoint para obtener el estado actual de una simulación
     @simulation_api.route('/<string:simulation_id>/state')
     @simulation_api.param('simulation_id')
+    @simulation_api.param('since_step', 'Regresar solo los agentes que cambiaron despues de este paso')
+    @simulation_api.param('region', 'x0,y0,x1,y1: regresar solo los vehiculos y celdas congestionadas de esa region')
 
     class SimulationStateRoute(Resource):
         
@@ -44,13 +180,44 @@ def setup_routes(api):
         @simulation_api.response(404, 'Simulación no encontrada', model=models['error_model'])
         
         def get(self, simulation_id):
-            simulation = get_simulation(simulation_id)
-            
-            if not simulation:
+            try:
+                since_step = parse_since_step(request.args.get('since_step'))
+                region = parse_region(request.args.get('region'))
+            except ValueError as e:
+                return {'success': False, 'message': str(e)}, 400
 
-                return models['error_model'](success=False, message=f"Simulación con ID {simulation_id} no encontrada").dict(), 404
-                
-            return simulation.get_state(), 200
+            binary = wants_binary()
+            entry = get_simulation_entry(simulation_id)
+            if entry is None:
+                return not_found(simulation_id), 404
+
+            # Lectura repetida sin pasos nuevos: 304 sin tocar la simulacion
+            etag = state_etag(simulation_id, entry.simulation.current_step, since_step, binary, region)
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+
+            # Estado completo: serializado una sola vez por paso y servido sin tomar el candado
+            if since_step is None and region is None:
+                if binary:
+                    cached = get_encoded_state(simulation_id, 'bin', wire.pack_state)
+                else:
+                    cached = get_state_json(simulation_id)
+                if cached is None:
+                    return not_found(simulation_id), 404
+                current_step, body = cached
+                return cached_response(body, wire.MIMETYPE if binary else 'application/json',
+                                       state_etag(simulation_id, current_step, since_step, binary))
+
+            with locked_simulation(simulation_id) as simulation:
+                if not simulation:
+                    return not_found(simulation_id), 404
+
+                etag = state_etag(simulation_id, simulation.current_step, since_step, binary, region)
+                if binary:
+                    return cached_response(wire.pack_state(simulation, since_step, region=region), wire.MIMETYPE, etag)
+                return cached_response(json.dumps(simulation.get_state(since_step, region)), 'application/json', etag)
     
 
 
@@ -60,33 +227,391 @@ def setup_routes(api):
 
     class SimulationStep(Resource):
         
+        @simulation_api.expect(models['step_request_model'], validate=False)
         @simulation_api.response(200, 'Success', model=models['simulation_step_response'])
+        @simulation_api.response(400, 'Invalid input', model=models['error_model'])
         @simulation_api.response(404, 'Simulación no encontrada', model=models['error_model'])
         
         def post(self, simulation_id):
-            """Avanzar la simulación por un paso"""
+            """Avanzar la simulación uno o varios pasos"""
+            # El cuerpo es opcional: sin cuerpo se avanza un solo paso
+            data = request.get_json(silent=True) or {}
+            steps = data.get('steps', 1)
+            mode = data.get('return', 'steps')
+            if type(steps) is not int or not 1 <= steps <= MAX_STEPS_PER_REQUEST:
+                return {'success': False, 'message': f"steps debe estar entre 1 y {MAX_STEPS_PER_REQUEST}"}, 400
+            if mode not in ('steps', 'final'):
+                return {'success': False, 'message': "return debe ser 'steps' o 'final'"}, 400
+            try:
+                stop_on = parse_stop_on(data.get('stop_on', ['game_over'] if steps > 1 else []))
+                since_step = parse_since_step(data.get('since_step'))
+            except (TypeError, ValueError) as e:
+                return {'success': False, 'message': str(e)}, 400
+
+            with locked_simulation(simulation_id) as simulation:
+                if not simulation:
+                    return not_found(simulation_id), 404
+
+                try:
+                    results, stopped_by = simulation.advance(steps, stop_on)
+                except ValueError as e:
+                    return {'success': False, 'message': str(e)}, 400
+
+                if wants_binary():
+                    return binary_response(wire.pack_state(simulation, since_step, game_over=results[-1]['game_over']))
+
+                response = {
+                    'message': "Simulation step processed",
+                    'steps_run': len(results),
+                    'stopped_by': stopped_by,
+                    'movement_results': results[-1]
+                }
+                if mode == 'final':
+                    response['state'] = simulation.get_state(since_step)
+                else:
+                    if steps > 1:
+                        response['steps'] = results
+                    response['updated_positions'] = updated_positions(simulation, since_step)
+                response['current_step'] = simulation.current_step
+                return response, 200
+    
+    # Endpoint para avanzar varias simulaciones en una sola petición
+    @simulation_api.route('/batch/step')
+
+    class BatchStep(Resource):
+
+        @simulation_api.expect(models['batch_step_request_model'], validate=False)
+        @simulation_api.response(200, 'Success')
+        @simulation_api.response(400, 'Invalid input', model=models['error_model'])
+
+        def post(self):
+            """Avanzar varias simulaciones en paralelo; las que no existen se listan en not_found"""
+            data = request.get_json(silent=True) or {}
+            steps = data.get('steps', 1)
+            try:
+                ids = parse_batch_ids(data.get('ids'))
+                if type(steps) is not int or not 1 <= steps <= MAX_STEPS_PER_REQUEST:
+                    raise ValueError(f"steps debe estar entre 1 y {MAX_STEPS_PER_REQUEST}")
+                stop_on = parse_stop_on(data.get('stop_on', ['game_over'] if steps != 1 else []))
+                since_step = parse_since_step(data.get('since_step'))
+            except (TypeError, ValueError) as e:
+                return {'success': False, 'message': str(e)}, 400
+
+            def step_one(simulation_id):
+                with locked_simulation(simulation_id) as simulation:
+                    if not simulation:
+                        return None
+                    results, stopped_by = simulation.advance(steps, stop_on)
+                    return {
+                        'steps_run': len(results),
+                        'stopped_by': stopped_by,
+                        'movement_results': results[-1],
+                        'updated_positions': updated_positions(simulation, since_step),
+                        'current_step': simulation.current_step
+                    }
+
+            outcome = map_simulations(step_one, ids)
+            return {
+                'results': {simulation_id: result for simulation_id, result in outcome.items() if result is not None},
+                'not_found': [simulation_id for simulation_id, result in outcome.items() if result is None]
+            }, 200
+
+    # Endpoint para leer el estado de varias simulaciones en una sola petición
+    @simulation_api.route('/batch/state')
+    @simulation_api.param('ids', 'IDs de las simulaciones separados por coma')
+    @simulation_api.param('since_step', 'Regresar solo los agentes que cambiaron despues de este paso')
+
+    class BatchState(Resource):
+
+        @simulation_api.response(200, 'Success')
+        @simulation_api.response(400, 'Invalid input', model=models['error_model'])
+
+        def get(self):
+            """Estado de varias simulaciones; las que no existen se listan en not_found"""
+            try:
+                ids = parse_batch_ids([i for i in request.args.get('ids', '').split(',') if i])
+                since_step = parse_since_step(request.args.get('since_step'))
+            except ValueError as e:
+                return {'success': False, 'message': str(e)}, 400
+
+            def state_one(simulation_id):
+                if since_step is None:
+                    return get_state_snapshot(simulation_id)
+                with locked_simulation(simulation_id) as simulation:
+                    return simulation.get_state(since_step) if simulation else None
+
+            outcome = map_simulations(state_one, ids)
+            return {
+                'states': {simulation_id: state for simulation_id, state in outcome.items() if state is not None},
+                'not_found': [simulation_id for simulation_id, state in outcome.items() if state is None]
+            }, 200
+
+    # Endpoint que empuja los pasos de la simulación como Server-Sent Events
+    @simulation_api.route('/<string:simulation_id>/stream')
+    @simulation_api.param('simulation_id', 'The simulation identifier')
+    @simulation_api.param('rate', 'Pasos por segundo (por defecto 10)')
+    @simulation_api.param('steps', 'Pasos maximos a transmitir (por defecto 1000)')
+    @simulation_api.param('stop_on', 'Condiciones de paro separadas por coma (game_over, task_completed)')
+
+    class SimulationStream(Resource):
+
+        @simulation_api.response(200, 'Flujo text/event-stream con un evento "step" por paso')
+        @simulation_api.response(400, 'Invalid input', model=models['error_model'])
+        @simulation_api.response(404, 'Simulación no encontrada', model=models['error_model'])
+
+        def get(self, simulation_id):
+            """Transmitir pasos de la simulación; los cuadros intermedios se descartan si el cliente se atrasa"""
+            entry = get_simulation_entry(simulation_id)
+
+            if not entry:
+                return not_found(simulation_id), 404
+
+            rate = request.args.get('rate', 10.0, type=float)
+            steps = request.args.get('steps', 1000, type=int)
+            stop_on = [c for c in request.args.get('stop_on', 'game_over').split(',') if c]
+            if not 0 < rate <= MAX_STREAM_RATE:
+                return {'success': False, 'message': f"rate debe estar entre 0 y {MAX_STREAM_RATE}"}, 400
+            if not 1 <= steps <= MAX_STREAM_STEPS:
+                return {'success': False, 'message': f"steps debe estar entre 1 y {MAX_STREAM_STEPS}"}, 400
+            unknown = [c for c in stop_on if c not in STOP_CONDITIONS]
+            if unknown:
+                return {'success': False, 'message': f"Condicion de paro desconocida: {', '.join(unknown)}"}, 400
+
+            # Mientras el productor corra la simulacion no se desaloja; se fija al leer el primer cuadro
+            def pin():
+                with entry.lock:
+                    entry.pins += 1
+
+            def unpin():
+                with entry.lock:
+                    entry.pins -= 1
+
+            def active():
+                # Eliminada (DELETE) o desalojada antes de que arrancara el stream: dejar de avanzarla
+                return not (entry.removed or entry.evicted)
+
+            return Response(
+                stream_steps(entry.simulation, updated_positions, rate=rate, max_steps=steps, stop_on=stop_on,
+                             lock=entry.lock, active=active, on_open=pin, on_close=unpin),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+
+    # Endpoint para que el servidor avance la simulación por su cuenta
+    @simulation_api.route('/<string:simulation_id>/schedule')
+    @simulation_api.param('simulation_id', 'The simulation identifier')
+
+    class SimulationSchedule(Resource):
+
+        @simulation_api.expect(models['schedule_request_model'], validate=False)
+        @simulation_api.response(200, 'Success')
+        @simulation_api.response(400, 'Invalid input', model=models['error_model'])
+        @simulation_api.response(404, 'Simulación no encontrada', model=models['error_model'])
+        @simulation_api.response(409, 'La simulación ya cumple una condición de paro', model=models['error_model'])
+
+        def post(self, simulation_id):
+            """Suscribir la simulación al scheduler; el cliente solo lee /state"""
+            data = request.get_json(silent=True) or {}
+            rate = data.get('rate')
+            if rate is not None and not isinstance(rate, (int, float)):
+                return {'success': False, 'message': "rate debe ser numerico"}, 400
+            try:
+                stop_on = parse_stop_on(data.get('stop_on', ['game_over']))
+                subscribed = schedule_simulation(simulation_id, rate, stop_on)
+            except AlreadyStopped as e:
+                return {'success': False, 'message': str(e)}, 409
+            except ValueError as e:
+                return {'success': False, 'message': str(e)}, 400
+            if not subscribed:
+                return not_found(simulation_id), 404
+            return {'success': True, 'message': f"Simulacion {simulation_id} suscrita al scheduler"}, 200
+
+        @simulation_api.response(200, 'Success')
+        @simulation_api.response(404, 'La simulación no está suscrita', model=models['error_model'])
+
+        def delete(self, simulation_id):
+            """Dar de baja la simulación del scheduler"""
+            if not unschedule_simulation(simulation_id):
+                return {'success': False, 'message': f"Simulación con ID {simulation_id} no está suscrita"}, 404
+            return {'success': True, 'message': f"Simulacion {simulation_id} dada de baja del scheduler"}, 200
+
+    # Endpoint con el estado del scheduler: frecuencia, retraso y simulaciones suscritas
+    @simulation_api.route('/scheduler')
+
+    class SchedulerStatus(Resource):
+
+        @simulation_api.response(200, 'Success')
+
+        def get(self):
+            return scheduler.status(), 200
+
+    # Endpoint para guardar una instantánea de la simulación
+    @simulation_api.route('/<string:simulation_id>/snapshot')
+    @simulation_api.param('simulation_id', 'The simulation identifier')
+
+    class SimulationSnapshot(Resource):
+
+        @simulation_api.response(201, 'Instantánea guardada', model=models['snapshot_response'])
+        @simulation_api.response(400, 'La simulación no admite instantáneas', model=models['error_model'])
+        @simulation_api.response(404, 'Simulación no encontrada', model=models['error_model'])
+
+        def post(self, simulation_id):
+            """Guardar el estado actual; con Accept: application/octet-stream también se descarga"""
+            try:
+                saved = snapshot_simulation(simulation_id)
+            except ValueError as e:
+                return {'success': False, 'message': str(e)}, 400
+            if saved is None:
+                return not_found(simulation_id), 404
+            snapshot_id, snap = saved
+            if wants_binary():
+                return Response(snap.to_bytes(), status=201, mimetype=wire.MIMETYPE,
+                                headers={'X-Snapshot-Id': snapshot_id})
+            return {
+                'snapshot_id': snapshot_id,
+                'simulation_id': simulation_id,
+                'current_step': snap.current_step,
+                'size_bytes': snap.nbytes
+            }, 201
+
+    # Endpoint para descargar una instantánea guardada
+    @simulation_api.route('/snapshots/<string:snapshot_id>')
+    @simulation_api.param('snapshot_id', 'The snapshot identifier')
+
+    class SnapshotDownload(Resource):
+
+        @simulation_api.response(200, 'Instantánea como archivo .npz (application/octet-stream)')
+        @simulation_api.response(404, 'Instantánea no encontrada', model=models['error_model'])
+
+        def get(self, snapshot_id):
+            snap = get_snapshot(snapshot_id)
+            if snap is None:
+                return {'success': False, 'message': f"Instantánea con ID {snapshot_id} no encontrada"}, 404
+            return binary_response(snap.to_bytes())
+
+    # Endpoint para crear una simulación a partir de una instantánea
+    @simulation_api.route('/restore')
+
+    class RestoreSimulation(Resource):
+
+        @simulation_api.expect(models['restore_request_model'], validate=False)
+        @simulation_api.response(201, 'Simulación restaurada')
+        @simulation_api.response(400, 'Invalid input', model=models['error_model'])
+        @simulation_api.response(404, 'Instantánea no encontrada', model=models['error_model'])
+
+        def post(self):
+            """Restaurar desde snapshot_id, o desde un archivo de instantánea enviado como application/octet-stream"""
+            if request.mimetype == wire.MIMETYPE:
+                event_buffer = request.args.get('event_buffer', 0, type=int)
+                try:
+                    snap = Snapshot.from_bytes(request.get_data())
+                except ValueError as e:
+                    return {'success': False, 'message': str(e)}, 400
+            else:
+                data = request.get_json(silent=True) or {}
+                event_buffer = data.get('event_buffer', 0)
+                snapshot_id = data.get('snapshot_id')
+                snap = get_snapshot(snapshot_id) if isinstance(snapshot_id, str) else None
+                if snap is None:
+                    return {'success': False, 'message': f"Instantánea con ID {snapshot_id} no encontrada"}, 404
+            if type(event_buffer) is not int or event_buffer < 0:
+                return {'success': False, 'message': "event_buffer debe ser un entero >= 0"}, 400
+            try:
+                return restore_simulation(snap, event_buffer), 201
+            except (KeyError, TypeError, ValueError) as e:
+                return {'success': False, 'message': f"Instantanea no valida: {e}"}, 400
+
+    # Endpoint para bifurcar una simulación en varias copias
+    @simulation_api.route('/<string:simulation_id>/fork')
+    @simulation_api.param('simulation_id', 'The simulation identifier')
+
+    class ForkSimulation(Resource):
+
+        @simulation_api.expect(models['fork_request_model'], validate=False)
+        @simulation_api.response(201, 'Copias creadas')
+        @simulation_api.response(400, 'Invalid input', model=models['error_model'])
+        @simulation_api.response(404, 'Simulación no encontrada', model=models['error_model'])
+
+        def post(self, simulation_id):
+            """Crear copias independientes de la simulación en su paso actual"""
+            data = request.get_json(silent=True) or {}
+            count = data.get('count', 1)
+            event_buffer = data.get('event_buffer', 0)
+            if type(count) is not int or not 1 <= count <= MAX_FORKS_PER_REQUEST:
+                return {'success': False, 'message': f"count debe estar entre 1 y {MAX_FORKS_PER_REQUEST}"}, 400
+            if type(event_buffer) is not int or event_buffer < 0:
+                return {'success': False, 'message': "event_buffer debe ser un entero >= 0"}, 400
+            try:
+                result = fork_simulation(simulation_id, count, event_buffer)
+            except ValueError as e:
+                return {'success': False, 'message': str(e)}, 400
+            if result is None:
+                return not_found(simulation_id), 404
+            return result, 201
+
+    # Endpoint para guardar las tablas Q de la simulación como política reutilizable
+    @simulation_api.route('/<string:simulation_id>/policy')
+    @simulation_api.param('simulation_id', 'The simulation identifier')
+
+    class SimulationPolicy(Resource):
+
+        @simulation_api.expect(models['policy_request_model'], validate=False)
+        @simulation_api.response(201, 'Política guardada')
+        @simulation_api.response(400, 'Invalid input', model=models['error_model'])
+        @simulation_api.response(404, 'Simulación no encontrada', model=models['error_model'])
+
+        def post(self, simulation_id):
+            """Guardar lo aprendido por la simulación; las nuevas simulaciones pueden arrancar con ello"""
+            data = request.get_json(silent=True) or {}
+            name = data.get('name')
+            if not isinstance(name, str):
+                return {'success': False, 'message': "name es obligatorio"}, 400
+            try:
+                meta = save_policy(simulation_id, name)
+            except ValueError as e:
+                return {'success': False, 'message': str(e)}, 400
+            if meta is None:
+                return not_found(simulation_id), 404
+            return meta, 201
+
+    # Endpoint para listar las políticas guardadas
+    @simulation_api.route('/policies')
+
+    class PolicyList(Resource):
+
+        @simulation_api.response(200, 'Success')
+
+        def get(self):
+            return {'policies': list_policies()}, 200
+
+    # Endpoint para consultar los eventos registrados de una simulación
+    @simulation_api.route('/<string:simulation_id>/events')
+    @simulation_api.param('simulation_id', 'The simulation identifier')
+    @simulation_api.param('since', 'Regresar solo eventos con seq mayor a este valor')
+    @simulation_api.param('limit', 'Numero maximo de eventos')
+
+    class SimulationEvents(Resource):
+
+        @simulation_api.response(200, 'Success', model=models['events_response'])
+        @simulation_api.response(404, 'Simulación no encontrada', model=models['error_model'])
+
+        def get(self, simulation_id):
             simulation = get_simulation(simulation_id)
-            
+
             if not simulation:
                 return {
-                    'success': False, 
+                    'success': False,
                     'message': f"Simulación con ID {simulation_id} no encontrada"
                 }, 404
-            result = simulation.step()
-            
-            updated_positions = {
-                'cars': [{'id': car.id, 'position': car.position} for car in simulation.cars],
-                'motorcycles': [{'id': motorcycle.id, 'position': motorcycle.position} for motorcycle in simulation.motorcycles],
-                'police': {'position': simulation.police.position},
-                'drone': {'position': simulation.drone.position}
-            }
-            
+
+            since = request.args.get('since', 0, type=int)
+            limit = request.args.get('limit', None, type=int)
             return {
-                'message': "Simulation step processed",
-                'movement_results': result,
-                'updated_positions': updated_positions
+                'enabled': simulation.events.enabled,
+                'last_seq': simulation.events.last_seq,
+                'events': [event_to_dict(event) for event in simulation.events.events(since, limit)]
             }, 200
-    
+
     # Endpoint para eliminar una simulación
     @simulation_api.route('/<string:simulation_id>')
     @simulation_api.param('simulation_id', 'The simulation identifier')
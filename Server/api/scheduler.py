@@ -0,0 +1,176 @@
+import threading
+import time
+from core.simulation import STOP_CONDITIONS
+
+
+class AlreadyStopped(ValueError):
+    """La simulacion ya cumple una de sus condiciones de paro: el scheduler la daria de baja de inmediato."""
+
+
+class Subscription:
+    """Simulacion suscrita al scheduler y su presupuesto de pasos."""
+
+    def __init__(self, entry, rate, stop_on, max_steps_per_tick):
+        self.entry = entry
+        self.rate = rate
+        self.stop_on = tuple(stop_on)
+        self.max_steps_per_tick = max_steps_per_tick
+        # Pasos acumulados pendientes de ejecutar (fraccionarios si rate < hz)
+        self.credit = 0.0
+        self.steps_run = 0
+        self.stopped_by = None
+
+
+class TickScheduler:
+    """Avanza en segundo plano todas las simulaciones suscritas.
+
+    Un solo hilo despierta `hz` veces por segundo y da, en cada tick, los pasos
+    que le tocan a cada simulacion segun su `rate`, con el candado de su
+    entrada tomado. Ninguna simulacion da mas de `max_steps_per_tick` pasos por
+    tick, asi que una sola no puede acaparar el CPU. Si un tick tarda mas de su
+    periodo, los ticks perdidos se saltan (y se cuentan en `skipped_ticks`) en
+    lugar de recuperarse de golpe.
+    """
+
+    def __init__(self, registry, hz=30.0, max_steps_per_tick=1):
+        self.registry = registry
+        self.hz = hz
+        self.max_steps_per_tick = max_steps_per_tick
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.ticks = 0
+        self.skipped_ticks = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.last_tick_duration = 0.0
+
+    def subscribe(self, simulation_id, rate=None, stop_on=('game_over',)):
+        """Suscribe la simulacion a `rate` pasos por segundo (por defecto `hz`); False si no existe."""
+        rate = self.hz if rate is None else rate
+        if not 0 < rate <= self.hz * self.max_steps_per_tick:
+            raise ValueError(f"rate debe estar entre 0 y {self.hz * self.max_steps_per_tick}")
+        unknown = [condition for condition in stop_on if condition not in STOP_CONDITIONS]
+        if unknown:
+            raise ValueError(f"Condicion de paro desconocida: {', '.join(unknown)}")
+        entry = self.registry.entry(simulation_id)
+        if entry is None:
+            return False
+        with entry.lock:
+            condition = entry.simulation.met_condition(stop_on)
+        if condition is not None:
+            raise AlreadyStopped(f"La simulacion {simulation_id} ya cumple la condicion de paro {condition}; no se puede suscribir")
+        with self._lock:
+            previous = self._subscriptions.get(simulation_id)
+            subscription = Subscription(entry, rate, stop_on, self.max_steps_per_tick)
+            self._subscriptions[simulation_id] = subscription
+        if previous is None:
+            # Una simulacion suscrita no se desaloja
+            with entry.lock:
+                entry.pins += 1
+        self._ensure_running()
+        return True
+
+    def unsubscribe(self, simulation_id, subscription=None):
+        """Da de baja la simulacion; con `subscription`, solo si sigue siendo esa suscripcion."""
+        with self._lock:
+            current = self._subscriptions.get(simulation_id)
+            if current is None or (subscription is not None and current is not subscription):
+                return False
+            del self._subscriptions[simulation_id]
+            subscription = current
+        with subscription.entry.lock:
+            subscription.entry.pins -= 1
+        return True
+
+    def is_subscribed(self, simulation_id):
+        return simulation_id in self._subscriptions
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._wake.clear()
+                self._thread = threading.Thread(target=self._run, name='tick-scheduler', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=5):
+        self._wake.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        period = 1.0 / self.hz
+        next_tick = time.monotonic()
+        while not self._wake.is_set():
+            started = time.monotonic()
+            self.last_lag = max(0.0, started - next_tick)
+            self.max_lag = max(self.max_lag, self.last_lag)
+            self.tick()
+            self.last_tick_duration = time.monotonic() - started
+
+            next_tick += period
+            now = time.monotonic()
+            if now > next_tick:
+                # Atrasados: saltar los ticks perdidos en lugar de encadenarlos
+                missed = int((now - next_tick) / period) + 1
+                self.skipped_ticks += missed
+                next_tick += missed * period
+            with self._lock:
+                if not self._subscriptions:
+                    self._thread = None
+                    return
+            self._wake.wait(max(0.0, next_tick - time.monotonic()))
+
+    def tick(self):
+        """Un tick: da los pasos pendientes de cada simulacion suscrita."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.items())
+        finished = []
+        for simulation_id, subscription in subscriptions:
+            subscription.credit = min(subscription.credit + subscription.rate / self.hz,
+                                      subscription.max_steps_per_tick)
+            steps = int(subscription.credit)
+            if steps == 0:
+                continue
+            subscription.credit -= steps
+            try:
+                with subscription.entry.lock:
+                    results, stopped_by = subscription.entry.simulation.advance(steps, subscription.stop_on)
+            except Exception as e:
+                # Una simulacion con error se da de baja sin detener a las demas
+                subscription.stopped_by = f"error: {e}"
+                finished.append((simulation_id, subscription))
+                continue
+            subscription.entry.touch()
+            subscription.steps_run += len(results)
+            if stopped_by is not None:
+                subscription.stopped_by = stopped_by
+                finished.append((simulation_id, subscription))
+        for simulation_id, subscription in finished:
+            self.unsubscribe(simulation_id, subscription)
+        self.ticks += 1
+
+    def status(self):
+        with self._lock:
+            subscriptions = {
+                simulation_id: {
+                    'rate': subscription.rate,
+                    'steps_run': subscription.steps_run,
+                    'current_step': subscription.entry.simulation.current_step
+                }
+                for simulation_id, subscription in self._subscriptions.items()
+            }
+            running = self._thread is not None and self._thread.is_alive()
+        return {
+            'running': running,
+            'hz': self.hz,
+            'max_steps_per_tick': self.max_steps_per_tick,
+            'ticks': self.ticks,
+            'skipped_ticks': self.skipped_ticks,
+            'last_lag_ms': round(self.last_lag * 1000, 3),
+            'max_lag_ms': round(self.max_lag * 1000, 3),
+            'last_tick_ms': round(self.last_tick_duration * 1000, 3),
+            'subscriptions': subscriptions
+        }
@@ -0,0 +1,115 @@
+import json
+import threading
+import time
+from contextlib import nullcontext
+
+
+class LatestFrame:
+    """Buzon de un solo lugar entre el hilo que simula y el cliente del stream.
+
+    El productor siempre sobrescribe el cuadro pendiente; si el cliente no lo
+    alcanzo a leer, ese cuadro se descarta y se cuenta en `dropped`. Asi un
+    consumidor lento nunca frena la simulacion ni acumula memoria.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._frame = None
+        self.dropped = 0
+        self.closed = False
+
+    def publish(self, frame):
+        with self._condition:
+            if self._frame is not None:
+                self.dropped += 1
+            self._frame = frame
+            self._condition.notify()
+
+    def take(self, timeout=None):
+        """Regresa el cuadro mas reciente, o None si el stream se cerro sin cuadros pendientes."""
+        with self._condition:
+            while self._frame is None and not self.closed:
+                if not self._condition.wait(timeout):
+                    return None
+            frame, self._frame = self._frame, None
+            return frame
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+
+def format_sse(frame, event='step'):
+    return f"id: {frame['current_step']}\nevent: {event}\ndata: {json.dumps(frame)}\n\n"
+
+
+def stream_steps(simulation, positions, rate=10.0, max_steps=1000, stop_on=(), lock=None, active=None,
+                 on_open=None, on_close=None):
+    """Generador de Server-Sent Events con un cuadro por paso de la simulacion.
+
+    Un hilo avanza la simulacion a `rate` pasos por segundo y publica cada
+    resultado en un LatestFrame; el generador envia el cuadro mas reciente
+    cada vez que el cliente puede recibirlo. `positions` construye el campo
+    `updated_positions` a partir de la simulacion. Si se pasa `lock`, cada
+    paso y su cuadro se construyen con el candado de la simulacion tomado.
+
+    El productor arranca con la primera lectura del generador: si el cliente
+    se desconecta antes (el servidor cierra un generador que nunca empezo),
+    no se da ningun paso. `on_open` se llama al arrancar el productor y
+    `on_close` una vez cuando termina. Antes de cada paso se consulta
+    `active()`, con el candado tomado; el productor se detiene si regresa False.
+    """
+    mailbox = LatestFrame()
+    guard = lock if lock is not None else nullcontext()
+    interval = 1.0 / rate
+
+    def produce():
+        next_tick = time.monotonic()
+        try:
+            for _ in range(max_steps):
+                if mailbox.closed:
+                    return
+                with guard:
+                    if active is not None and not active():
+                        return
+                    result = simulation.step()
+                    frame = {
+                        'current_step': simulation.current_step,
+                        'movement_results': result,
+                        'updated_positions': positions(simulation),
+                        'dropped': mailbox.dropped
+                    }
+                mailbox.publish(frame)
+                if any(result[condition] for condition in stop_on):
+                    return
+                next_tick += interval
+                delay = next_tick - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # Atrasados: no intentar recuperar los pasos perdidos de golpe
+                    next_tick = time.monotonic()
+        finally:
+            mailbox.close()
+            if on_close is not None:
+                on_close()
+
+    def generate():
+        if on_open is not None:
+            on_open()
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            while True:
+                frame = mailbox.take()
+                if frame is None:
+                    break
+                frame['dropped'] = mailbox.dropped
+                yield format_sse(frame)
+            yield f"event: end\ndata: {json.dumps({'current_step': simulation.current_step, 'dropped': mailbox.dropped})}\n\n"
+        finally:
+            # El cliente se desconecto o el stream termino: detener el productor
+            mailbox.close()
+
+    return generate()
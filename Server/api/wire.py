@@ -0,0 +1,150 @@
+"""Formato binario compacto para el estado de una simulacion.
+
+Se usa cuando el cliente envia `Accept: application/octet-stream` a
+`/state` o `/step`. Todo es little-endian y de ancho fijo:
+
+Encabezado (36 bytes)
+    0   4s   magic b'TSIM'
+    4   u16  version (2)
+    6   u16  flags: bit0 delta (solo agentes que cambiaron), bit1 game_over,
+             bit2 task_completed
+    8   u32  current_step
+    12  u32  grid_size
+    16  u32  police_count
+    20  u32  drone_count
+    24  u32  car_count
+    28  u32  motorcycle_count
+    32  u32  congested_count
+
+La version 2 cambio el significado de `id` en los registros de policias y
+drones (antes siempre 0); un decodificador de la version 1 la rechaza.
+
+Registros de agente (16 bytes), en este orden: police, drone, cars, motorcycles
+    0   i32  id (para police y drone, el indice de la unidad en police_units / drones)
+    4   i32  x
+    8   i32  y
+    12  u16  speed
+    14  u8   flags: bit0 ticketed, bit1 collision
+    15  u8   relleno
+
+Celdas congestionadas (8 bytes cada una)
+    0   i32  x
+    4   i32  y
+"""
+import struct
+import numpy as np
+
+MIMETYPE = 'application/octet-stream'
+MAGIC = b'TSIM'
+VERSION = 2
+
+HEADER = struct.Struct('<4sHHIIIIIII')
+RECORD_DTYPE = np.dtype([
+    ('id', '<i4'), ('x', '<i4'), ('y', '<i4'), ('speed', '<u2'), ('flags', 'u1'), ('pad', 'u1')
+])
+CELL_DTYPE = np.dtype([('x', '<i4'), ('y', '<i4')])
+
+FLAG_DELTA = 1
+FLAG_GAME_OVER = 2
+FLAG_TASK_COMPLETED = 4
+
+AGENT_TICKETED = 1
+AGENT_COLLISION = 2
+
+
+def pack_agents(agents, ids=None):
+    """Registros de los agentes; `ids` reemplaza el id de cada uno (p. ej. el indice de una unidad)."""
+    records = np.zeros(len(agents), dtype=RECORD_DTYPE)
+    if not agents:
+        return records
+    records['id'] = ids if ids is not None else [getattr(agent, 'id', 0) for agent in agents]
+    positions = [agent.position for agent in agents]
+    records['x'] = [position[0] for position in positions]
+    records['y'] = [position[1] for position in positions]
+    records['speed'] = [agent.speed for agent in agents]
+    records['flags'] = [
+        (AGENT_TICKETED if getattr(agent, 'ticketed', False) else 0)
+        | (AGENT_COLLISION if getattr(agent, 'collision', False) else 0)
+        for agent in agents
+    ]
+    return records
+
+
+def pack_units(indexed):
+    """Registros de policias o drones a partir de pares (indice, unidad)."""
+    return pack_agents([unit for _, unit in indexed], [index for index, _ in indexed])
+
+
+def pack_slots(arrays, slots):
+    """Igual que pack_agents pero leyendo directamente los arreglos del motor numpy."""
+    records = np.zeros(len(slots), dtype=RECORD_DTYPE)
+    records['id'] = arrays.ids[slots]
+    records['x'] = arrays.x[slots]
+    records['y'] = arrays.y[slots]
+    records['speed'] = arrays.speed[slots]
+    records['flags'] = arrays.ticketed[slots] * AGENT_TICKETED | arrays.collision[slots] * AGENT_COLLISION
+    return records
+
+
+def pack_vehicles(simulation, cars, motorcycles, since_step, region=None):
+    engine = simulation.engine
+    if engine is None or since_step is not None or region is not None:
+        return pack_agents(cars), pack_agents(motorcycles)
+    is_car = engine.arrays.is_car[:engine.arrays.size]
+    return pack_slots(engine.arrays, np.flatnonzero(is_car)), pack_slots(engine.arrays, np.flatnonzero(~is_car))
+
+
+def pack_state(simulation, since_step=None, game_over=False, region=None):
+    """Serializa posiciones y estado de los agentes; con `since_step` solo los que cambiaron.
+
+    Con `region` = (x0, y0, x1, y1) solo van los vehiculos y celdas congestionadas de esa region.
+    """
+    # (indice, unidad): el indice va en el id del registro para distinguir unidades en un delta
+    police = list(enumerate(simulation.police_units))
+    drones = list(enumerate(simulation.drones))
+    if region is None:
+        cars, motorcycles = simulation.cars, simulation.motorcycles
+    else:
+        cars, motorcycles = simulation.vehicles_in_region(region)
+    flags = 0
+    if since_step is not None:
+        flags |= FLAG_DELTA
+        police = [(index, unit) for index, unit in police if unit.version > since_step]
+        drones = [(index, unit) for index, unit in drones if unit.version > since_step]
+        cars = simulation.changed_since(cars, since_step)
+        motorcycles = simulation.changed_since(motorcycles, since_step)
+    if game_over:
+        flags |= FLAG_GAME_OVER
+    if simulation.task_completed:
+        flags |= FLAG_TASK_COMPLETED
+
+    congested = simulation.detect_congestion(region)
+    cells = np.array([tuple(cell) for cell in congested], dtype=CELL_DTYPE)
+
+    car_records, motorcycle_records = pack_vehicles(simulation, cars, motorcycles, since_step, region)
+    header = HEADER.pack(
+        MAGIC, VERSION, flags, simulation.current_step, simulation.grid_size,
+        len(police), len(drones), len(cars), len(motorcycles), len(congested)
+    )
+    return b''.join([
+        header,
+        pack_units(police).tobytes(),
+        pack_units(drones).tobytes(),
+        car_records.tobytes(),
+        motorcycle_records.tobytes(),
+        cells.tobytes()
+    ])
+
+
+def unpack_state(payload):
+    """Decodifica un paquete de pack_state (util para pruebas y clientes en Python)."""
+    magic, version, flags, step, grid_size, *counts = HEADER.unpack_from(payload)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Paquete de estado no reconocido")
+    offset = HEADER.size
+    sections = {}
+    for name, count in zip(('police', 'drones', 'cars', 'motorcycles'), counts[:4]):
+        sections[name] = np.frombuffer(payload, dtype=RECORD_DTYPE, count=count, offset=offset)
+        offset += count * RECORD_DTYPE.itemsize
+    sections['congested_cells'] = np.frombuffer(payload, dtype=CELL_DTYPE, count=counts[4], offset=offset)
+    return {'flags': flags, 'current_step': step, 'grid_size': grid_size, **sections}
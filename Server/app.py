@@ -5,6 +5,7 @@
 from flask import Flask
 from flask_restx import Api
 from api.routes import setup_routes
+from api.metrics import setup_metrics
 
 def create_app():
     app = Flask(__name__)
@@ -19,6 +20,7 @@ def create_app():
     )
     
     setup_routes(api)
+    setup_metrics(app)
     return app, api
 
 if __name__ == '__main__':
@@ -0,0 +1,125 @@
+# Ejecuta muchas simulaciones sin el servidor Flask, repartidas en un pool de procesos.
+#
+#   python batch.py --episodes 1000 --workers 8 --max-steps 500 --output resultados.csv
+
+import argparse
+import csv
+import json
+import statistics
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from core.simulation import TrafficSimulation, ENGINES
+from core.scenarios import SCENARIOS, get_scenario
+
+RESULT_FIELDS = [
+    'episode', 'seed', 'steps', 'game_over', 'reason', 'task_completed', 'completion_step',
+    'tickets_issued', 'drone_requests', 'congestion_resolved', 'collisions_detected'
+]
+DEFAULT_PARAMS = {'grid_size': 10, 'num_cars': 5, 'num_motorcycles': 3, 'seed': 0}
+SUMMARY_FIELDS = ['steps', 'tickets_issued', 'drone_requests', 'congestion_resolved', 'collisions_detected']
+
+
+def run_episode(episode, seed, params):
+    """Corre una simulacion hasta game_over o max_steps y regresa sus metricas."""
+    simulation = TrafficSimulation(
+        simulation_id=f"batch-{episode}",
+        grid_size=params['grid_size'],
+        num_cars=params['num_cars'],
+        num_motorcycles=params['num_motorcycles'],
+        engine=params['engine'],
+        seed=seed
+    )
+
+    steps = 0
+    completion_step = None
+    collisions_detected = 0
+    result = {'game_over': False, 'reason': None}
+    for step in range(params['max_steps']):
+        result = simulation.step()
+        steps += 1
+        collisions_detected += result['collisions_detected']
+        if result['task_completed'] and completion_step is None:
+            completion_step = step
+        if result['game_over']:
+            break
+
+    return {
+        'episode': episode,
+        'seed': seed,
+        'steps': steps,
+        'game_over': result['game_over'],
+        'reason': result['reason'],
+        'task_completed': simulation.task_completed,
+        'completion_step': completion_step,
+        'tickets_issued': sum(len(unit.tickets_issued) for unit in simulation.police_units),
+        'drone_requests': sum(unit.drone_requests for unit in simulation.police_units),
+        'congestion_resolved': sum(unit.congestion_resolved for unit in simulation.police_units),
+        'collisions_detected': collisions_detected
+    }
+
+
+def run_batch(episodes, params, seed=0, workers=None):
+    """Corre `episodes` simulaciones en paralelo; la semilla del episodio i es seed + i."""
+    seeds = [seed + episode for episode in range(episodes)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_episode, episode, s, params) for episode, s in enumerate(seeds)]
+        return [future.result() for future in futures]
+
+
+def summarize(results):
+    summary = {'episodes': len(results)}
+    if not results:
+        return summary
+    summary['game_over_rate'] = sum(r['game_over'] for r in results) / len(results)
+    completed = [r['completion_step'] for r in results if r['completion_step'] is not None]
+    summary['completion_rate'] = len(completed) / len(results)
+    summary['mean_completion_step'] = statistics.mean(completed) if completed else None
+    for field in SUMMARY_FIELDS:
+        summary[f'mean_{field}'] = statistics.mean(r[field] for r in results)
+    return summary
+
+
+def write_results(path, params, results, summary):
+    if path.endswith('.json'):
+        with open(path, 'w') as f:
+            json.dump({'parameters': params, 'summary': summary, 'episodes': results}, f, indent=2)
+    else:
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Corre episodios de la simulacion de trafico en paralelo')
+    parser.add_argument('--episodes', type=int, default=100)
+    parser.add_argument('--max-steps', type=int, default=500, help='Pasos maximos por episodio')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), help='Escenario fijo; los demas parametros lo sobrescriben')
+    parser.add_argument('--grid-size', type=int)
+    parser.add_argument('--num-cars', type=int)
+    parser.add_argument('--num-motorcycles', type=int)
+    parser.add_argument('--engine', choices=ENGINES, default='python')
+    parser.add_argument('--seed', type=int, help='Semilla base; el episodio i usa seed + i')
+    parser.add_argument('--workers', type=int, default=None, help='Procesos del pool (por defecto, uno por CPU)')
+    parser.add_argument('--output', default='batch_results.csv', help='Archivo .csv (por episodio) o .json (con resumen)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    params = get_scenario(args.scenario) if args.scenario else dict(DEFAULT_PARAMS)
+    for key in ('grid_size', 'num_cars', 'num_motorcycles', 'seed'):
+        if getattr(args, key) is not None:
+            params[key] = getattr(args, key)
+    seed = params.pop('seed')
+    params.update({'engine': args.engine, 'max_steps': args.max_steps})
+    results = run_batch(args.episodes, params, seed=seed, workers=args.workers)
+    summary = summarize(results)
+    write_results(args.output, params, results, summary)
+    json.dump(summary, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
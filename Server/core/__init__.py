@@ -1,5 +1,8 @@
 # traffic_simulation/core/__init__.py
 from .simulation import TrafficSimulation
-from .utils import generate_random_position
+from .spatial import OccupancyIndex
+from .placement import place, PLACEMENTS
+from .scenarios import SCENARIOS, get_scenario, create_scenario_simulation
 
-__all__ = ['TrafficSimulation', 'generate_random_position']
\ No newline at end of file
+__all__ = ['TrafficSimulation', 'OccupancyIndex', 'place', 'PLACEMENTS',
+           'SCENARIOS', 'get_scenario', 'create_scenario_simulation']
\ No newline at end of file
@@ -0,0 +1,116 @@
+import json
+import queue
+import threading
+from collections import deque, namedtuple
+
+Event = namedtuple('Event', ['seq', 'step', 'kind', 'data'])
+
+
+def event_to_dict(event):
+    return {'seq': event.seq, 'step': event.step, 'kind': event.kind, 'data': event.data}
+
+
+class NullEventSink:
+    """Sink por defecto: descarta todo sin formatear nada."""
+    enabled = False
+
+    def emit(self, kind, step, **data):
+        pass
+
+    def events(self, since=0, limit=None):
+        return []
+
+    @property
+    def last_seq(self):
+        return 0
+
+    def close(self):
+        pass
+
+
+class EventSink:
+    """Buffer circular acotado de eventos tipados.
+
+    Los eventos mas viejos se descartan al llenarse el buffer. Si se indica
+    `path`, un hilo de fondo los escribe como NDJSON sin bloquear el paso de
+    simulacion.
+    """
+    enabled = True
+
+    def __init__(self, capacity=1000, path=None):
+        self._buffer = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._seq = 0
+        self.path = path
+        self.writer = NDJSONWriter(path) if path else None
+
+    def __getstate__(self):
+        # El candado y el hilo escritor no se serializan; se recrean al cargar
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['writer'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self.writer = NDJSONWriter(self.path) if self.path else None
+
+    def emit(self, kind, step, **data):
+        with self._lock:
+            self._seq += 1
+            event = Event(self._seq, step, kind, data)
+            self._buffer.append(event)
+        if self.writer is not None:
+            self.writer.put(event)
+
+    def events(self, since=0, limit=None):
+        """Eventos con seq > since que siguen en el buffer, del mas viejo al mas nuevo."""
+        with self._lock:
+            selected = [event for event in self._buffer if event.seq > since]
+        return selected[:limit] if limit is not None else selected
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class NDJSONWriter(threading.Thread):
+    """Hilo que vacia una cola de eventos a un archivo NDJSON.
+
+    La cola es acotada: si el consumidor se atrasa, `put` descarta el evento
+    (y lo cuenta en `dropped`) en lugar de bloquear al productor.
+    """
+
+    def __init__(self, path, max_pending=10000):
+        super().__init__(daemon=True)
+        self.path = path
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._sentinel = object()
+        self.start()
+
+    def put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        with open(self.path, 'a') as f:
+            while True:
+                event = self._queue.get()
+                if event is self._sentinel:
+                    break
+                f.write(json.dumps(event_to_dict(event)) + '\n')
+                if self._queue.empty():
+                    f.flush()
+
+    def close(self, timeout=5):
+        self._queue.put(self._sentinel)
+        self.join(timeout)
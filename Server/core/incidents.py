@@ -0,0 +1,118 @@
+"""Incidentes vivos de una TrafficSimulation: choques, exceso de velocidad y celdas congestionadas.
+
+Los vehiculos registran un incidente en el momento en que lo provocan
+(check_collision, accelerate) y lo retiran cuando lo resuelven (decelerate,
+multas, resoluciones del policia y del dron). Las celdas congestionadas las
+mantiene el indice de ocupacion (OccupancyIndex al mover cada vehiculo, o
+ArrayOccupancyIndex en bloque con el motor numpy).
+Policia, dron y el paso de la simulacion leen estos conjuntos en lugar de
+recorrer toda la flota, asi que su costo es O(incidentes).
+
+Cada lectura vuelve a comprobar la condicion y descarta las entradas que
+ya no aplican: un cambio que no avise nunca produce un incidente falso,
+solo deja una entrada que se limpia en la siguiente lectura.
+"""
+
+
+def _in_region(position, region):
+    x0, y0, x1, y1 = region
+    return x0 <= position[0] <= x1 and y0 <= position[1] <= y1
+
+
+class IncidentIndex:
+    """Conjuntos ordenados (dicts) de vehiculos chocados y de vehiculos con exceso de velocidad.
+
+    `_offenders` es la parte de `_overspeed` aun sin multa: un vehiculo multado
+    puede seguir sobre su limite, pero ya no es trabajo para el policia.
+    """
+
+    def __init__(self, occupancy):
+        self.occupancy = occupancy
+        self._collisions = {}
+        self._overspeed = {}
+        self._offenders = {}
+
+    def collision(self, vehicle):
+        self._collisions[vehicle] = None
+
+    def overspeed(self, vehicle):
+        self._overspeed[vehicle] = None
+        if not vehicle.ticketed:
+            self._offenders[vehicle] = None
+
+    def resolved_collision(self, vehicle):
+        self._collisions.pop(vehicle, None)
+
+    def resolved_overspeed(self, vehicle):
+        self._overspeed.pop(vehicle, None)
+        self._offenders.pop(vehicle, None)
+
+    def ticketed(self, vehicle):
+        self._offenders.pop(vehicle, None)
+        if vehicle.speed <= vehicle.speed_limit:
+            self._overspeed.pop(vehicle, None)
+
+    def _prune(self, entries, active):
+        stale = [entry for entry in entries if not active(entry)]
+        for entry in stale:
+            del entries[entry]
+        return entries
+
+    def _first(self, entries, active):
+        """Primera entrada vigente, descartando las que ya no aplican antes de ella."""
+        stale = []
+        found = None
+        for entry in entries:
+            if active(entry):
+                found = entry
+                break
+            stale.append(entry)
+        for entry in stale:
+            del entries[entry]
+        return found
+
+    def _live_collisions(self):
+        return self._prune(self._collisions, lambda vehicle: vehicle.collision)
+
+    def collisions(self, region=None):
+        """Vehiculos chocados (en region = (x0, y0, x1, y1) si se indica), los mas rapidos primero."""
+        vehicles = [
+            vehicle for vehicle in self._live_collisions() if region is None or _in_region(vehicle.position, region)
+        ]
+        vehicles.sort(key=lambda vehicle: vehicle.speed, reverse=True)
+        return vehicles
+
+    def offenders(self, region=None):
+        """Vehiculos sobre su limite de velocidad y sin multa, los de mayor exceso primero."""
+        live = self._prune(
+            self._offenders, lambda vehicle: vehicle.speed > vehicle.speed_limit and not vehicle.ticketed
+        )
+        vehicles = [vehicle for vehicle in live if region is None or _in_region(vehicle.position, region)]
+        vehicles.sort(key=lambda vehicle: vehicle.speed - vehicle.speed_limit, reverse=True)
+        return vehicles
+
+    def congested_cells(self, region=None):
+        """Celdas congestionadas, las de mas vehiculos primero."""
+        cells = self.occupancy.congested_cells(region)
+        cells.sort(key=self.occupancy.count_at, reverse=True)
+        return cells
+
+    def collision_count(self):
+        return len(self._live_collisions())
+
+    def any_overspeed(self):
+        return self._first(self._overspeed, lambda vehicle: vehicle.speed > vehicle.speed_limit) is not None
+
+    def rebuild(self, vehicles):
+        """Recalcula todos los incidentes (p. ej. despues de escribir los campos de los vehiculos directamente)."""
+        self.clear()
+        for vehicle in vehicles:
+            if vehicle.collision:
+                self.collision(vehicle)
+            if vehicle.speed > vehicle.speed_limit:
+                self.overspeed(vehicle)
+
+    def clear(self):
+        self._collisions.clear()
+        self._overspeed.clear()
+        self._offenders.clear()
@@ -0,0 +1,194 @@
+"""Histogramas en memoria con salida en formato de texto de Prometheus.
+
+La instrumentacion es opcional: una TrafficSimulation sin `metrics` no mide
+nada (cada fase solo compara contra None). Con un MetricsRegistry, cada paso
+registra la duracion de sus fases en `traffic_step_phase_seconds` y la del
+paso completo en `traffic_step_seconds`.
+"""
+import bisect
+import threading
+import time
+
+# Segundos; de microsegundos (grid chico) a segundos (escenarios de decenas de miles de vehiculos)
+STEP_BUCKETS = (1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+REQUEST_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STEP_PHASES = ('accelerate', 'move', 'obey', 'police', 'tickets', 'congestion', 'completion', 'track_changes')
+
+
+class Histogram:
+    """Conteos por cubeta (le = limite superior inclusivo), suma y total."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class StepTimer:
+    """Mide las fases de un paso: cada lap(fase) registra el tiempo desde la marca anterior."""
+
+    __slots__ = ('histograms', 'total', 'start', 'last')
+
+    def __init__(self, histograms, total):
+        self.histograms = histograms
+        self.total = total
+        self.start = self.last = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.histograms[phase].observe(now - self.last)
+        self.last = now
+
+    def add(self, phase, seconds):
+        """Registra una fase medida por separado (p. ej. acumulada vehiculo por vehiculo)."""
+        self.histograms[phase].observe(seconds)
+
+    def mark(self):
+        self.last = time.perf_counter()
+
+    def finish(self):
+        self.total.observe(time.perf_counter() - self.start)
+
+
+class PhaseTotals:
+    """Acumula fases que se intercalan (vehiculo por vehiculo) y al terminar las registra en un StepTimer."""
+
+    __slots__ = ('timer', 'totals', 'last')
+
+    def __init__(self, timer, phases):
+        self.timer = timer
+        self.totals = dict.fromkeys(phases, 0.0)
+        self.last = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.totals[phase] += now - self.last
+        self.last = now
+
+    def finish(self):
+        for phase, seconds in self.totals.items():
+            self.timer.add(phase, seconds)
+        self.timer.mark()
+
+
+class _NoPhaseTotals:
+    """PhaseTotals que no mide nada, para los pasos sin metricas."""
+
+    __slots__ = ()
+
+    def lap(self, phase):
+        pass
+
+    def finish(self):
+        pass
+
+
+NO_PHASE_TOTALS = _NoPhaseTotals()
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(name='default'):
+    """Registro de metricas compartido del proceso con ese nombre."""
+    with _registries_lock:
+        registry = _registries.get(name)
+        if registry is None:
+            registry = _registries[name] = MetricsRegistry(name)
+        return registry
+
+
+class MetricsRegistry:
+
+    def __init__(self, name='default'):
+        self.name = name
+        self._metrics = {}
+        self._series = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+        self.histogram('traffic_step_seconds', 'Duracion de TrafficSimulation.step', STEP_BUCKETS)
+        self.histogram('traffic_step_phase_seconds', 'Duracion de cada fase de TrafficSimulation.step', STEP_BUCKETS)
+        self._step_histograms = {}
+
+    def __reduce__(self):
+        # Una simulacion serializada (p. ej. desalojada a disco) vuelve a usar el registro vivo del proceso
+        return (get_registry, (self.name,))
+
+    def histogram(self, metric, help_text, buckets):
+        self._metrics[metric] = (help_text, tuple(buckets))
+
+    def gauge(self, metric, help_text, callback, kind='gauge'):
+        """Valor leido al momento de exportar; `kind` puede ser 'counter' para totales acumulados."""
+        self._gauges[metric] = (help_text, callback, kind)
+
+    def series(self, metric, **labels):
+        """Histograma de la serie `metric` con esas etiquetas (se crea la primera vez)."""
+        key = (metric, tuple(sorted(labels.items())))
+        histogram = self._series.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._series.get(key)
+                if histogram is None:
+                    histogram = self._series[key] = Histogram(self._metrics[metric][1])
+        return histogram
+
+    def observe(self, metric, value, **labels):
+        self.series(metric, **labels).observe(value)
+
+    def step_timer(self, engine):
+        histograms = self._step_histograms.get(engine)
+        if histograms is None:
+            histograms = {
+                phase: self.series('traffic_step_phase_seconds', engine=engine, phase=phase)
+                for phase in STEP_PHASES
+            }
+            self._step_histograms[engine] = histograms
+        return StepTimer(histograms, self.series('traffic_step_seconds', engine=engine))
+
+    def render(self):
+        """Todas las metricas en formato de texto de Prometheus (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            series = sorted(self._series.items())
+        for metric, (help_text, buckets) in sorted(self._metrics.items()):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} histogram")
+            for (name, labels), histogram in series:
+                if name != metric:
+                    continue
+                counts, total = histogram.snapshot()
+                cumulative = 0
+                for bound, count in zip(buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{metric}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{metric}_sum{format_labels(labels)} {total}")
+                lines.append(f"{metric}_count{format_labels(labels)} {cumulative}")
+        for metric, (help_text, callback, kind) in sorted(self._gauges.items()):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.append(f"{metric} {callback()}")
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels) + '}'
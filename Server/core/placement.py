@@ -0,0 +1,136 @@
+"""Colocacion inicial de agentes en celdas distintas, de una sola vez.
+
+place() sortea las celdas sin reemplazo (Generator.choice con un generador
+derivado del `rng` de la simulacion): no reintenta celdas ocupadas ni
+recorre el area de la cuadricula, asi que colocar n agentes cuesta O(n)
+aunque la cuadricula tenga millones de celdas.
+
+Cada preset marca zonas de la region que reciben una parte de los agentes;
+el resto se reparte al azar entre todas las celdas libres de la region:
+
+- uniform: sin zonas, todas las celdas con la misma probabilidad.
+- hotspots: un cuadro pequeno en cada cuarto de la region reune HOTSPOT_SHARE de los agentes.
+- corridors: calles horizontales y verticales cada CORRIDOR_SPACING celdas reunen CORRIDOR_SHARE.
+
+Una zona es una lista de partes (xs, ys): el producto de dos arreglos de
+coordenadas. Las partes de una zona no se traslapan, y una zona llena
+pasa los agentes que no le caben al reparto del resto.
+"""
+import numpy as np
+
+HOTSPOT_SHARE = 0.7
+CORRIDOR_SPACING = 8
+CORRIDOR_SHARE = 0.8
+
+
+def _edges(lo, hi, parts):
+    """Bordes [lo, hi + 1) partidos en `parts` tramos casi iguales."""
+    return [lo + (hi - lo + 1) * i // parts for i in range(parts + 1)]
+
+
+def _uniform(region, rng):
+    return []
+
+
+def _hotspots(region, rng):
+    x0, y0, x1, y1 = region
+    xs, ys = _edges(x0, x1, 2), _edges(y0, y1, 2)
+    parts = []
+    for bx0, bx1 in zip(xs, xs[1:]):
+        for by0, by1 in zip(ys, ys[1:]):
+            width, height = bx1 - bx0, by1 - by0
+            if not width or not height:
+                continue
+            side_x, side_y = max(1, width // 4), max(1, height // 4)
+            hx = bx0 + rng.randint(0, width - side_x)
+            hy = by0 + rng.randint(0, height - side_y)
+            parts.append((np.arange(hx, hx + side_x), np.arange(hy, hy + side_y)))
+    return [(parts, HOTSPOT_SHARE)]
+
+
+def _corridors(region, rng):
+    x0, y0, x1, y1 = region
+    offset = CORRIDOR_SPACING // 2
+    columns = np.arange(x0 + offset, x1 + 1, CORRIDOR_SPACING)
+    rows = np.arange(y0 + offset, y1 + 1, CORRIDOR_SPACING)
+    if not len(columns) and not len(rows):
+        return []
+    # Las calles verticales completas, y las horizontales sin los cruces para no repetir celdas
+    other_columns = np.setdiff1d(np.arange(x0, x1 + 1), columns)
+    parts = [(columns, np.arange(y0, y1 + 1)), (other_columns, rows)]
+    return [(parts, CORRIDOR_SHARE)]
+
+
+PLACEMENTS = {'uniform': _uniform, 'hotspots': _hotspots, 'corridors': _corridors}
+
+
+def _cells(parts, indices):
+    """Celdas (x, y) de los indices de una zona, numerada parte por parte."""
+    sizes = [len(xs) * len(ys) for xs, ys in parts]
+    offsets = np.cumsum([0] + sizes)
+    part = np.searchsorted(offsets, indices, 'right') - 1
+    x = np.empty(len(indices), dtype=np.int64)
+    y = np.empty(len(indices), dtype=np.int64)
+    for i, (xs, ys) in enumerate(parts):
+        selected = part == i
+        if not selected.any():
+            continue
+        col, row = np.divmod(indices[selected] - offsets[i], len(ys))
+        x[selected] = xs[col]
+        y[selected] = ys[row]
+    return x, y
+
+
+def _sample(parts, count, grid_size, generator, used):
+    """Hasta `count` celdas distintas de la zona fuera de `used` (ids x * grid_size + y), que se agregan a `used`.
+
+    Se sortean count + len(used) celdas y se descartan las usadas: el orden
+    del sorteo es aleatorio, asi que las primeras `count` libres son una
+    muestra uniforme de las celdas libres de la zona.
+    """
+    size = sum(len(xs) * len(ys) for xs, ys in parts)
+    if not count or not size:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    picks = generator.choice(size, min(size, count + len(used)), replace=False)
+    x, y = _cells(parts, picks)
+    if used:
+        free = ~np.isin(x * grid_size + y, np.fromiter(used, dtype=np.int64, count=len(used)))
+        x, y = x[free], y[free]
+    x, y = x[:count], y[:count]
+    used.update((x * grid_size + y).tolist())
+    return x, y
+
+
+def place(count, grid_size, rng, region=None, preset='uniform', exclude=()):
+    """Coordenadas (x, y), como arreglos, de `count` celdas distintas de la region que no esten en `exclude`.
+
+    ValueError si el preset no existe o si la region no tiene `count` celdas libres.
+    """
+    if preset not in PLACEMENTS:
+        raise ValueError(f"Colocacion desconocida: {preset}. Opciones: {', '.join(PLACEMENTS)}")
+    region = tuple(region) if region is not None else (0, 0, grid_size - 1, grid_size - 1)
+    x0, y0, x1, y1 = region
+    used = {x * grid_size + y for x, y in exclude if x0 <= x <= x1 and y0 <= y <= y1}
+    free = (x1 - x0 + 1) * (y1 - y0 + 1) - len(used)
+    if count > free:
+        raise ValueError(f"No caben {count} agentes en las {max(free, 0)} celdas libres de la region {list(region)}")
+
+    generator = np.random.default_rng(rng.getrandbits(64))
+    xs, ys = [], []
+    placed = 0
+    zones = PLACEMENTS[preset](region, rng)
+    for parts, share in zones:
+        x, y = _sample(parts, int(count * share), grid_size, generator, used)
+        xs.append(x)
+        ys.append(y)
+        placed += len(x)
+    whole = [(np.arange(x0, x1 + 1), np.arange(y0, y1 + 1))]
+    x, y = _sample(whole, count - placed, grid_size, generator, used)
+    xs.append(x)
+    ys.append(y)
+    x, y = np.concatenate(xs), np.concatenate(ys)
+    if zones:
+        # Mezclar para que el tipo o el id de un agente no dependan de la zona que le toco
+        order = generator.permutation(count)
+        x, y = x[order], y[order]
+    return x, y
@@ -0,0 +1,157 @@
+"""Politicas entrenadas (tablas Q por tipo de agente) guardadas en disco.
+
+Cada politica es un directorio <store>/<nombre>/ con un archivo .npy por
+tipo de agente y campo de la tabla (values, seen, visited) y un policy.json
+con su forma. Las tablas se cargan con mmap_mode='r': todos los procesos
+que usan la misma politica comparten las paginas del archivo y una
+simulacion nueva no copia nada mientras no aprenda.
+
+Al guardar, la tabla de cada tipo de vehiculo es el promedio de las tablas
+de sus agentes sobre los pares (estado, accion) que cada agente actualizo.
+"""
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from datetime import datetime
+import numpy as np
+from agents.car import Car
+from agents.motorcycle import Motorcycle
+from agents.police import Police
+from agents.qtable import QTable, QTableBatch
+
+POLICY_AGENTS = (('car', Car), ('motorcycle', Motorcycle), ('police', Police))
+Q_FIELDS = ('values', 'seen', 'visited')
+POLICY_NAME = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+
+class Policy:
+    """Tablas Q de una politica: {tipo: (values, seen, visited)} de solo lectura."""
+
+    def __init__(self, name, tables, meta):
+        self.name = name
+        self.tables = tables
+        self.meta = meta
+
+
+class PolicyStore:
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        if not POLICY_NAME.fullmatch(name or ''):
+            raise ValueError("El nombre de la politica solo puede tener letras, numeros, '_' y '-' (maximo 64)")
+        return os.path.join(self.directory, name)
+
+    def names(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name for name in os.listdir(self.directory)
+            if POLICY_NAME.fullmatch(name) and os.path.exists(os.path.join(self.directory, name, 'policy.json'))
+        )
+
+    def describe(self, name):
+        with open(os.path.join(self._path(name), 'policy.json')) as f:
+            return json.load(f)
+
+    def save(self, name, simulation):
+        """Guarda las tablas Q de la simulacion como la politica `name` (reemplaza la anterior)."""
+        path = self._path(name)
+        tables = {
+            kind: aggregate(simulation.q_tables[kind]) for kind, _ in POLICY_AGENTS if kind != 'police'
+        }
+        # Con varias unidades de policia se promedian igual que los vehiculos
+        tables['police'] = aggregate(QTableBatch.from_arrays(
+            *(np.stack([getattr(unit.q_table, field) for unit in simulation.police_units]) for field in Q_FIELDS),
+            Police.STATE_SHAPE, Police.ACTIONS
+        ))
+        meta = {
+            'name': name,
+            'source_id': simulation.simulation_id,
+            'source_step': simulation.current_step,
+            'created': datetime.now().isoformat(),
+            'agents': {
+                kind: {'state_shape': list(agent_cls.STATE_SHAPE), 'actions': list(agent_cls.ACTIONS)}
+                for kind, agent_cls in POLICY_AGENTS
+            }
+        }
+
+        # Se escribe en un directorio temporal y se renombra, para no exponer politicas a medias
+        os.makedirs(self.directory, exist_ok=True)
+        staging = os.path.join(self.directory, f".{name}.{uuid.uuid4().hex}")
+        os.makedirs(staging)
+        for kind, arrays in tables.items():
+            for field, array in zip(Q_FIELDS, arrays):
+                np.save(os.path.join(staging, f"{kind}.{field}.npy"), array)
+        with open(os.path.join(staging, 'policy.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        with self._lock:
+            if os.path.exists(path):
+                # Las simulaciones que ya mapearon la version anterior la siguen leyendo sin problema
+                retired = f"{staging}.old"
+                os.rename(path, retired)
+                os.rename(staging, path)
+                shutil.rmtree(retired)
+            else:
+                os.rename(staging, path)
+            self._cache.pop(name, None)
+        return meta
+
+    def load(self, name):
+        """Politica mapeada en memoria (una sola vez por proceso); ValueError si no existe o no es compatible."""
+        with self._lock:
+            policy = self._cache.get(name)
+            if policy is not None:
+                return policy
+            path = self._path(name)
+            if not os.path.exists(os.path.join(path, 'policy.json')):
+                raise ValueError(f"Politica desconocida: {name}")
+            meta = self.describe(name)
+            tables = {}
+            for kind, agent_cls in POLICY_AGENTS:
+                expected = meta['agents'][kind]
+                if tuple(expected['state_shape']) != agent_cls.STATE_SHAPE or expected['actions'] != agent_cls.ACTIONS:
+                    raise ValueError(f"La politica {name} no es compatible con los agentes actuales ({kind})")
+                tables[kind] = tuple(
+                    np.load(os.path.join(path, f"{kind}.{field}.npy"), mmap_mode='r') for field in Q_FIELDS
+                )
+            policy = Policy(name, tables, meta)
+            self._cache[name] = policy
+            return policy
+
+
+def aggregate(batch):
+    """Una sola tabla para un tipo de vehiculo: promedio de los valores actualizados por sus agentes."""
+    seen_count = batch.seen.sum(axis=0)
+    totals = np.where(batch.seen, batch.values, 0.0).sum(axis=0)
+    values = np.divide(totals, seen_count, out=np.zeros_like(totals), where=seen_count > 0)
+    return values, seen_count > 0, batch.visited.any(axis=0)
+
+
+def apply_policy(simulation, policy, learning=False):
+    """Arranca la simulacion con las tablas de la politica.
+
+    Todos los agentes de un tipo leen la misma tabla mapeada; con `learning`
+    cada agente recibe su copia privada en el primer paso (o de inmediato, la
+    del policia), sin `learning` las tablas nunca se copian ni se escriben.
+    """
+    batches = {}
+    for kind, agent_cls in POLICY_AGENTS:
+        if kind == 'police':
+            continue
+        count = len(getattr(simulation, f"{kind}s"))
+        batches[kind] = QTableBatch.from_arrays(
+            *(np.broadcast_to(array, (count,) + array.shape) for array in policy.tables[kind]),
+            agent_cls.STATE_SHAPE, agent_cls.ACTIONS
+        )
+    simulation.share_q_tables(batches)
+    for unit in simulation.police_units:
+        unit.q_table = QTable(Police.STATE_SHAPE, Police.ACTIONS, *policy.tables['police'])
+    simulation.policy = policy.name
+    simulation.set_learning(learning)
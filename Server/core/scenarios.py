@@ -0,0 +1,25 @@
+from .simulation import TrafficSimulation
+
+# Escenarios fijos para comparar rendimiento antes/despues de un cambio:
+# mismo grid, misma flota y misma semilla producen la misma carga de trabajo.
+SCENARIOS = {
+    'baseline': {'grid_size': 10, 'num_cars': 5, 'num_motorcycles': 3, 'seed': 2025},
+    'downtown': {'grid_size': 50, 'num_cars': 400, 'num_motorcycles': 200, 'seed': 1001},
+    'rush_hour': {'grid_size': 40, 'num_cars': 900, 'num_motorcycles': 500, 'seed': 1002},
+    'metro': {'grid_size': 200, 'num_cars': 5000, 'num_motorcycles': 2500, 'seed': 1003},
+    'highway': {'grid_size': 500, 'num_cars': 20000, 'num_motorcycles': 10000, 'seed': 1004},
+}
+
+
+def get_scenario(name):
+    """Parametros de un escenario con nombre (copia, se puede modificar)."""
+    if name not in SCENARIOS:
+        raise ValueError(f"Escenario desconocido: {name}. Opciones: {', '.join(SCENARIOS)}")
+    return dict(SCENARIOS[name])
+
+
+def create_scenario_simulation(name, simulation_id=None, **overrides):
+    """Crea una TrafficSimulation a partir de un escenario; `overrides` reemplaza parametros (p. ej. engine)."""
+    params = get_scenario(name)
+    params.update(overrides)
+    return TrafficSimulation(simulation_id=simulation_id or name, **params)
@@ -0,0 +1,800 @@
+"""Simulacion repartida en mosaicos, cada uno atendido por su propio proceso.
+
+La cuadricula se divide en cols x rows mosaicos rectangulares. Cada proceso
+guarda los vehiculos que estan dentro de su mosaico como columnas numpy (con
+sus tablas Q) y les aplica las mismas reglas por lotes que VectorizedEngine
+(las funciones de core/vectorized.py). Un paso son tres
+rondas que todos los mosaicos corren en paralelo:
+
+1. move: acelerar y mover. Los vehiculos que terminan fuera del mosaico se
+   quitan y se regresan agrupados por mosaico destino.
+2. settle: cada mosaico recibe a los que llegaron (intercambio de frontera)
+   y solo entonces cuenta vehiculos por celda, asi que los choques y la
+   congestion en la orilla de un mosaico ven a todos los vehiculos de la
+   celda. Despues los vehiculos aprenden (obey_instructions).
+3. enforce: la intervencion de los policias o drones, multas y celdas
+   congestionadas que quedan.
+
+Entre la segunda y la tercera ronda el coordinador (ShardedSimulation, en el
+proceso del servidor) mueve a cada policia y elige su accion con los conteos
+de su region, sumados de todos los mosaicos. Con la misma semilla y el mismo numero de mosaicos la
+simulacion es reproducible, pero no da los mismos pasos que una
+TrafficSimulation con esa semilla.
+"""
+import math
+import multiprocessing
+import os
+import random
+import threading
+import weakref
+from datetime import datetime
+import numpy as np
+from agents.car import Car
+from agents.motorcycle import Motorcycle
+from agents.police import Police
+from agents.drone import Drone
+from agents.qtable import QTable, QTableBatch
+from .events import NullEventSink
+from .spatial import RegionGrid, CONGESTION_THRESHOLD
+from .placement import place, PLACEMENTS
+from .simulation import TrafficSimulation
+from .vectorized import accelerate_all, move_all, collided, unit_positions, encode_states, obey_all, ticket_all
+
+MAX_SHARDS = 64
+VEHICLE_TYPES = (('car', Car), ('motorcycle', Motorcycle))
+# Campos que definen si un vehiculo cambio en el paso (los mismos que VectorizedEngine.changed_slots)
+TRACKED_FIELDS = ('x', 'y', 'speed', 'movements', 'ticketed', 'collision')
+STATE_FIELDS = ('id', 'x', 'y', 'speed', 'speed_limit', 'movements', 'ticketed', 'collision', 'version')
+# 'spawn' por defecto: el servidor tiene hilos y fork podria copiar candados tomados
+START_METHOD = os.environ.get('TRAFFIC_SHARD_START_METHOD', 'spawn')
+
+
+def column_layout(vehicle_cls):
+    num_states = math.prod(vehicle_cls.STATE_SHAPE)
+    num_actions = len(vehicle_cls.ACTIONS)
+    return {
+        **{field: (np.int64, ()) for field in ('id', 'x', 'y', 'speed', 'speed_limit', 'movements')},
+        'ticketed': (bool, ()),
+        'collision': (bool, ()),
+        'moving': (bool, ()),
+        'version': (np.int64, ()),
+        # Campos de TRACKED_FIELDS al empezar el paso, para calcular version al terminarlo
+        'previous': (np.int64, (len(TRACKED_FIELDS),)),
+        'q_values': (np.float64, (num_states, num_actions)),
+        'q_seen': (bool, (num_states, num_actions)),
+        'q_visited': (bool, (num_states,))
+    }
+
+
+class VehicleColumns:
+    """Vehiculos de un tipo como columnas numpy que crecen al agregar; quitar renglones es O(renglones quitados)."""
+
+    def __init__(self, vehicle_cls):
+        self.vehicle_cls = vehicle_cls
+        self.size = 0
+        self.arrays = {
+            name: np.zeros((0,) + shape, dtype) for name, (dtype, shape) in column_layout(vehicle_cls).items()
+        }
+
+    def __getitem__(self, name):
+        return self.arrays[name][:self.size]
+
+    def append(self, rows):
+        """Agrega renglones {columna: arreglo}; las columnas que falten quedan en cero."""
+        count = len(rows['id'])
+        if not count:
+            return
+        end = self.size + count
+        capacity = len(self.arrays['id'])
+        if end > capacity:
+            capacity = max(end, 2 * capacity, 64)
+            for name, array in self.arrays.items():
+                grown = np.zeros((capacity,) + array.shape[1:], array.dtype)
+                grown[:self.size] = array[:self.size]
+                self.arrays[name] = grown
+        for name, array in self.arrays.items():
+            array[self.size:end] = rows[name] if name in rows else 0
+        self.size = end
+
+    def take(self, slots):
+        """Quita los renglones `slots` (ordenados) y los regresa; los ultimos renglones ocupan los huecos."""
+        rows = {name: array[slots] for name, array in self.arrays.items()}
+        remaining = self.size - len(slots)
+        holes = slots[slots < remaining]
+        tail = np.setdiff1d(np.arange(remaining, self.size), slots, assume_unique=True)
+        for array in self.arrays.values():
+            array[holes] = array[tail]
+        self.size = remaining
+        return rows
+
+    def batch(self):
+        return QTableBatch.from_arrays(
+            self['q_values'], self['q_seen'], self['q_visited'], self.vehicle_cls.STATE_SHAPE, self.vehicle_cls.ACTIONS
+        )
+
+
+class Tile:
+    """Vehiculos del mosaico [x0, x1) x [y0, y1); corre dentro de un proceso de trabajo.
+
+    `police_regions` y `drone_regions` son las RegionGrid de las unidades del
+    coordinador: con ellas el mosaico sabe que policia vigila cada vehiculo y
+    reparte los choques por policia y dron.
+    """
+
+    def __init__(self, index, grid_size, xs, ys, seed, rows, learning=True, rng_state=None,
+                 congestion_threshold=CONGESTION_THRESHOLD, police_regions=None, drone_regions=None):
+        self.index = index
+        self.grid_size = grid_size
+        self.xs = np.asarray(xs)
+        self.ys = np.asarray(ys)
+        self.rng = np.random.default_rng(seed)
+        if rng_state is not None:
+            self.rng.bit_generator.state = rng_state
+        self.learning = learning
+        self.congestion_threshold = congestion_threshold
+        self.police_regions = police_regions if police_regions is not None else RegionGrid(grid_size, 1)
+        self.drone_regions = drone_regions if drone_regions is not None else RegionGrid(grid_size, 1)
+        self.kinds = {kind: VehicleColumns(vehicle_cls) for kind, vehicle_cls in VEHICLE_TYPES}
+        for kind, columns in self.kinds.items():
+            columns.append(rows[kind])
+        # Parametros de aprendizaje (alpha, gamma, epsilon) de un agente de cada tipo, como en VectorizedEngine
+        self.params = {kind: vehicle_cls(-1) for kind, vehicle_cls in VEHICLE_TYPES}
+        self.cell_counts = {kind: np.zeros(0, dtype=np.int64) for kind in self.kinds}
+        self._cells = np.zeros(0, dtype=np.int64)
+        self._counts = np.zeros(0, dtype=np.int64)
+
+    def owner(self, x, y):
+        rows = len(self.ys) - 1
+        return (np.searchsorted(self.xs, x, 'right') - 1) * rows + np.searchsorted(self.ys, y, 'right') - 1
+
+    def move(self):
+        """Ronda 1: acelera y mueve; regresa vehiculos movidos por tipo y {mosaico destino: {tipo: renglones}}."""
+        moved = {}
+        emigrants = {}
+        for kind, columns in self.kinds.items():
+            columns['previous'][:] = np.stack([columns[field] for field in TRACKED_FIELDS], axis=1)
+            x, y, speed = columns['x'], columns['y'], columns['speed']
+            accelerate_all(speed, self.rng)
+            moving, changed = move_all(x, y, speed, columns['movements'], self.grid_size, self.rng)
+            columns['moving'][:] = moving
+            moved[kind] = int(np.count_nonzero(changed))
+
+            owner = self.owner(x, y)
+            leaving = np.flatnonzero(owner != self.index)
+            if not len(leaving):
+                continue
+            destinations = owner[leaving]
+            rows = columns.take(leaving)
+            for destination in np.unique(destinations).tolist():
+                selected = destinations == destination
+                emigrants.setdefault(destination, {})[kind] = {name: array[selected] for name, array in rows.items()}
+        return moved, emigrants
+
+    def settle(self, immigrants, police_positions, probes):
+        """Ronda 2: recibe vehiculos de otros mosaicos, detecta choques y aplica obey_instructions.
+
+        `police_positions` son las posiciones de los policias en el orden de sus regiones.
+        """
+        for rows in immigrants:
+            for kind, kind_rows in rows.items():
+                self.kinds[kind].append(kind_rows)
+
+        cells = np.concatenate([columns['x'] * self.grid_size + columns['y'] for columns in self.kinds.values()])
+        moving = np.concatenate([columns['moving'] for columns in self.kinds.values()])
+        self._cells, inverse, self._counts = np.unique(cells, return_inverse=True, return_counts=True)
+        cell_counts, hit = collided(inverse, self._counts, moving)
+        start = 0
+        for kind, columns in self.kinds.items():
+            end = start + columns.size
+            self.cell_counts[kind] = cell_counts[start:end]
+            collision = columns['collision']
+            collision |= hit[start:end]
+            start = end
+
+        self._obey(police_positions)
+        return {
+            'collisions': self._collisions_by_unit(),
+            'congested_cells': self._congested_cells(),
+            'probes': [self.count_at(position) for position in probes]
+        }
+
+    def count_at(self, position):
+        cell = position[0] * self.grid_size + position[1]
+        i = np.searchsorted(self._cells, cell)
+        return int(self._counts[i]) if i < len(self._cells) and self._cells[i] == cell else 0
+
+    def _congested_cells(self):
+        cells = self._cells[self._counts >= self.congestion_threshold]
+        return np.stack(np.divmod(cells, self.grid_size), axis=1).tolist()
+
+    def _collisions_by_unit(self):
+        """{(policia, dron): vehiculos chocados} segun la region de cada unidad en la que esta el vehiculo."""
+        x = np.concatenate([columns['x'][columns['collision']] for columns in self.kinds.values()])
+        y = np.concatenate([columns['y'][columns['collision']] for columns in self.kinds.values()])
+        pairs = self.police_regions.indices(x, y) * len(self.drone_regions) + self.drone_regions.indices(x, y)
+        pairs, counts = np.unique(pairs, return_counts=True)
+        return {divmod(pair, len(self.drone_regions)): count for pair, count in zip(pairs.tolist(), counts.tolist())}
+
+    def _obey(self, police_positions):
+        for kind, columns in self.kinds.items():
+            if not columns.size:
+                continue
+            batch = columns.batch()
+            x, y = columns['x'], columns['y']
+            police_position = unit_positions(self.police_regions, police_positions, x, y)
+            cell_counts = self.cell_counts[kind]
+            obey_all(
+                batch, self.params[kind], columns['speed'], columns['speed_limit'], columns['collision'],
+                columns['ticketed'],
+                lambda speed: encode_states(batch, x, y, speed, cell_counts, police_position, self.congestion_threshold),
+                self.rng, self.learning
+            )
+
+    def enforce(self, step):
+        """Ronda 3: resuelve choques y congestion (policia o dron), multa y marca la version de lo que cambio.
+
+        Las regiones de los policias cubren toda la cuadricula y cada uno atiende la suya (o la
+        atienden los drones que llama), asi que se resuelven todos los choques y celdas congestionadas.
+        """
+        tickets = {}
+        collisions = 0
+        overspeed = False
+        movements = 0
+        for kind, columns in self.kinds.items():
+            speed = columns['speed']
+            collision = columns['collision']
+            hit = np.flatnonzero(collision)
+            speed[hit] = np.maximum(speed[hit] - 1, 0)
+            collision[hit] = False
+            crowded = np.flatnonzero(self.cell_counts[kind] >= self.congestion_threshold)
+            speed[crowded] = np.maximum(speed[crowded] - 1, 0)
+
+            slots, original = ticket_all(speed, columns['speed_limit'], columns['ticketed'], self.rng)
+            if len(slots):
+                tickets[kind] = (
+                    columns['id'][slots].tolist(), columns['x'][slots].tolist(), columns['y'][slots].tolist(),
+                    original.tolist(), speed[slots].tolist()
+                )
+
+            current = np.stack([columns[field] for field in TRACKED_FIELDS], axis=1)
+            version = columns['version']
+            version[(current != columns['previous']).any(axis=1)] = step
+            collisions += int(np.count_nonzero(collision))
+            overspeed = overspeed or bool(np.any(speed > columns['speed_limit']))
+            movements += int(columns['movements'].sum())
+        return {'tickets': tickets, 'collisions': collisions, 'overspeed': overspeed, 'movements': movements}
+
+    def vehicles(self, since_step=None, region=None):
+        """Columnas de STATE_FIELDS por tipo, de los vehiculos que cambiaron despues de since_step y/o en region."""
+        result = {}
+        for kind, columns in self.kinds.items():
+            mask = np.ones(columns.size, dtype=bool)
+            if since_step is not None:
+                mask &= columns['version'] > since_step
+            if region is not None:
+                x0, y0, x1, y1 = region
+                x, y = columns['x'], columns['y']
+                mask &= (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+            slots = np.flatnonzero(mask)
+            result[kind] = {field: columns[field][slots].tolist() for field in STATE_FIELDS}
+        return result
+
+    def set_learning(self, enabled):
+        self.learning = enabled
+
+    def dump(self):
+        """Renglones y estado del generador, para volver a crear el mosaico en otro proceso."""
+        rows = {kind: {name: columns[name].copy() for name in columns.arrays} for kind, columns in self.kinds.items()}
+        return rows, self.rng.bit_generator.state
+
+
+def serve_tile(connection, tile_args):
+    """Ciclo de un proceso de trabajo: ejecuta los metodos de Tile que pide el coordinador."""
+    tile = Tile(*tile_args)
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        command, args = message
+        try:
+            reply = (True, getattr(tile, command)(*args))
+        except Exception as e:
+            reply = (False, f"{type(e).__name__}: {e}")
+        connection.send(reply)
+    connection.close()
+
+
+def stop_workers(connections, processes):
+    for connection in connections:
+        try:
+            connection.send(None)
+            connection.close()
+        except (OSError, ValueError):
+            pass
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+
+
+class VehicleView:
+    """Copia de un vehiculo de un mosaico con la interfaz que usan las respuestas de la API."""
+
+    __slots__ = ('id', 'position', 'speed', 'speed_limit', 'movements', 'ticketed', 'collision', 'version')
+
+    def __init__(self, vehicle_id, position, speed, speed_limit, movements, ticketed, collision, version):
+        self.id = vehicle_id
+        self.position = position
+        self.speed = speed
+        self.speed_limit = speed_limit
+        self.movements = movements
+        self.ticketed = ticketed
+        self.collision = collision
+        self.version = version
+
+    def to_dict(self):
+        return {
+            "position": self.position,
+            "speed": self.speed,
+            "movements": self.movements,
+            "id": self.id,
+            "ticketed": self.ticketed,
+            "collision": self.collision,
+            "speed_limit": self.speed_limit
+        }
+
+
+class ShardedSimulation:
+    """Una simulacion (un solo ID) cuyos vehiculos avanzan en `shards` procesos.
+
+    Tiene la interfaz de TrafficSimulation que usa la API (step, advance,
+    get_state, cars, motorcycles, police_units, drones...). `cars` y
+    `motorcycles` son copias (VehicleView) que se piden a los mosaicos una vez
+    por paso. Los policias y drones viven en el coordinador.
+    """
+
+    def __init__(self, simulation_id, grid_size=10, num_cars=5, num_motorcycles=3, shards=2, seed=None, events=None,
+                 metrics=None, learning=True, placement='uniform', num_police=1, num_drones=1,
+                 congestion_threshold=CONGESTION_THRESHOLD, policy=None):
+        if not 2 <= shards <= MAX_SHARDS:
+            raise ValueError(f"shards debe estar entre 2 y {MAX_SHARDS}")
+        if num_police < 1 or num_drones < 1:
+            raise ValueError("Se necesita al menos un policia y un dron")
+        if congestion_threshold < 2:
+            raise ValueError("congestion_threshold debe ser al menos 2")
+        if placement not in PLACEMENTS:
+            raise ValueError(f"Colocacion desconocida: {placement}. Opciones: {', '.join(PLACEMENTS)}")
+        tiles = RegionGrid(grid_size, shards)
+        num_agents = num_cars + num_motorcycles + num_police + num_drones
+        if num_agents > grid_size * grid_size:
+            raise ValueError(
+                f"No caben {num_agents} agentes en celdas distintas de una cuadricula de {grid_size}x{grid_size}"
+            )
+        self.simulation_id = simulation_id
+        self.grid_size = grid_size
+        self.shards = shards
+        self.start_time = datetime.now()
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.np_rng = np.random.default_rng(seed)
+        self.events = events if events is not None else NullEventSink()
+        self.metrics = metrics
+        self.engine_name = 'sharded'
+        # Sin motor local: wire.pack_state lee los vehiculos como agentes
+        self.engine = None
+        self.policy = None
+        self.learning = learning
+        self.num_cars = num_cars
+        self.num_motorcycles = num_motorcycles
+        self.placement = placement
+        self.congestion_threshold = congestion_threshold
+
+        # Mismas regiones y unidades que TrafficSimulation; police y drone son la primera de cada tipo
+        self.police_regions = RegionGrid(grid_size, num_police)
+        self.drone_regions = RegionGrid(grid_size, num_drones)
+        self.police_units = [Police(self) for _ in range(num_police)]
+        self.drones = [Drone(self) for _ in range(num_drones)]
+        if num_police > 1:
+            for unit, region in zip(self.police_units, self.police_regions.regions):
+                unit.region = region
+        if num_drones > 1:
+            for unit, region in zip(self.drones, self.drone_regions.regions):
+                unit.region = region
+        self.police = self.police_units[0]
+        self.drone = self.drones[0]
+        for unit in self.police_units:
+            if policy is not None:
+                unit.q_table = QTable(Police.STATE_SHAPE, Police.ACTIONS, *policy.tables['police'])
+                if learning:
+                    unit.q_table = unit.q_table.copy()
+            unit.learning = learning
+        if policy is not None:
+            self.policy = policy.name
+        self.tiles = tiles
+        self.xs, self.ys = tiles.xs, tiles.ys
+        self._seeds = np.random.SeedSequence(seed).spawn(shards)
+
+        self.task_completed = False
+        self.task_completion_time = None
+        self.failed_congestions = 0
+        self.current_step = 0
+        self.total_movements = 0
+        self._congested = []
+        self._probes = {}
+        self._views = None
+        self._lock = threading.Lock()
+        self._start([
+            self._tile_args(index, tile_rows)
+            for index, tile_rows in enumerate(self._initial_rows(policy))
+        ])
+        for agent in self.police_units + self.drones:
+            agent.version = 0
+        self._track_changes()
+
+    def _initial_rows(self, policy=None):
+        """Reparte a los agentes en celdas distintas (sin recorrer el area) y agrupa los vehiculos por mosaico.
+
+        Con `policy` cada vehiculo arranca con una copia de la tabla Q de su tipo.
+        """
+        grid_size = self.grid_size
+        occupied = []
+        for unit in self.police_units + self.drones:
+            unit_x, unit_y = place(1, grid_size, self.rng, unit.region, exclude=occupied)
+            unit.position = (int(unit_x[0]), int(unit_y[0]))
+            occupied.append(unit.position)
+        x, y = place(self.num_cars + self.num_motorcycles, grid_size, self.rng, preset=self.placement, exclude=occupied)
+        tiles = [{} for _ in range(self.shards)]
+        start = 0
+        for (kind, vehicle_cls), count in zip(VEHICLE_TYPES, (self.num_cars, self.num_motorcycles)):
+            speed_limit = vehicle_cls(-1).speed_limit
+            kind_x, kind_y = x[start:start + count], y[start:start + count]
+            start += count
+            rows = {
+                'id': np.arange(count),
+                'x': kind_x,
+                'y': kind_y,
+                'speed': self.np_rng.integers(0, speed_limit + 1, count),
+                'speed_limit': np.full(count, speed_limit)
+            }
+            owner = self.tiles.indices(kind_x, kind_y)
+            for index, tile in enumerate(tiles):
+                selected = owner == index
+                tile[kind] = {name: column[selected] for name, column in rows.items()}
+                if policy is not None:
+                    # VehicleColumns.append copia la misma tabla en el renglon de cada vehiculo
+                    tile[kind].update(zip(('q_values', 'q_seen', 'q_visited'), policy.tables[kind]))
+        return tiles
+
+    def _tile_args(self, index, rows, rng_state=None):
+        return (
+            index, self.grid_size, self.xs, self.ys, self._seeds[index], rows, self.learning, rng_state,
+            self.congestion_threshold, self.police_regions, self.drone_regions
+        )
+
+    def _start(self, tiles):
+        context = multiprocessing.get_context(START_METHOD)
+        self._connections = []
+        self._processes = []
+        for tile_args in tiles:
+            parent, child = context.Pipe()
+            process = context.Process(
+                target=serve_tile, args=(child, tile_args), daemon=True,
+                name=f"traffic-shard-{self.simulation_id}-{tile_args[0]}"
+            )
+            process.start()
+            child.close()
+            self._connections.append(parent)
+            self._processes.append(process)
+        self._finalizer = weakref.finalize(self, stop_workers, self._connections, self._processes)
+
+    def _call(self, command, args=None):
+        """Envia `command` a todos los mosaicos a la vez y regresa sus respuestas en orden de mosaico."""
+        with self._lock:
+            try:
+                for index, connection in enumerate(self._connections):
+                    connection.send((command, args[index] if args is not None else ()))
+                replies = [connection.recv() for connection in self._connections]
+            except (EOFError, OSError) as e:
+                raise RuntimeError(f"Se perdio un proceso de la simulacion {self.simulation_id}: {e}")
+        for ok, result in replies:
+            if not ok:
+                raise RuntimeError(f"Error en un mosaico de la simulacion {self.simulation_id}: {result}")
+        return [result for _, result in replies]
+
+    def count_at(self, position):
+        """Vehiculos en una celda vecina de un policia (las unicas que consulta Police.move)."""
+        return self._probes.get(tuple(position), 0)
+
+    police_for = TrafficSimulation.police_for
+    drones_for = TrafficSimulation.drones_for
+
+    def _police_neighbors(self):
+        grid_size = self.grid_size
+        return sorted({
+            (x + dx, y + dy) for x, y in (unit.position for unit in self.police_units)
+            for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]
+            if 0 <= x + dx < grid_size and 0 <= y + dy < grid_size
+        })
+
+    def step(self):
+        timer = self.metrics.step_timer(self.engine_name) if self.metrics is not None else None
+        movement_results = self._step(timer)
+        self.current_step += 1
+        self._track_changes()
+        if timer is not None:
+            timer.lap('track_changes')
+            timer.finish()
+        return movement_results
+
+    def _step(self, timer=None):
+        movement_results = {
+            'cars_moved': 0,
+            'motorcycles_moved': 0,
+            'collisions_detected': 0,
+            'congested_cells': [],
+            'game_over': False,
+            'reason': None,
+            'task_completed': self.task_completed
+        }
+
+        # Ronda 1 e intercambio de frontera: cada mosaico recibe los vehiculos que entraron a su area
+        inbound = [[] for _ in range(self.shards)]
+        for moved, emigrants in self._call('move'):
+            movement_results['cars_moved'] += moved['car']
+            movement_results['motorcycles_moved'] += moved['motorcycle']
+            for destination, rows in emigrants.items():
+                inbound[destination].append(rows)
+        if timer is not None:
+            timer.lap('move')
+
+        probes = self._police_neighbors()
+        positions = [unit.position for unit in self.police_units]
+        replies = self._call('settle', [(rows, positions, probes) for rows in inbound])
+        collisions = {}
+        for reply in replies:
+            for pair, count in reply['collisions'].items():
+                collisions[pair] = collisions.get(pair, 0) + count
+        congested_cells = [cell for reply in replies for cell in reply['congested_cells']]
+        self._probes = {position: sum(reply['probes'][i] for reply in replies) for i, position in enumerate(probes)}
+        if timer is not None:
+            timer.lap('obey')
+
+        # Cada unidad observa y actua solo en su region
+        for index, police in enumerate(self.police_units):
+            self._police_step(index, police, collisions, congested_cells)
+        if timer is not None:
+            timer.lap('police')
+
+        replies = self._call('enforce', [(self.current_step + 1,)] * self.shards)
+        self._register_tickets(replies)
+        self.total_movements = sum(reply['movements'] for reply in replies)
+        if timer is not None:
+            timer.lap('tickets')
+
+        # Los vehiculos no se mueven despues de settle: las celdas congestionadas siguen siendo las mismas
+        self._congested = congested_cells
+        movement_results['congested_cells'] = congested_cells
+        if timer is not None:
+            timer.lap('congestion')
+
+        if congested_cells:
+            self.police.failed_congestions += 1
+            self.events.emit(
+                'congestion_remaining', self.current_step,
+                cells=congested_cells, failed_congestions=self.police.failed_congestions
+            )
+            if self.police.failed_congestions >= 3:
+                self.events.emit('game_over', self.current_step, reason="Tres fallos consecutivos en resolver congestiones")
+                movement_results['game_over'] = True
+                movement_results['reason'] = "Tres fallos consecutivos en resolver congestiones"
+                return movement_results
+        else:
+            self.police.failed_congestions = 0
+
+        collisions_count = sum(reply['collisions'] for reply in replies)
+        any_overspeed = any(reply['overspeed'] for reply in replies)
+        movement_results['collisions_detected'] = collisions_count
+        if not collisions_count and not any_overspeed:
+            if not self.task_completed:
+                self.task_completed = True
+                self.task_completion_time = datetime.now()
+                movement_results['task_completed'] = True
+                self.events.emit('task_completed', self.current_step)
+        if timer is not None:
+            timer.lap('completion')
+
+        return movement_results
+
+    def _police_step(self, index, police, collisions, congested_cells):
+        """Police.step con los conteos de su region; la intervencion sobre los vehiculos la aplica cada mosaico.
+
+        `collisions` es {(policia, dron): choques} y `index` la region del policia.
+        """
+        police.move()
+        by_drone = {drone: count for (unit, drone), count in collisions.items() if unit == index}
+        cells = [cell for cell in congested_cells if self.police_regions.index(cell) == index]
+        collisions_count = sum(by_drone.values())
+        state = (min(collisions_count, 5), min(len(cells), 5))
+        action = police.choose_action(state)
+        if action == "resolve_myself":
+            if collisions_count:
+                self.events.emit('collisions_resolved', self.current_step, by='police', count=collisions_count)
+                police.movements += 1
+            if cells:
+                police.congestion_resolved += len(cells)
+                self.events.emit('congestion_resolved', self.current_step, by='police', cells=cells)
+                police.movements += 1
+        else:
+            police.drone_requests += 1
+            police.movements += 1
+            self.events.emit('drone_requested', self.current_step, position=police.position)
+            # Cada dron atiende la parte de la region del policia que cae en la suya
+            for drone in self.drones_for(police):
+                drone_index = self.drones.index(drone)
+                count = by_drone.get(drone_index, 0)
+                if count:
+                    self.events.emit('collisions_resolved', self.current_step, by='drone', count=count)
+                    drone.movements += 1
+                    drone.collisions_resolved += 1
+                drone_cells = [cell for cell in cells if self.drone_regions.index(cell) == drone_index]
+                if drone_cells:
+                    self.events.emit('congestion_resolved', self.current_step, by='drone', cells=drone_cells)
+                    drone.movements += 1
+                    drone.congestions_resolved += 1
+        reward = police.compute_reward(*state, action)
+        # Despues de intervenir no quedan choques y los vehiculos no se han movido
+        police.update_Q(state, action, reward, (0, state[1]))
+
+    def _register_tickets(self, replies):
+        for reply in replies:
+            for kind, (ids, xs, ys, original, new) in reply['tickets'].items():
+                vehicle = 'Car' if kind == 'car' else 'Motorcycle'
+                for vehicle_id, x, y, original_speed, new_speed in zip(ids, xs, ys, original, new):
+                    police = self.police_for((x, y))
+                    police.tickets_issued.append((kind, vehicle_id, original_speed, new_speed))
+                    police.movements += 1
+                    if self.events.enabled:
+                        self.events.emit(
+                            'ticket_issued', self.current_step, vehicle=vehicle, id=vehicle_id, position=(x, y),
+                            original_speed=original_speed, new_speed=new_speed
+                        )
+
+    def _track_changes(self):
+        for agent in self.police_units + self.drones:
+            fingerprint = agent.fingerprint()
+            if fingerprint != getattr(agent, '_fingerprint', None):
+                agent._fingerprint = fingerprint
+                agent.version = self.current_step
+
+    advance = TrafficSimulation.advance
+    met_condition = TrafficSimulation.met_condition
+    changed_since = TrafficSimulation.changed_since
+
+    def _vehicles(self, since_step=None, region=None):
+        """(cars, motorcycles) como VehicleView ordenados por id, tomados de todos los mosaicos."""
+        replies = self._call('vehicles', [(since_step, region)] * self.shards)
+        result = []
+        for kind, _ in VEHICLE_TYPES:
+            views = []
+            for reply in replies:
+                columns = reply[kind]
+                views.extend(
+                    VehicleView(vehicle_id, (x, y), speed, speed_limit, movements, ticketed, collision, version)
+                    for vehicle_id, x, y, speed, speed_limit, movements, ticketed, collision, version
+                    in zip(*(columns[field] for field in STATE_FIELDS))
+                )
+            views.sort(key=lambda view: view.id)
+            result.append(views)
+        return tuple(result)
+
+    def _all_vehicles(self):
+        if self._views is None or self._views[0] != self.current_step:
+            self._views = (self.current_step,) + self._vehicles()
+        return self._views[1:]
+
+    @property
+    def cars(self):
+        return self._all_vehicles()[0]
+
+    @property
+    def motorcycles(self):
+        return self._all_vehicles()[1]
+
+    @property
+    def agents(self):
+        return self.police_units + self.drones + self.cars + self.motorcycles
+
+    def vehicles_in_region(self, region):
+        return self._vehicles(region=region)
+
+    def detect_congestion(self, region=None):
+        if region is None:
+            return [list(cell) for cell in self._congested]
+        x0, y0, x1, y1 = region
+        return [list(cell) for cell in self._congested if x0 <= cell[0] <= x1 and y0 <= cell[1] <= y1]
+
+    def get_state(self, since_step=None, region=None):
+        """Igual que TrafficSimulation.get_state; los vehiculos se filtran dentro de cada mosaico."""
+        if since_step is None and region is None:
+            cars, motorcycles = self._all_vehicles()
+        else:
+            cars, motorcycles = self._vehicles(since_step, region)
+        police_units = self.police_units if since_step is None else self.changed_since(self.police_units, since_step)
+        drones = self.drones if since_step is None else self.changed_since(self.drones, since_step)
+        state = {
+            "simulation_id": self.simulation_id,
+            "seed": self.seed,
+            "policy": self.policy,
+            "learning": self.learning,
+            "grid": {
+                "size": self.grid_size,
+                "shards": self.shards,
+                "congestion_threshold": self.congestion_threshold,
+                "placement": self.placement
+            },
+            "current_step": self.current_step,
+            "agents": {
+                "police": self.police.to_dict() if self.police in police_units else None,
+                "drone": self.drone.to_dict() if self.drone in drones else None,
+                "police_units": [unit.to_dict() for unit in police_units],
+                "drones": [unit.to_dict() for unit in drones],
+                "cars": [car.to_dict() for car in cars],
+                "motorcycles": [motorcycle.to_dict() for motorcycle in motorcycles]
+            },
+            "congested_cells": self.detect_congestion(region),
+            "status": {
+                "task_completed": self.task_completed,
+                "task_completion_time": self.task_completion_time.isoformat() if self.task_completion_time else None,
+                "failed_congestions": self.failed_congestions,
+                "total_movements": self.total_movements + sum(unit.movements for unit in self.police_units + self.drones),
+                "start_time": self.start_time.isoformat()
+            }
+        }
+        if region is not None:
+            state["region"] = list(region)
+        if since_step is not None:
+            state["since_step"] = since_step
+        return state
+
+    def set_learning(self, enabled):
+        self.learning = enabled
+        for unit in self.police_units:
+            unit.learning = enabled
+            if enabled and not unit.q_table.values.flags.writeable:
+                unit.q_table = unit.q_table.copy()
+        self._call('set_learning', [(enabled,)] * self.shards)
+
+    # Bytes por vehiculo en los procesos de trabajo (columnas y tablas Q)
+    VEHICLE_BYTES = sum(
+        np.dtype(dtype).itemsize * math.prod(shape) for dtype, shape in column_layout(Car).values()
+    )
+
+    def estimated_size(self):
+        """Memoria aproximada en bytes, sumando la de los procesos de los mosaicos."""
+        return (
+            (self.num_cars + self.num_motorcycles) * self.VEHICLE_BYTES
+            + sum(len(unit.tickets_issued) for unit in self.police_units) * TrafficSimulation.TICKET_OVERHEAD
+            + len(self.events.events()) * TrafficSimulation.EVENT_OVERHEAD
+        )
+
+    def __getstate__(self):
+        # Al desalojar a disco se traen los renglones de cada mosaico; los procesos se relanzan al cargar
+        state = self.__dict__.copy()
+        state['_tiles'] = self._call('dump')
+        for name in ('_connections', '_processes', '_finalizer', '_lock', '_views'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        tiles = state.pop('_tiles')
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._views = None
+        self._start([
+            self._tile_args(index, rows, rng_state) for index, (rows, rng_state) in enumerate(tiles)
+        ])
+
+    def close(self):
+        """Detiene los procesos de los mosaicos y libera el escritor de eventos."""
+        self._finalizer()
+        self.events.close()
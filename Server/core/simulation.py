@@ -1,61 +1,194 @@
+import random
 from datetime import datetime
+import numpy as np
 from agents.police import Police
 from agents.drone import Drone
 from agents.car import Car
 from agents.motorcycle import Motorcycle
-from .utils import generate_random_position
+from agents.qtable import QTableBatch
+from .placement import place, PLACEMENTS
+from .spatial import OccupancyIndex, RegionGrid, CONGESTION_THRESHOLD
+from .incidents import IncidentIndex
+from .events import NullEventSink
+from .metrics import PhaseTotals, NO_PHASE_TOTALS
+from .vectorized import VectorizedEngine, ArrayCar, ArrayMotorcycle, ArrayOccupancyIndex, unit_positions
+
+ENGINES = ('python', 'numpy')
+STOP_CONDITIONS = ('game_over', 'task_completed')
+# Limites de /create (y de las instantaneas que se suben a /restore).
+# El indice de ocupacion es disperso: el limite real es el numero de vehiculos, no el area
+MAX_GRID_SIZE = 5000
+MAX_CARS = 200000
+MAX_MOTORCYCLES = 100000
+MAX_UNITS = 1024
 
 class TrafficSimulation:
 
 
-    def __init__(self, simulation_id, grid_size=10, num_cars=5, num_motorcycles=3):
+    def __init__(self, simulation_id, grid_size=10, num_cars=5, num_motorcycles=3, engine='python', seed=None, events=None,
+                 metrics=None, num_police=1, num_drones=1, congestion_threshold=CONGESTION_THRESHOLD, placement='uniform'):
+        if engine not in ENGINES:
+            raise ValueError(f"Motor desconocido: {engine}. Opciones: {', '.join(ENGINES)}")
+        if num_police < 1 or num_drones < 1:
+            raise ValueError("Se necesita al menos un policia y un dron")
+        if congestion_threshold < 2:
+            raise ValueError("congestion_threshold debe ser al menos 2")
+        if placement not in PLACEMENTS:
+            raise ValueError(f"Colocacion desconocida: {placement}. Opciones: {', '.join(PLACEMENTS)}")
+        # Cada agente (vehiculos, policias y drones) arranca en una celda distinta
+        num_agents = num_cars + num_motorcycles + num_police + num_drones
+        if grid_size < 1 or num_agents > grid_size * grid_size:
+            raise ValueError(
+                f"No caben {num_agents} agentes en celdas distintas de una cuadricula de {grid_size}x{grid_size}"
+            )
         self.simulation_id = simulation_id
         self.grid_size = grid_size
         self.start_time = datetime.now()
+
+        # Toda la aleatoriedad de la simulacion sale de estos generadores
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.np_rng = np.random.default_rng(seed)
+        self.events = events if events is not None else NullEventSink()
+        # MetricsRegistry opcional (core/metrics.py); con None el paso no mide nada
+        self.metrics = metrics
+        self.engine_name = engine
+        # Vehiculos a partir de los cuales una celda esta congestionada
+        self.congestion_threshold = congestion_threshold
+        # Preset de colocacion inicial de los vehiculos (core/placement.py)
+        self.placement = placement
         
-        self.police = Police(self)
-        self.drone = Drone(self)
-        self.cars = [Car(i, self) for i in range(num_cars)]
-        self.motorcycles = [Motorcycle(i, self) for i in range(num_motorcycles)]
-        self.agents = [self.police, self.drone] + self.cars + self.motorcycles
+        # Cada policia y cada dron cubre una region; con una sola unidad, toda la cuadricula (region None).
+        # police y drone son la primera unidad de cada tipo.
+        self.police_regions = RegionGrid(grid_size, num_police)
+        self.drone_regions = RegionGrid(grid_size, num_drones)
+        self.police_units = [Police(self) for _ in range(num_police)]
+        self.drones = [Drone(self) for _ in range(num_drones)]
+        if num_police > 1:
+            for unit, region in zip(self.police_units, self.police_regions.regions):
+                unit.region = region
+        if num_drones > 1:
+            for unit, region in zip(self.drones, self.drone_regions.regions):
+                unit.region = region
+        self.police = self.police_units[0]
+        self.drone = self.drones[0]
+        if engine == 'numpy':
+            self.engine = VectorizedEngine(self, num_cars + num_motorcycles)
+            car_cls, motorcycle_cls = ArrayCar, ArrayMotorcycle
+        else:
+            self.engine = None
+            car_cls, motorcycle_cls = Car, Motorcycle
+        self.cars = [car_cls(i, self) for i in range(num_cars)]
+        self.motorcycles = [motorcycle_cls(i, self) for i in range(num_motorcycles)]
+        # Tablas Q contiguas por tipo de vehiculo; cada agente conserva una vista
+        self.q_tables = {
+            'car': QTableBatch.from_agents(self.cars, Car.STATE_SHAPE, Car.ACTIONS),
+            'motorcycle': QTableBatch.from_agents(self.motorcycles, Motorcycle.STATE_SHAPE, Motorcycle.ACTIONS)
+        }
+        # True mientras las tablas Q sean arreglos de solo lectura compartidos (ver share_q_tables)
+        self.q_tables_shared = False
+        self.learning = True
+        # Nombre de la politica con la que arranco la simulacion (ver core/policy_store.py)
+        self.policy = None
+        if self.engine is not None:
+            for vehicle in self.cars + self.motorcycles:
+                self.engine.register(vehicle)
+        self.agents = self.police_units + self.drones + self.cars + self.motorcycles
+        if self.engine is not None:
+            self.occupancy = ArrayOccupancyIndex(self.engine, grid_size, congestion_threshold)
+        else:
+            self.occupancy = OccupancyIndex(congestion_threshold=congestion_threshold)
+        # Choques, excesos de velocidad y celdas congestionadas vivos; se actualizan al cambiar los vehiculos
+        self.incidents = IncidentIndex(self.occupancy)
         
         self._initialize_positions()
         self.task_completed = False
         self.task_completion_time = None
         self.failed_congestions = 0
         self.current_step = 0
-    
-    def _initialize_positions(self):
-        occupied_positions = []
+
+        # Version por agente: ultimo current_step en el que cambio alguno de sus campos.
         for agent in self.agents:
-            agent.position = generate_random_position(self.grid_size, occupied_positions)
-            occupied_positions.append(agent.position)
+            agent.version = 0
+        self._track_changes()
     
-    def detect_congestion(self):
-        """Celdas con 3 o más vehículos se consideran congestionadas."""
-        position_counts = {}
+    def _initialize_positions(self):
+        # Cada policia y cada dron dentro de su region; despues todos los vehiculos en un solo sorteo
+        occupied = []
+        for unit in self.police_units + self.drones:
+            x, y = place(1, self.grid_size, self.rng, unit.region, exclude=occupied)
+            unit.position = (int(x[0]), int(y[0]))
+            occupied.append(unit.position)
+        vehicles = self.cars + self.motorcycles
+        x, y = place(len(vehicles), self.grid_size, self.rng, preset=self.placement, exclude=occupied)
+        for vehicle, position in zip(vehicles, zip(x.tolist(), y.tolist())):
+            vehicle.position = position
+        self.occupancy.clear()
         for vehicle in self.cars + self.motorcycles:
-            pos = vehicle.position
-            if pos in position_counts:
-                position_counts[pos] += 1
-            else:
-                position_counts[pos] = 1
-        return [list(pos) for pos, count in position_counts.items() if count >= 3]
+            self.occupancy.add(vehicle, vehicle.position)
+
+    def update_position(self, vehicle, old_position, new_position):
+        """Mantiene el indice de ocupacion (y las celdas congestionadas) al mover un vehiculo."""
+        self.occupancy.move(vehicle, old_position, new_position)
+
+    def vehicles_at(self, position):
+        return self.occupancy.vehicles_at(position)
+
+    def count_at(self, position):
+        return self.occupancy.count_at(position)
+    
+    def police_for(self, position):
+        """Policia que vigila la region de la celda."""
+        if len(self.police_units) == 1:
+            return self.police
+        return self.police_units[self.police_regions.index(position)]
+
+    def police_positions(self, x, y):
+        """Posicion (x, y) del policia de la region de cada celda, para arreglos de coordenadas."""
+        return unit_positions(self.police_regions, [unit.position for unit in self.police_units], x, y)
+
+    def drones_for(self, police):
+        """Drones cuyas regiones se cruzan con la del policia; juntas cubren toda la region del policia."""
+        if len(self.drones) == 1:
+            return [self.drone]
+        region = police.region if police.region is not None else (0, 0, self.grid_size - 1, self.grid_size - 1)
+        return [self.drones[index] for index in self.drone_regions.overlapping(region)]
+
+    def collided_vehicles(self, region=None):
+        """Vehiculos con choque activo, en toda la cuadricula o en region = (x0, y0, x1, y1), los mas rapidos primero."""
+        return self.incidents.collisions(region)
+
+    def vehicles_in_region(self, region):
+        """Autos y motos dentro de region = (x0, y0, x1, y1), cada lista ordenada por id."""
+        cars, motorcycles = [], []
+        for vehicle in self.occupancy.vehicles_in_region(*region):
+            (cars if isinstance(vehicle, Car) else motorcycles).append(vehicle)
+        cars.sort(key=lambda vehicle: vehicle.id)
+        motorcycles.sort(key=lambda vehicle: vehicle.id)
+        return cars, motorcycles
+
+    def detect_congestion(self, region=None):
+        """Celdas con congestion_threshold (3 por defecto) o más vehículos se consideran congestionadas; las más llenas primero."""
+        return [list(pos) for pos in self.incidents.congested_cells(region)]
     
     
     def step(self):
-        movement_results = {
-            'cars_moved': 0,
-            'motorcycles_moved': 0,
-            'collisions_detected': 0,
-            'congested_cells': [],
-            'game_over': False,
-            'reason': None,
-            'task_completed': self.task_completed
-        }
+        if self.q_tables_shared and self.learning:
+            self._unshare_q_tables()
+        timer = self.metrics.step_timer(self.engine_name) if self.metrics is not None else None
+        movement_results = self._step(timer)
+        self.current_step += 1
+        self._track_changes()
+        if timer is not None:
+            timer.lap('track_changes')
+            timer.finish()
+        return movement_results
 
+    def _step_vehicles(self, movement_results, phases=NO_PHASE_TOTALS):
+        """Fases de cada vehiculo; `phases` (PhaseTotals) acumula su tiempo cuando hay metricas."""
         for vehicle in (self.cars + self.motorcycles):
             vehicle.accelerate()
+            phases.lap('accelerate')
             old_pos = vehicle.position
             vehicle.move()
             if old_pos != vehicle.position:
@@ -63,55 +196,199 @@ class TrafficSimulation:
                     movement_results['cars_moved'] += 1
                 else:
                     movement_results['motorcycles_moved'] += 1
+            phases.lap('move')
             vehicle.obey_instructions()
+            phases.lap('obey')
+        phases.finish()
+
+    def _step(self, timer=None):
+        movement_results = {
+            'cars_moved': 0,
+            'motorcycles_moved': 0,
+            'collisions_detected': 0,
+            'congested_cells': [],
+            'game_over': False,
+            'reason': None,
+            'task_completed': self.task_completed
+        }
 
-        self.police.step()
+        if self.engine is not None:
+            self.engine.accelerate()
+            if timer is not None:
+                timer.lap('accelerate')
+            self.engine.move(movement_results)
+            if timer is not None:
+                timer.lap('move')
+            self.engine.obey_instructions()
+            if timer is not None:
+                timer.lap('obey')
+        elif timer is None:
+            self._step_vehicles(movement_results)
+        else:
+            self._step_vehicles(movement_results, PhaseTotals(timer, ('accelerate', 'move', 'obey')))
 
-        for vehicle in (self.cars + self.motorcycles):
-            if vehicle.speed > vehicle.speed_limit:
-                self.police.issue_ticket(vehicle)
+        # Cada unidad observa y actua solo en su region
+        for police in self.police_units:
+            police.step()
+        if timer is not None:
+            timer.lap('police')
+
+        if self.engine is not None:
+            self.engine.issue_tickets(self.police_for)
+        else:
+            # Solo los vehiculos con exceso de velocidad y sin multa, el mayor exceso primero
+            for vehicle in self.incidents.offenders():
+                self.police_for(vehicle.position).issue_ticket(vehicle)
+        if timer is not None:
+            timer.lap('tickets')
 
         congested_cells = self.detect_congestion()
         movement_results['congested_cells'] = congested_cells
+        if timer is not None:
+            timer.lap('congestion')
         
         if congested_cells:
-            print(f"¡Aún quedan congestiones en celdas: {congested_cells}!")
             self.police.failed_congestions += 1
-            print(f"Fallos consecutivos: {self.police.failed_congestions}")
+            self.events.emit(
+                'congestion_remaining', self.current_step,
+                cells=congested_cells, failed_congestions=self.police.failed_congestions
+            )
             if self.police.failed_congestions >= 3:
-                print("Simulación terminada: Tres fallos consecutivos en resolver congestiones.")
+                self.events.emit('game_over', self.current_step, reason="Tres fallos consecutivos en resolver congestiones")
                 movement_results['game_over'] = True
                 movement_results['reason'] = "Tres fallos consecutivos en resolver congestiones"
                 return movement_results
         else:
             self.police.failed_congestions = 0
 
-        collisions = [v for v in (self.cars + self.motorcycles) if v.collision]
-        movement_results['collisions_detected'] = len(collisions)
+        if self.engine is not None:
+            # Conteos vectorizados sobre los arreglos: mas baratos que recorrer los incidentes uno por uno
+            collisions_count = self.engine.collision_count()
+            any_overspeed = self.engine.any_overspeed()
+        else:
+            collisions_count = self.incidents.collision_count()
+            any_overspeed = self.incidents.any_overspeed()
+        movement_results['collisions_detected'] = collisions_count
         
-        any_collision = bool(collisions)
-        any_overspeed = any((v.speed > v.speed_limit) for v in (self.cars + self.motorcycles))
+        any_collision = collisions_count > 0
 
         if not any_collision and not any_overspeed:
             if not self.task_completed:
                 self.task_completed = True
                 self.task_completion_time = datetime.now()
                 movement_results['task_completed'] = True
+                self.events.emit('task_completed', self.current_step)
+        if timer is not None:
+            timer.lap('completion')
 
-        self.current_step += 1
         return movement_results
 
+    def _track_changes(self):
+        """Actualiza la version de los agentes que cambiaron en el ultimo paso."""
+        step = self.current_step
+        if self.engine is not None:
+            for slot in self.engine.changed_slots().tolist():
+                self.engine.vehicles[slot].version = step
+            agents = self.police_units + self.drones
+        else:
+            agents = self.agents
+        for agent in agents:
+            fingerprint = agent.fingerprint()
+            if fingerprint != getattr(agent, '_fingerprint', None):
+                agent._fingerprint = fingerprint
+                agent.version = step
+
+    def changed_since(self, agents, since_step):
+        return [agent for agent in agents if agent.version > since_step]
+
+    def met_condition(self, stop_on):
+        """Primera condicion de `stop_on` que la simulacion ya cumple (fin del juego o tarea completada), o None."""
+        met = {'game_over': self.police.failed_congestions >= 3, 'task_completed': self.task_completed}
+        return next((condition for condition in stop_on if met.get(condition)), None)
+
+    def advance(self, steps=1, stop_on=()):
+        """Ejecuta hasta `steps` pasos; se detiene antes si un resultado cumple alguna condicion de `stop_on`.
+
+        Regresa (resultados de cada paso, condicion que lo detuvo o None).
+        """
+        for condition in stop_on:
+            if condition not in STOP_CONDITIONS:
+                raise ValueError(f"Condicion de paro desconocida: {condition}. Opciones: {', '.join(STOP_CONDITIONS)}")
+        results = []
+        for _ in range(steps):
+            result = self.step()
+            results.append(result)
+            for condition in stop_on:
+                if result[condition]:
+                    return results, condition
+        return results, None
+
+    # Estimacion aproximada de memoria por objeto, en bytes
+    AGENT_OVERHEAD = 1200
+    TICKET_OVERHEAD = 150
+    EVENT_OVERHEAD = 400
+
+    def estimated_size(self):
+        """Memoria aproximada de la simulacion en bytes (agentes, tablas Q, multas y eventos)."""
+        # Los arreglos de solo lectura (instantaneas, politicas mapeadas) son compartidos y no se cuentan
+        tables = [unit.q_table for unit in self.police_units] + list(self.q_tables.values())
+        q_bytes = sum(
+            array.nbytes for table in tables for array in (table.values, table.seen, table.visited)
+            if array.flags.writeable
+        )
+        return (
+            len(self.agents) * self.AGENT_OVERHEAD
+            + q_bytes
+            + sum(len(unit.tickets_issued) for unit in self.police_units) * self.TICKET_OVERHEAD
+            + len(self.events.events()) * self.EVENT_OVERHEAD
+        )
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Las vistas de numpy se serializan como copias: volver a ligarlas a los lotes
+        self._link_q_tables()
+
+    def _link_q_tables(self):
+        for agents, batch in ((self.cars, self.q_tables['car']), (self.motorcycles, self.q_tables['motorcycle'])):
+            for i, agent in enumerate(agents):
+                agent.q_table = batch.table(i)
+
+    def share_q_tables(self, q_tables):
+        """Usa lotes de tablas Q ajenos (de solo lectura) sin copiarlos; el primer paso los copia."""
+        self.q_tables = dict(q_tables)
+        self._link_q_tables()
+        self.q_tables_shared = True
+
+    def set_learning(self, enabled):
+        """Activa o congela el aprendizaje de todos los agentes; congelados, las tablas Q no se escriben."""
+        self.learning = enabled
+        for agent in self.police_units + self.cars + self.motorcycles:
+            agent.learning = enabled
+        for unit in self.police_units:
+            if enabled and not unit.q_table.values.flags.writeable:
+                unit.q_table = unit.q_table.copy()
+
+    def _unshare_q_tables(self):
+        self.q_tables = {kind: batch.copy() for kind, batch in self.q_tables.items()}
+        self._link_q_tables()
+        self.q_tables_shared = False
+
+    def close(self):
+        """Libera recursos externos (p. ej. el escritor de eventos)."""
+        self.events.close()
+
     def end(self):
         total_movements = sum(agent.movements for agent in self.agents)
         print("\n--- Resultados Finales ---")
         print(f"Tiempo de completado: {self.task_completion_time if self.task_completion_time else 'No completado'}")
         print(f"Movimientos totales: {total_movements}")
-        print(f"Movimientos del policia: {self.police.movements}")
-        print(f"Multas emitidas: {len(self.police.tickets_issued)}")
-        for (veh, old_s, new_s) in self.police.tickets_issued:
-            print(f" - {type(veh).__name__} multado en {veh.position}: {old_s} -> {new_s}")
-        print(f"Congestiones resueltas (por policía): {self.police.congestion_resolved}")
-        print(f"Solicitudes de dron: {self.police.drone_requests}")
+        print(f"Movimientos del policia: {sum(unit.movements for unit in self.police_units)}")
+        print(f"Multas emitidas: {sum(len(unit.tickets_issued) for unit in self.police_units)}")
+        for unit in self.police_units:
+            for (veh, old_s, new_s) in unit.tickets_issued:
+                print(f" - {type(veh).__name__} multado en {veh.position}: {old_s} -> {new_s}")
+        print(f"Congestiones resueltas (por policía): {sum(unit.congestion_resolved for unit in self.police_units)}")
+        print(f"Solicitudes de dron: {sum(unit.drone_requests for unit in self.police_units)}")
 
     
     def _detect_collisions(self):
@@ -119,28 +396,50 @@ class TrafficSimulation:
         for vehicle in self.cars + self.motorcycles:
             vehicle.collision = False
         
-        all_vehicles = self.cars + self.motorcycles
-        for i, vehicle in enumerate(all_vehicles):
-            for other in all_vehicles[i+1:]:  
-                if vehicle.position == other.position:
+        for position, count in self.occupancy.cell_counts():
+            if count >= 2:
+                for vehicle in self.occupancy.vehicles_at(position):
                     vehicle.collision = True
-                    other.collision = True
+        self.incidents.rebuild(self.cars + self.motorcycles)
     
-    def get_state(self):
+    def get_state(self, since_step=None, region=None):
+        """Estado completo, o con `since_step` solo los agentes que cambiaron despues de ese paso.
+
+        Con `region` = (x0, y0, x1, y1) solo se incluyen los vehiculos y celdas congestionadas de esa region.
+        """
         total_movements = sum(agent.movements for agent in self.agents)
-        return {
+        cars, motorcycles = (self.cars, self.motorcycles) if region is None else self.vehicles_in_region(region)
+        if since_step is None:
+            agents = {
+                "police": self.police.to_dict(),
+                "drone": self.drone.to_dict(),
+                "police_units": [unit.to_dict() for unit in self.police_units],
+                "drones": [unit.to_dict() for unit in self.drones],
+                "cars": [car.to_dict() for car in cars],
+                "motorcycles": [motorcycle.to_dict() for motorcycle in motorcycles]
+            }
+        else:
+            agents = {
+                "police": self.police.to_dict() if self.police.version > since_step else None,
+                "drone": self.drone.to_dict() if self.drone.version > since_step else None,
+                "police_units": [unit.to_dict() for unit in self.changed_since(self.police_units, since_step)],
+                "drones": [unit.to_dict() for unit in self.changed_since(self.drones, since_step)],
+                "cars": [car.to_dict() for car in self.changed_since(cars, since_step)],
+                "motorcycles": [motorcycle.to_dict() for motorcycle in self.changed_since(motorcycles, since_step)]
+            }
+        state = {
             "simulation_id": self.simulation_id,
+            "seed": self.seed,
+            "policy": self.policy,
+            "learning": self.learning,
             "grid": {
-                "size": self.grid_size
+                "size": self.grid_size,
+                "congestion_threshold": self.congestion_threshold,
+                "placement": self.placement
             },
             "current_step": self.current_step,
-            "agents": {
-                "police": self.police.to_dict(),
-                "drone": self.drone.to_dict(),
-                "cars": [car.to_dict() for car in self.cars],
-                "motorcycles": [motorcycle.to_dict() for motorcycle in self.motorcycles]
-            },
-            "congested_cells": self.detect_congestion(),
+            "agents": agents,
+            "congested_cells": self.detect_congestion(region),
             "status": {
                 "task_completed": self.task_completed,
                 "task_completion_time": self.task_completion_time.isoformat() if self.task_completion_time else None,
@@ -149,4 +448,9 @@ class TrafficSimulation:
                 "start_time": self.start_time.isoformat()
             }
         }
+        if region is not None:
+            state["region"] = list(region)
+        if since_step is not None:
+            state["since_step"] = since_step
+        return state
 
@@ -0,0 +1,293 @@
+"""Instantaneas compactas de una TrafficSimulation: guardar, restaurar y bifurcar.
+
+Una instantanea solo contiene datos: columnas numpy con los campos de los
+vehiculos, las tablas Q, las multas como (tipo, id, velocidad original,
+velocidad nueva, unidad de policia) en lugar de referencias a vehiculos, y un diccionario con
+parametros, contadores, paso y estado de los generadores aleatorios.
+restore() crea una simulacion con los mismos parametros y le aplica ese
+estado, asi que continuar una restaurada da los mismos pasos que continuar
+la original.
+
+Las tablas Q de una simulacion restaurada comparten los arreglos (de solo
+lectura) de la instantanea hasta su primer paso; bifurcar en N copias no
+duplica las tablas mientras las copias no avancen.
+"""
+import io
+import json
+import math
+from datetime import datetime
+import numpy as np
+from agents.car import Car
+from agents.motorcycle import Motorcycle
+from agents.police import Police
+from agents.qtable import QTableBatch
+from .simulation import TrafficSimulation, MAX_GRID_SIZE, MAX_CARS, MAX_MOTORCYCLES, MAX_UNITS
+
+SNAPSHOT_VERSION = 2
+# Mismos rangos que acepta /create: una instantanea subida no puede crear una simulacion mas grande
+PARAM_BOUNDS = {
+    'grid_size': (1, MAX_GRID_SIZE),
+    'num_cars': (0, MAX_CARS),
+    'num_motorcycles': (0, MAX_MOTORCYCLES),
+    'num_police': (1, MAX_UNITS),
+    'num_drones': (1, MAX_UNITS)
+}
+VEHICLE_TYPES = (('car', Car), ('motorcycle', Motorcycle))
+VEHICLE_FIELDS = ('speed', 'speed_limit', 'movements', 'ticketed', 'collision', 'version')
+Q_FIELDS = ('values', 'seen', 'visited')
+POLICE_FIELDS = ('speed', 'movements', 'congestion_resolved', 'drone_requests', 'failed_congestions', 'version')
+DRONE_FIELDS = ('speed', 'movements', 'collisions_resolved', 'congestions_resolved', 'version')
+
+
+class Snapshot:
+    """Estado de una simulacion en `meta` (JSON) y `arrays` (numpy, de solo lectura)."""
+
+    def __init__(self, meta, arrays):
+        self.meta = meta
+        self.arrays = arrays
+        for array in arrays.values():
+            array.setflags(write=False)
+
+    @property
+    def current_step(self):
+        return self.meta['current_step']
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def to_bytes(self):
+        """Archivo .npz comprimido; se puede volver a cargar sin pickle."""
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, __meta__=np.array(json.dumps(self.meta)), **self.arrays)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, payload):
+        try:
+            with np.load(io.BytesIO(payload), allow_pickle=False) as data:
+                meta = json.loads(str(data['__meta__']))
+                arrays = {name: data[name] for name in data.files if name != '__meta__'}
+        except (OSError, ValueError, KeyError) as e:
+            raise ValueError(f"Instantanea no valida: {e}")
+        if not isinstance(meta, dict) or meta.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Version de instantanea no soportada: {meta.get('version') if isinstance(meta, dict) else None}")
+        validate(meta, arrays)
+        return cls(meta, arrays)
+
+
+def _expected_arrays(params):
+    """{nombre: (forma, tipo numpy)} de los arreglos que corresponden a `params`."""
+    expected = {}
+    for kind, vehicle_cls in VEHICLE_TYPES:
+        count = params[f'num_{kind}s']
+        num_states = math.prod(vehicle_cls.STATE_SHAPE)
+        for field in ('id', 'x', 'y') + VEHICLE_FIELDS:
+            expected[f'{kind}.{field}'] = ((count,), 'i')
+        expected[f'{kind}.q_values'] = ((count, num_states, len(vehicle_cls.ACTIONS)), 'f')
+        expected[f'{kind}.q_seen'] = ((count, num_states, len(vehicle_cls.ACTIONS)), 'b')
+        expected[f'{kind}.q_visited'] = ((count, num_states), 'b')
+    units = (params['num_police'],)
+    num_states = math.prod(Police.STATE_SHAPE)
+    expected['police.q_values'] = (units + (num_states, len(Police.ACTIONS)), 'f')
+    expected['police.q_seen'] = (units + (num_states, len(Police.ACTIONS)), 'b')
+    expected['police.q_visited'] = (units + (num_states,), 'b')
+    return expected
+
+
+def validate(meta, arrays):
+    """Comprueba que los arreglos correspondan a los parametros de la instantanea; lanza ValueError si no."""
+    try:
+        params = {name: meta['params'][name] for name in PARAM_BOUNDS}
+        police_meta = list(meta['police_units'])
+        drone_meta = list(meta['drones'])
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Parametros de instantanea no validos: {e}")
+    for name, (low, high) in PARAM_BOUNDS.items():
+        if type(params[name]) is not int or not low <= params[name] <= high:
+            raise ValueError(f"Parametro {name} de la instantanea fuera de rango: debe ser un entero entre {low} y {high}")
+    if len(police_meta) != params['num_police'] or len(drone_meta) != params['num_drones']:
+        raise ValueError("El numero de policias o drones no coincide con los parametros")
+
+    expected = _expected_arrays(params)
+    missing = sorted(set(expected) - set(arrays) | ({'tickets'} - set(arrays)))
+    if missing:
+        raise ValueError(f"Faltan arreglos en la instantanea: {', '.join(missing)}")
+    for name, (shape, dtype_kind) in expected.items():
+        array = arrays[name]
+        if array.shape != shape or array.dtype.kind != dtype_kind:
+            raise ValueError(
+                f"Arreglo {name} no valido: se esperaba forma {shape} de tipo '{dtype_kind}', "
+                f"llego {array.shape} de tipo '{array.dtype.kind}'"
+            )
+
+    grid_size = params['grid_size']
+    ids = {}
+    for kind, _ in VEHICLE_TYPES:
+        for axis in ('x', 'y'):
+            values = arrays[f'{kind}.{axis}']
+            if len(values) and (values.min() < 0 or values.max() >= grid_size):
+                raise ValueError(f"Posiciones de {kind} fuera de la cuadricula de {grid_size}x{grid_size}")
+        kind_ids = arrays[f'{kind}.id']
+        if len(np.unique(kind_ids)) != len(kind_ids):
+            raise ValueError(f"IDs de {kind} repetidos")
+        ids[kind] = kind_ids
+
+    tickets = arrays['tickets']
+    if tickets.ndim != 2 or tickets.shape[1] != 5 or tickets.dtype.kind != 'i':
+        raise ValueError(f"Arreglo tickets no valido: se esperaba forma (n, 5) de enteros, llego {tickets.shape}")
+    if len(tickets):
+        kinds = tickets[:, 0]
+        if not np.isin(kinds, (0, 1)).all():
+            raise ValueError("Tipo de vehiculo desconocido en tickets")
+        for code, (kind, _) in enumerate(VEHICLE_TYPES):
+            if not np.isin(tickets[kinds == code, 1], ids[kind]).all():
+                raise ValueError(f"Hay multas para {kind}s que no estan en la instantanea")
+        if tickets[:, 4].min() < 0 or tickets[:, 4].max() >= params['num_police']:
+            raise ValueError("Indice de policia fuera de rango en tickets")
+
+
+def snapshot(simulation):
+    """Copia el estado actual de la simulacion a una Snapshot."""
+    arrays = {}
+    vehicle_kinds = {}
+    for kind, vehicle_cls in VEHICLE_TYPES:
+        vehicles = getattr(simulation, f"{kind}s")
+        positions = np.array([vehicle.position for vehicle in vehicles], dtype=np.int64).reshape(-1, 2)
+        arrays[f'{kind}.id'] = np.array([vehicle.id for vehicle in vehicles], dtype=np.int64)
+        arrays[f'{kind}.x'] = positions[:, 0].copy()
+        arrays[f'{kind}.y'] = positions[:, 1].copy()
+        for field in VEHICLE_FIELDS:
+            arrays[f'{kind}.{field}'] = np.array([getattr(vehicle, field) for vehicle in vehicles], dtype=np.int64)
+        batch = simulation.q_tables[kind]
+        for field in Q_FIELDS:
+            array = getattr(batch, field)
+            # Tablas aun compartidas con otra instantanea: ya son de solo lectura, no copiarlas
+            arrays[f'{kind}.q_{field}'] = array if not array.flags.writeable else array.copy()
+        for vehicle in vehicles:
+            vehicle_kinds[id(vehicle)] = kind
+
+    units = simulation.police_units
+    for field in Q_FIELDS:
+        arrays[f'police.q_{field}'] = np.stack([getattr(unit.q_table, field) for unit in units])
+    tickets = [
+        (0 if vehicle_kinds[id(vehicle)] == 'car' else 1, vehicle.id, original_speed, new_speed, unit_index)
+        for unit_index, unit in enumerate(units)
+        for vehicle, original_speed, new_speed in unit.tickets_issued
+    ]
+    arrays['tickets'] = np.array(tickets, dtype=np.int64).reshape(-1, 5)
+
+    rng_version, rng_internal, rng_gauss = simulation.rng.getstate()
+    meta = {
+        'version': SNAPSHOT_VERSION,
+        'params': {
+            'grid_size': simulation.grid_size,
+            'num_cars': len(simulation.cars),
+            'num_motorcycles': len(simulation.motorcycles),
+            'engine': simulation.engine_name,
+            'seed': simulation.seed,
+            'num_police': len(units),
+            'num_drones': len(simulation.drones),
+            'congestion_threshold': simulation.congestion_threshold,
+            'placement': simulation.placement
+        },
+        'source_id': simulation.simulation_id,
+        'current_step': simulation.current_step,
+        'start_time': simulation.start_time.isoformat(),
+        'task_completed': simulation.task_completed,
+        'task_completion_time': simulation.task_completion_time.isoformat() if simulation.task_completion_time else None,
+        'failed_congestions': simulation.failed_congestions,
+        'policy': simulation.policy,
+        'learning': simulation.learning,
+        'police_units': [
+            {'position': list(unit.position), **{field: getattr(unit, field) for field in POLICE_FIELDS}}
+            for unit in units
+        ],
+        'drones': [
+            {'position': list(drone.position), **{field: getattr(drone, field) for field in DRONE_FIELDS}}
+            for drone in simulation.drones
+        ],
+        'rng': [rng_version, list(rng_internal), rng_gauss],
+        'np_rng': simulation.np_rng.bit_generator.state
+    }
+    return Snapshot(meta, arrays)
+
+
+def restore(snap, simulation_id, events=None, metrics=None):
+    """Crea una simulacion nueva con el estado de la instantanea."""
+    meta = snap.meta
+    arrays = snap.arrays
+    simulation = TrafficSimulation(simulation_id=simulation_id, events=events, metrics=metrics, **meta['params'])
+
+    by_kind = {}
+    for kind, vehicle_cls in VEHICLE_TYPES:
+        vehicles = getattr(simulation, f"{kind}s")
+        columns = {field: arrays[f'{kind}.{field}'].tolist() for field in ('id', 'x', 'y') + VEHICLE_FIELDS}
+        for i, vehicle in enumerate(vehicles):
+            vehicle.id = columns['id'][i]
+            vehicle.position = (columns['x'][i], columns['y'][i])
+            vehicle.speed = columns['speed'][i]
+            vehicle.speed_limit = columns['speed_limit'][i]
+            vehicle.movements = columns['movements'][i]
+            vehicle.ticketed = bool(columns['ticketed'][i])
+            vehicle.collision = bool(columns['collision'][i])
+            vehicle.version = columns['version'][i]
+            if simulation.engine is not None:
+                simulation.engine.arrays.ids[vehicle._slot] = vehicle.id
+        by_kind[kind] = {vehicle.id: vehicle for vehicle in vehicles}
+    simulation.share_q_tables({
+        kind: QTableBatch.from_arrays(
+            *(arrays[f'{kind}.q_{field}'] for field in Q_FIELDS), vehicle_cls.STATE_SHAPE, vehicle_cls.ACTIONS
+        )
+        for kind, vehicle_cls in VEHICLE_TYPES
+    })
+    simulation.occupancy.clear()
+    for vehicle in simulation.cars + simulation.motorcycles:
+        simulation.occupancy.add(vehicle, vehicle.position)
+    simulation.incidents.rebuild(simulation.cars + simulation.motorcycles)
+
+    for index, (unit, unit_meta) in enumerate(zip(simulation.police_units, meta['police_units'])):
+        unit.position = tuple(unit_meta['position'])
+        for field in POLICE_FIELDS:
+            setattr(unit, field, unit_meta[field])
+        for field in Q_FIELDS:
+            array = arrays[f'police.q_{field}']
+            getattr(unit.q_table, field)[...] = array[index]
+        unit.tickets_issued = []
+    for kind, vehicle_id, original_speed, new_speed, unit_index in arrays['tickets'].tolist():
+        simulation.police_units[unit_index].tickets_issued.append(
+            (by_kind['car' if kind == 0 else 'motorcycle'][vehicle_id], original_speed, new_speed)
+        )
+    for drone, drone_meta in zip(simulation.drones, meta['drones']):
+        drone.position = tuple(drone_meta['position'])
+        for field in DRONE_FIELDS:
+            setattr(drone, field, drone_meta[field])
+
+    simulation.current_step = meta['current_step']
+    simulation.start_time = datetime.fromisoformat(meta['start_time'])
+    simulation.task_completed = meta['task_completed']
+    completion = meta['task_completion_time']
+    simulation.task_completion_time = datetime.fromisoformat(completion) if completion else None
+    simulation.failed_congestions = meta['failed_congestions']
+    simulation.policy = meta['policy']
+    simulation.set_learning(meta['learning'])
+
+    rng_version, rng_internal, rng_gauss = meta['rng']
+    simulation.rng.setstate((rng_version, tuple(rng_internal), rng_gauss))
+    simulation.np_rng.bit_generator.state = meta['np_rng']
+
+    # Tomar el estado restaurado como linea base de cambios, sin alterar las versiones guardadas
+    for agent in simulation.agents:
+        agent._fingerprint = agent.fingerprint()
+    if simulation.engine is not None:
+        simulation.engine.changed_slots()
+    return simulation
+
+
+def fork(simulation, simulation_ids, events_factory=None):
+    """Crea una copia de la simulacion por cada id; las copias comparten las tablas Q hasta avanzar."""
+    snap = snapshot(simulation)
+    return [
+        restore(snap, simulation_id, events_factory(simulation_id) if events_factory else None, simulation.metrics)
+        for simulation_id in simulation_ids
+    ]
@@ -0,0 +1,167 @@
+import bisect
+import math
+import numpy as np
+
+TILE_SIZE = 64
+# Vehiculos a partir de los cuales una celda se considera congestionada
+CONGESTION_THRESHOLD = 3
+
+
+class OccupancyIndex:
+    """Indice celda -> vehiculos que la ocupan.
+
+    Cada celda guarda un dict usado como conjunto ordenado, de modo que
+    agregar, quitar y mover un vehiculo son operaciones O(1) y el orden de
+    iteracion es estable entre corridas.
+
+    Solo se guardan las celdas ocupadas, agrupadas ademas en mosaicos de
+    `tile_size` x `tile_size`: la memoria depende del numero de vehiculos y
+    no del area de la cuadricula, y una consulta por region solo recorre los
+    mosaicos que la cruzan.
+
+    El numero de vehiculos de cada celda es el tamano de su conjunto, y las
+    celdas con `congestion_threshold` o mas vehiculos se mantienen en otro
+    conjunto al agregar y quitar: leer las celdas congestionadas no recorre
+    las celdas ocupadas.
+    """
+
+    def __init__(self, tile_size=TILE_SIZE, congestion_threshold=CONGESTION_THRESHOLD):
+        self.tile_size = tile_size
+        self.congestion_threshold = congestion_threshold
+        self._cells = {}
+        # (tx, ty) -> celdas ocupadas del mosaico, tambien como conjunto ordenado
+        self._tiles = {}
+        self._congested = {}
+
+    def _tile(self, position):
+        return (position[0] // self.tile_size, position[1] // self.tile_size)
+
+    def add(self, vehicle, position):
+        cell = self._cells.get(position)
+        if cell is None:
+            cell = self._cells[position] = {}
+            tile = self._tile(position)
+            cells = self._tiles.get(tile)
+            if cells is None:
+                cells = self._tiles[tile] = {}
+            cells[position] = None
+        cell[vehicle] = None
+        if len(cell) == self.congestion_threshold:
+            self._congested[position] = None
+
+    def remove(self, vehicle, position):
+        cell = self._cells.get(position)
+        if cell is None:
+            return
+        cell.pop(vehicle, None)
+        if len(cell) == self.congestion_threshold - 1:
+            self._congested.pop(position, None)
+        if not cell:
+            del self._cells[position]
+            tile = self._tile(position)
+            cells = self._tiles[tile]
+            del cells[position]
+            if not cells:
+                del self._tiles[tile]
+
+    def move(self, vehicle, old_position, new_position):
+        if old_position == new_position:
+            return
+        self.remove(vehicle, old_position)
+        self.add(vehicle, new_position)
+
+    def vehicles_at(self, position):
+        """Vehiculos en la celda; regresa una lista nueva para poder mutar mientras se itera."""
+        cell = self._cells.get(tuple(position))
+        return list(cell) if cell else []
+
+    def count_at(self, position):
+        cell = self._cells.get(tuple(position))
+        return len(cell) if cell else 0
+
+    def occupied_cells(self):
+        return self._cells.keys()
+
+    def cell_counts(self):
+        return ((position, len(cell)) for position, cell in self._cells.items())
+
+    def congested_cells(self, region=None):
+        """Celdas con congestion_threshold o mas vehiculos, en toda la cuadricula o en region = (x0, y0, x1, y1)."""
+        if region is None:
+            return list(self._congested)
+        x0, y0, x1, y1 = region
+        return [position for position in self._congested if x0 <= position[0] <= x1 and y0 <= position[1] <= y1]
+
+    def cells_in_region(self, x0, y0, x1, y1):
+        """Celdas ocupadas con x0 <= x <= x1 y y0 <= y <= y1 (ninguna si la region esta vacia)."""
+        if x0 > x1 or y0 > y1:
+            return
+        size = self.tile_size
+        tx0, ty0, tx1, ty1 = x0 // size, y0 // size, x1 // size, y1 // size
+        if (tx1 - tx0 + 1) * (ty1 - ty0 + 1) <= len(self._tiles):
+            tiles = (
+                self._tiles.get((tx, ty)) for tx in range(tx0, tx1 + 1) for ty in range(ty0, ty1 + 1)
+            )
+        else:
+            # Region mas grande que los mosaicos ocupados: recorrer solo estos
+            tiles = (
+                cells for (tx, ty), cells in self._tiles.items() if tx0 <= tx <= tx1 and ty0 <= ty <= ty1
+            )
+        for cells in tiles:
+            if not cells:
+                continue
+            for position in cells:
+                if x0 <= position[0] <= x1 and y0 <= position[1] <= y1:
+                    yield position
+
+    def vehicles_in_region(self, x0, y0, x1, y1):
+        return [vehicle for position in self.cells_in_region(x0, y0, x1, y1) for vehicle in self._cells[position]]
+
+    def clear(self):
+        self._cells.clear()
+        self._tiles.clear()
+        self._congested.clear()
+
+
+def tiling(count):
+    """(cols, rows) con cols * rows == count y lo mas cuadrado posible."""
+    rows = max(d for d in range(1, math.isqrt(count) + 1) if count % d == 0)
+    return count // rows, rows
+
+
+class RegionGrid:
+    """Reparte la cuadricula en `count` regiones rectangulares (cols x rows) y ubica a que region pertenece una celda.
+
+    Las regiones se numeran por columna: la region de (x, y) es col * rows + row.
+    """
+
+    def __init__(self, grid_size, count):
+        self.cols, self.rows = tiling(count)
+        if grid_size < max(self.cols, self.rows):
+            raise ValueError(
+                f"Una cuadricula de {grid_size}x{grid_size} no se puede dividir en {self.cols}x{self.rows} regiones"
+            )
+        # Bordes: la columna i cubre xs[i] <= x < xs[i + 1]
+        self.xs = np.linspace(0, grid_size, self.cols + 1).round().astype(np.int64).tolist()
+        self.ys = np.linspace(0, grid_size, self.rows + 1).round().astype(np.int64).tolist()
+        self.regions = [
+            (self.xs[col], self.ys[row], self.xs[col + 1] - 1, self.ys[row + 1] - 1)
+            for col in range(self.cols) for row in range(self.rows)
+        ]
+
+    def __len__(self):
+        return len(self.regions)
+
+    def index(self, position):
+        return (bisect.bisect_right(self.xs, position[0]) - 1) * self.rows + bisect.bisect_right(self.ys, position[1]) - 1
+
+    def overlapping(self, region):
+        """Indices de las regiones que se cruzan con region = (x0, y0, x1, y1)."""
+        x0, y0, x1, y1 = region
+        cols = range(bisect.bisect_right(self.xs, x0) - 1, bisect.bisect_right(self.xs, x1))
+        rows = range(bisect.bisect_right(self.ys, y0) - 1, bisect.bisect_right(self.ys, y1))
+        return [col * self.rows + row for col in cols for row in rows if col < self.cols and row < self.rows]
+
+    def indices(self, x, y):
+        """index() para arreglos de coordenadas."""
+        return (np.searchsorted(self.xs, x, 'right') - 1) * self.rows + np.searchsorted(self.ys, y, 'right') - 1
@@ -0,0 +1,415 @@
+import numpy as np
+from agents.car import Car
+from agents.motorcycle import Motorcycle
+from .spatial import CONGESTION_THRESHOLD
+
+# Mismo orden que Vehicle.move: izquierda, derecha, abajo, arriba
+DIRECTIONS = np.array([(-1, 0), (1, 0), (0, -1), (0, 1)], dtype=np.int64)
+
+
+# Reglas de los vehiculos sobre arreglos. Las usan VectorizedEngine (todos los
+# vehiculos en un proceso) y los mosaicos de core/sharded.py (los vehiculos de
+# un mosaico); los arreglos se modifican en su lugar.
+
+def accelerate_all(speed, rng):
+    """Vehicle.accelerate por lotes: con probabilidad 0.7 sube de 1 a 3, hasta 10."""
+    n = len(speed)
+    speed += np.where(rng.random(n) < 0.7, rng.integers(1, 4, n), 0)
+    np.minimum(speed, 10, out=speed)
+
+
+def move_all(x, y, speed, movements, grid_size, rng):
+    """Vehicle.move por lotes; regresa (vehiculos con velocidad, vehiculos que cambiaron de celda)."""
+    n = len(speed)
+    moving = speed > 0
+    direction = DIRECTIONS[rng.integers(0, 4, n)]
+    steps = rng.integers(1, np.maximum(speed, 1) + 1) * moving
+    old_x = x.copy()
+    old_y = y.copy()
+    np.clip(old_x + direction[:, 0] * steps, 0, grid_size - 1, out=x)
+    np.clip(old_y + direction[:, 1] * steps, 0, grid_size - 1, out=y)
+    movements += moving
+    return moving, (x != old_x) | (y != old_y)
+
+
+def collided(inverse, counts, moving):
+    """Choques: vehiculos en una celda con otro vehiculo donde alguno se movio.
+
+    `inverse` es la celda de cada vehiculo y `counts` los vehiculos de cada
+    celda; regresa (vehiculos en la celda de cada vehiculo, mascara de choques).
+    """
+    movers = np.bincount(inverse, weights=moving, minlength=len(counts))
+    cell_counts = counts[inverse]
+    return cell_counts, (cell_counts >= 2) & (movers[inverse] > 0)
+
+
+def unit_positions(regions, positions, x, y):
+    """Posicion de la unidad (policia) de la region de cada celda; `positions` va en el orden de las regiones."""
+    if len(positions) == 1:
+        return positions[0]
+    positions = np.asarray(positions, dtype=np.int64)
+    units = regions.indices(x, y)
+    return positions[units, 0], positions[units, 1]
+
+
+def encode_states(batch, x, y, speed, cell_counts, police_position, congestion_threshold):
+    """Car.get_state / Motorcycle.get_state por lotes, ya codificado; `police_position` como en unit_positions."""
+    police_x, police_y = police_position
+    speed_level = np.minimum(speed // 2, 3)
+    near_police = (np.abs(x - police_x) + np.abs(y - police_y) <= 2).astype(np.int64)
+    congested = (cell_counts >= congestion_threshold).astype(np.int64)
+    return batch.encode(speed_level, near_police, congested)
+
+
+def obey_all(batch, params, speed, speed_limit, collision, ticketed, states, rng, learning):
+    """obey_instructions por lotes para los vehiculos de un tipo.
+
+    `states(speed)` codifica el estado de cada vehiculo con esas velocidades;
+    `params` es un agente del tipo (alpha, gamma, epsilon). Regresa los
+    indices que aceleraron sin estar antes sobre su limite.
+    """
+    state = states(speed)
+    action = batch.choose_actions(state, params.epsilon, rng)
+
+    accelerate = np.flatnonzero(action == batch.actions.index("accelerate"))
+    boost = np.where(rng.random(len(accelerate)) < 0.7, rng.integers(1, 4, len(accelerate)), 0)
+    was_over = speed[accelerate] > speed_limit[accelerate]
+    speed[accelerate] = np.minimum(speed[accelerate] + boost, 10)
+
+    decelerate = np.flatnonzero(action == batch.actions.index("decelerate"))
+    brake = rng.random(len(decelerate)) < 0.5
+    speed[decelerate] = np.maximum(speed[decelerate] - brake, 0)
+
+    reward = (
+        -10 * collision
+        - 5 * ((speed > speed_limit) & ticketed)
+        + (~collision & ~ticketed)
+    )
+    if learning:
+        batch.update(state, action, reward, states(speed), params.alpha, params.gamma)
+    return accelerate[~was_over]
+
+
+def ticket_all(speed, speed_limit, ticketed, rng):
+    """Police.issue_ticket por lotes, el mayor exceso de velocidad primero; regresa (indices multados, velocidades originales)."""
+    slots = np.flatnonzero((speed > speed_limit) & ~ticketed)
+    slots = slots[np.argsort(speed_limit[slots] - speed[slots], kind='stable')]
+    original = speed[slots].copy()
+    if len(slots):
+        reduce = rng.random(len(slots)) < 0.7
+        speed[slots] = np.where(reduce, np.maximum(original - 2, 2), original)
+        ticketed[slots] = True
+    return slots, original
+
+
+class VehicleArrays:
+    """Estado de todos los vehiculos como struct-of-arrays (un indice por vehiculo)."""
+
+    def __init__(self, capacity):
+        self.size = 0
+        self.x = np.zeros(capacity, dtype=np.int64)
+        self.y = np.zeros(capacity, dtype=np.int64)
+        self.speed = np.zeros(capacity, dtype=np.int64)
+        self.speed_limit = np.zeros(capacity, dtype=np.int64)
+        self.movements = np.zeros(capacity, dtype=np.int64)
+        self.ticketed = np.zeros(capacity, dtype=bool)
+        self.collision = np.zeros(capacity, dtype=bool)
+        self.is_car = np.zeros(capacity, dtype=bool)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+
+    def allocate(self):
+        slot = self.size
+        self.size += 1
+        return slot
+
+
+class ArrayBackedVehicle:
+    """Mixin que convierte un vehiculo en una vista sobre VehicleArrays.
+
+    Los campos que el motor vectorizado modifica se leen y escriben en los
+    arreglos; el resto del agente (Q-Learning, to_dict, etc.) no cambia.
+    """
+
+    def __init__(self, vehicle_id, model):
+        self._arrays = model.engine.arrays
+        self._slot = self._arrays.allocate()
+        self._arrays.is_car[self._slot] = isinstance(self, Car)
+        self._arrays.ids[self._slot] = vehicle_id
+        super().__init__(vehicle_id, model)
+
+    @property
+    def position(self):
+        return (int(self._arrays.x[self._slot]), int(self._arrays.y[self._slot]))
+
+    @position.setter
+    def position(self, value):
+        self._arrays.x[self._slot], self._arrays.y[self._slot] = value
+
+    @property
+    def speed(self):
+        return int(self._arrays.speed[self._slot])
+
+    @speed.setter
+    def speed(self, value):
+        self._arrays.speed[self._slot] = value
+
+    @property
+    def speed_limit(self):
+        return int(self._arrays.speed_limit[self._slot])
+
+    @speed_limit.setter
+    def speed_limit(self, value):
+        self._arrays.speed_limit[self._slot] = value
+
+    @property
+    def movements(self):
+        return int(self._arrays.movements[self._slot])
+
+    @movements.setter
+    def movements(self, value):
+        self._arrays.movements[self._slot] = value
+
+    @property
+    def ticketed(self):
+        return bool(self._arrays.ticketed[self._slot])
+
+    @ticketed.setter
+    def ticketed(self, value):
+        self._arrays.ticketed[self._slot] = value
+
+    @property
+    def collision(self):
+        return bool(self._arrays.collision[self._slot])
+
+    @collision.setter
+    def collision(self, value):
+        self._arrays.collision[self._slot] = value
+
+
+class ArrayCar(ArrayBackedVehicle, Car):
+    pass
+
+
+class ArrayMotorcycle(ArrayBackedVehicle, Motorcycle):
+    pass
+
+
+class ArrayOccupancyIndex:
+    """OccupancyIndex del motor vectorizado, reconstruido de una vez desde los arreglos de posiciones.
+
+    Cada celda se identifica como x * grid_size + y. rebuild() ordena esos
+    identificadores y guarda las celdas ocupadas (ordenadas), cuantos
+    vehiculos hay en cada una y los indices de vehiculo agrupados por celda;
+    las consultas son busquedas binarias sobre esos arreglos.
+
+    Las posiciones ya viven en VehicleArrays, asi que add/remove/move/clear
+    solo marcan el indice como desactualizado y la siguiente consulta lo
+    reconstruye. VectorizedEngine.move lo reconstruye despues de mover a
+    todos los vehiculos, sin tocar un diccionario por vehiculo.
+    """
+
+    def __init__(self, engine, grid_size, congestion_threshold=CONGESTION_THRESHOLD):
+        self.engine = engine
+        self.grid_size = grid_size
+        self.congestion_threshold = congestion_threshold
+        empty = np.zeros(0, dtype=np.int64)
+        # cells[i] tiene counts[i] vehiculos: order[starts[i]:starts[i] + counts[i]]; inverse[slot] es la celda de cada vehiculo
+        self.cells = self.counts = self.starts = self.order = self.inverse = self._congested = empty
+        self._stale = True
+
+    def rebuild(self):
+        a = self.engine.arrays
+        n = a.size
+        ids = a.x[:n] * self.grid_size + a.y[:n]
+        order = np.argsort(ids, kind='stable')
+        sorted_ids = ids[order]
+        first = np.ones(n, dtype=bool)
+        np.not_equal(sorted_ids[1:], sorted_ids[:-1], out=first[1:])
+        self.starts = np.flatnonzero(first)
+        self.cells = sorted_ids[self.starts]
+        self.counts = np.diff(np.append(self.starts, n))
+        self.order = order
+        self.inverse = np.empty(n, dtype=np.int64)
+        self.inverse[order] = np.cumsum(first) - 1
+        self._congested = self.cells[self.counts >= self.congestion_threshold]
+        self._stale = False
+
+    def _refresh(self):
+        if self._stale:
+            self.rebuild()
+
+    def add(self, vehicle, position):
+        self._stale = True
+
+    def remove(self, vehicle, position):
+        self._stale = True
+
+    def move(self, vehicle, old_position, new_position):
+        self._stale = True
+
+    def clear(self):
+        self._stale = True
+
+    def _find(self, position):
+        """Indice de la celda en `cells`, o -1 si no hay vehiculos en ella."""
+        self._refresh()
+        cell = position[0] * self.grid_size + position[1]
+        i = int(np.searchsorted(self.cells, cell))
+        return i if i < len(self.cells) and self.cells[i] == cell else -1
+
+    def _positions(self, cells):
+        x, y = np.divmod(cells, self.grid_size)
+        return list(zip(x.tolist(), y.tolist()))
+
+    def _in_region(self, cells, x0, y0, x1, y1):
+        x, y = np.divmod(cells, self.grid_size)
+        return cells[(x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)]
+
+    def vehicles_at(self, position):
+        i = self._find(position)
+        if i < 0:
+            return []
+        start = self.starts[i]
+        vehicles = self.engine.vehicles
+        return [vehicles[slot] for slot in self.order[start:start + self.counts[i]].tolist()]
+
+    def count_at(self, position):
+        i = self._find(position)
+        return int(self.counts[i]) if i >= 0 else 0
+
+    def occupied_cells(self):
+        self._refresh()
+        return self._positions(self.cells)
+
+    def cell_counts(self):
+        self._refresh()
+        return zip(self._positions(self.cells), self.counts.tolist())
+
+    def congested_cells(self, region=None):
+        """Celdas con congestion_threshold o mas vehiculos, en toda la cuadricula o en region = (x0, y0, x1, y1)."""
+        self._refresh()
+        cells = self._congested if region is None else self._in_region(self._congested, *region)
+        return self._positions(cells)
+
+    def cells_in_region(self, x0, y0, x1, y1):
+        self._refresh()
+        return iter(self._positions(self._in_region(self.cells, x0, y0, x1, y1)))
+
+    def vehicles_in_region(self, x0, y0, x1, y1):
+        a = self.engine.arrays
+        x, y = a.x[:a.size], a.y[:a.size]
+        slots = np.flatnonzero((x >= x0) & (x <= x1) & (y >= y0) & (y <= y1))
+        vehicles = self.engine.vehicles
+        return [vehicles[slot] for slot in slots.tolist()]
+
+
+class VectorizedEngine:
+    """Ejecuta las fases de vehiculos de TrafficSimulation.step como operaciones por lotes.
+
+    A diferencia del motor de Python, todos los vehiculos aceleran y se mueven
+    a la vez; un vehiculo choca si termina en una celda con otro vehiculo y
+    alguno de los dos se movio en este paso.
+    """
+
+    def __init__(self, model, capacity):
+        self.model = model
+        self.arrays = VehicleArrays(capacity)
+        self.vehicles = []
+        self.rng = model.np_rng
+        self.cell_counts = np.zeros(0, dtype=np.int64)
+        self._previous_fields = None
+
+    def register(self, vehicle):
+        self.vehicles.append(vehicle)
+
+    def accelerate(self):
+        a = self.arrays
+        n = a.size
+        was_over = a.speed[:n] > a.speed_limit[:n]
+        accelerate_all(a.speed[:n], self.rng)
+        self.report_overspeed(np.flatnonzero(~was_over))
+
+    def move(self, movement_results):
+        a = self.arrays
+        n = a.size
+        moving, moved = move_all(a.x[:n], a.y[:n], a.speed[:n], a.movements[:n], self.model.grid_size, self.rng)
+        cars_moved = int(np.count_nonzero(moved & a.is_car[:n]))
+        movement_results['cars_moved'] += cars_moved
+        movement_results['motorcycles_moved'] += int(np.count_nonzero(moved)) - cars_moved
+
+        self.detect_collisions(moving)
+
+    def detect_collisions(self, moving):
+        a = self.arrays
+        n = a.size
+        if n == 0:
+            return
+        # Los mismos grupos por celda del indice de ocupacion, reconstruido en bloque tras mover
+        occupancy = self.model.occupancy
+        occupancy.rebuild()
+        self.cell_counts, hit = collided(occupancy.inverse, occupancy.counts, moving)
+        incidents = self.model.incidents
+        for slot in np.flatnonzero(hit & ~a.collision[:n]).tolist():
+            incidents.collision(self.vehicles[slot])
+        a.collision[:n] |= hit
+
+    def report_overspeed(self, slots):
+        """Registra como incidentes los vehiculos de `slots` que quedaron sobre su limite."""
+        a = self.arrays
+        incidents = self.model.incidents
+        for slot in slots[a.speed[slots] > a.speed_limit[slots]].tolist():
+            incidents.overspeed(self.vehicles[slot])
+
+    def vehicle_states(self, batch, slots, speed):
+        """Estados codificados de los vehiculos `slots` con las velocidades `speed`."""
+        a = self.arrays
+        x, y = a.x[slots], a.y[slots]
+        police_position = self.model.police_positions(x, y)
+        return encode_states(batch, x, y, speed, self.cell_counts[slots], police_position, self.model.congestion_threshold)
+
+    def obey_instructions(self):
+        """obey_instructions (obey_all) para cada tipo de vehiculo."""
+        a = self.arrays
+        n = a.size
+        groups = (
+            (self.model.q_tables['car'], np.flatnonzero(a.is_car[:n]), self.model.cars),
+            (self.model.q_tables['motorcycle'], np.flatnonzero(~a.is_car[:n]), self.model.motorcycles)
+        )
+        for batch, slots, vehicles in groups:
+            if not len(slots):
+                continue
+            params = vehicles[0]
+            speed = a.speed[slots]
+            accelerated = obey_all(
+                batch, params, speed, a.speed_limit[slots], a.collision[slots], a.ticketed[slots],
+                lambda speed: self.vehicle_states(batch, slots, speed), self.rng, params.learning
+            )
+            a.speed[slots] = speed
+            self.report_overspeed(slots[accelerated])
+
+    def issue_tickets(self, police_for):
+        """Multa a los vehiculos con exceso de velocidad; police_for(posicion) da el policia que registra cada multa."""
+        a = self.arrays
+        n = a.size
+        slots, original = ticket_all(a.speed[:n], a.speed_limit[:n], a.ticketed[:n], self.rng)
+        for slot, old_speed, new_speed in zip(slots.tolist(), original.tolist(), a.speed[slots].tolist()):
+            vehicle = self.vehicles[slot]
+            police_for(vehicle.position).register_ticket(vehicle, old_speed, new_speed)
+
+    def changed_slots(self):
+        """Indices de vehiculos cuyos campos cambiaron desde la llamada anterior."""
+        a = self.arrays
+        n = a.size
+        current = np.stack((a.x[:n], a.y[:n], a.speed[:n], a.movements[:n], a.ticketed[:n], a.collision[:n]))
+        previous = self._previous_fields
+        self._previous_fields = current
+        if previous is None:
+            return np.arange(n)
+        return np.flatnonzero((current != previous).any(axis=0))
+
+    def collision_count(self):
+        return int(np.count_nonzero(self.arrays.collision[:self.arrays.size]))
+
+    def any_overspeed(self):
+        a = self.arrays
+        return bool(np.any(a.speed[:a.size] > a.speed_limit[:a.size]))
@@ -0,0 +1,56 @@
+# Servidor de produccion: la misma API de app.py como aplicacion ASGI sobre uvicorn,
+# sin modo debug ni recargador.
+#
+#   python serve.py --host 0.0.0.0 --port 8000 --threads 64
+#
+# Siempre corre en un solo proceso: las simulaciones viven en la memoria del
+# proceso, y varios procesos de uvicorn detras del mismo socket no pueden
+# enviar cada simulacion al proceso que la creo. Se escala con --threads; las
+# peticiones comparten el GIL, asi que para repartir el calculo de una
+# simulacion grande entre nucleos se usa "shards" al crearla.
+
+import argparse
+import os
+
+from app import create_app
+from api.asgi import WSGIToASGI
+
+
+def create_asgi_app():
+    """Fabrica de la aplicacion ASGI (uvicorn la llama una vez por proceso)."""
+    app, _ = create_app()
+    return WSGIToASGI(app, max_workers=int(os.environ.get('TRAFFIC_ASGI_THREADS', 64)))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Servir la API de simulacion con uvicorn')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--threads', type=int, default=None,
+                        help='Hilos por proceso para atender peticiones (por defecto TRAFFIC_ASGI_THREADS o 64)')
+    parser.add_argument('--log-level', default='warning')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("serve.py requiere uvicorn: pip install uvicorn")
+    if args.threads is not None:
+        os.environ['TRAFFIC_ASGI_THREADS'] = str(args.threads)
+    uvicorn.run(
+        'serve:create_asgi_app',
+        factory=True,
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        host=args.host,
+        port=args.port,
+        workers=1,
+        log_level=args.log_level,
+        access_log=False
+    )
+
+
+if __name__ == '__main__':
+    main()
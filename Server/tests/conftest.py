@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los modulos del servidor se importan como paquetes de primer nivel (core, agents, api)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
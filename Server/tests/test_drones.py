@@ -0,0 +1,39 @@
+from core.simulation import TrafficSimulation
+
+
+def move_to(simulation, vehicle, position):
+    simulation.update_position(vehicle, vehicle.position, position)
+    vehicle.position = position
+
+
+def test_police_call_reaches_every_overlapping_drone():
+    # 2 policias (x 0-4 y 5-9) y 3 drones (x 0-2, 3-6 y 7-9): las columnas 3-6 no son del dron del centro de ninguna region
+    simulation = TrafficSimulation('drones', grid_size=10, num_cars=3, num_motorcycles=1, seed=1, num_police=2, num_drones=3)
+    left, right = simulation.police_units
+    assert [drone.region for drone in simulation.drones_for(left)] == [(0, 0, 2, 9), (3, 0, 6, 9)]
+    assert [drone.region for drone in simulation.drones_for(right)] == [(3, 0, 6, 9), (7, 0, 9, 9)]
+
+    for car in simulation.cars:
+        move_to(simulation, car, (3, 5))
+        car.speed = 5
+    motorcycle = simulation.motorcycles[0]
+    move_to(simulation, motorcycle, (6, 2))
+    motorcycle.speed = 5
+    motorcycle.collision = True
+    simulation.incidents.collision(motorcycle)
+
+    left.call_drone()
+    assert [car.speed for car in simulation.cars] == [4, 4, 4]
+    assert simulation.drones[1].congestions_resolved == 1
+
+    right.call_drone()
+    assert not motorcycle.collision
+    assert motorcycle.speed == 4
+    assert simulation.drones[1].collisions_resolved == 1
+    assert simulation.drones[2].collisions_resolved == 0
+
+
+def test_single_drone_covers_every_police_region():
+    simulation = TrafficSimulation('drones', grid_size=10, num_cars=2, num_motorcycles=0, seed=1, num_police=4)
+    for police in simulation.police_units:
+        assert simulation.drones_for(police) == [simulation.drone]
@@ -0,0 +1,59 @@
+from collections import Counter
+
+from core.sharded import ShardedSimulation
+
+
+def vehicles_by_key(simulation):
+    return {
+        (kind, vehicle.id): vehicle
+        for kind, vehicles in (('car', simulation.cars), ('motorcycle', simulation.motorcycles))
+        for vehicle in vehicles
+    }
+
+
+def test_sharded_counts_match_recount_of_vehicles():
+    # Cuadricula llena para que haya choques y congestion en la frontera entre los dos mosaicos
+    simulation = ShardedSimulation(
+        'sharded', grid_size=12, num_cars=60, num_motorcycles=30, shards=2, seed=3,
+        num_police=2, num_drones=3, congestion_threshold=2
+    )
+    reported = []
+    police_step = simulation._police_step
+
+    def record(index, police, collisions, congested_cells):
+        reported.append((index, dict(collisions), sorted(map(tuple, congested_cells))))
+        police_step(index, police, collisions, congested_cells)
+
+    simulation._police_step = record
+    try:
+        for _ in range(4):
+            before = {key: vehicle.movements for key, vehicle in vehicles_by_key(simulation).items()}
+            del reported[:]
+            results = simulation.step()
+            after = vehicles_by_key(simulation)
+            assert sorted(after) == sorted(before)
+            vehicles = list(after.values())
+
+            # Choques: dos o mas vehiculos en una celda en la que alguno se movio
+            counts = Counter(v.position for v in vehicles)
+            moved = Counter(vehicle.position for key, vehicle in after.items() if vehicle.movements > before[key])
+            collisions = Counter(
+                (simulation.police_regions.index(v.position), simulation.drone_regions.index(v.position))
+                for v in vehicles if counts[v.position] >= 2 and moved[v.position]
+            )
+            congested = sorted(cell for cell, count in counts.items() if count >= 2)
+
+            assert [index for index, _, _ in reported] == [0, 1]
+            assert all(dict(collisions) == pairs for _, pairs, _ in reported)
+            assert all(cells == congested for _, _, cells in reported)
+            assert sorted(map(tuple, results['congested_cells'])) == congested
+            assert sum(collisions.values()) > 0
+            # enforce resuelve todos los choques en el mismo paso
+            assert results['collisions_detected'] == 0
+            assert not any(v.collision for v in vehicles)
+    finally:
+        simulation.close()
+
+    state = simulation.get_state()
+    assert len(state['agents']['police_units']) == 2 and len(state['agents']['drones']) == 3
+    assert state['grid']['congestion_threshold'] == 2